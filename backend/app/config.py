@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 import os
 
 class Settings(BaseSettings):
@@ -14,12 +14,59 @@ class Settings(BaseSettings):
     
     # File Settings
     max_file_size_mb: int = 50
+    max_batch_files: int = 20
+    upload_chunk_size_kb: int = 1024
     upload_dir: str = "uploads"
     output_dir: str = "outputs"
     file_retention_hours: int = 1
+    # Evict least-recently-downloaded outputs when free disk space drops below this
+    disk_min_free_mb: int = 1024
+    expiry_sweep_interval_seconds: int = 60
+    orphan_sweep_hours: int = 24
+    # Resumable (tus) uploads: unfinished uploads are deleted this long after their last chunk
+    resumable_upload_expiry_hours: int = 24
+    # A PATCH holds a lease on its upload while it writes, renewed every third of this;
+    # a writer that died stops renewing and the next PATCH can take over
+    resumable_upload_lease_seconds: float = 60.0
+    
+    # Storage: files live in hash-sharded directories (ab/cd/name) under upload_dir
+    # and output_dir. With "s3" they are also kept in an S3-compatible bucket and
+    # the local directories only cache recently used files.
+    storage_backend: str = "local"  # local or s3
+    storage_s3_bucket: str = ""
+    storage_s3_prefix: str = ""  # e.g. "converter/" to share a bucket
+    storage_s3_endpoint_url: Optional[str] = None  # e.g. http://localhost:9000 for MinIO
+    storage_s3_region: Optional[str] = None
+    storage_s3_access_key: Optional[str] = None  # default: the usual AWS_* variables
+    storage_s3_secret_key: Optional[str] = None
+    storage_local_cache_hours: int = 6  # s3: local copies unused this long are removed
     
     # Rate Limiting
     rate_limit_per_minute: int = 10
+    rate_limit_burst: int = 0  # 0 = same as rate_limit_per_minute
+    # "sqlite" shares limits across worker processes; "memory" is per process
+    rate_limit_backend: str = "sqlite"
+    rate_limit_db_path: str = "ratelimit.db"
+    # sqlite: longest wait for another worker's lock before the request is let through unchecked
+    rate_limit_lock_timeout_ms: int = 250
+    # sqlite: threads reserved for limit checks (kept apart from the conversion pools)
+    rate_limit_threads: int = 2
+    rate_limit_max_keys: int = 100000
+    # Tokens spent per request, by longest matching "METHOD /path-prefix"
+    rate_limit_route_costs: Dict[str, float] = {
+        "POST /api/video": 5.0,
+        "POST /api/ai": 5.0,
+        "POST /api/audio": 2.0,
+        "POST /api/batch/convert": 5.0,
+        "POST /api/images/bulk": 5.0,
+        "POST /api/images/pdf": 5.0,
+        "GET /api/batch/status": 0.2,
+        "GET /api/conversions/": 0.2,
+        "GET /api/cache/stats": 0.2,
+        "GET /api/images/": 0.1,
+        "PATCH /api/uploads/": 0.1,
+        "HEAD /api/uploads/": 0.1
+    }
     
     # CORS Settings
     allowed_origins: List[str] = [
@@ -28,13 +75,157 @@ class Settings(BaseSettings):
         "http://127.0.0.1:8000"
     ]
     
-    # Database
+    # Database (SQLite, or postgresql://... for workers on several machines)
     database_url: str = "sqlite:///./conversions.db"
+    database_busy_timeout_seconds: float = 30.0  # SQLite: wait this long for another process's write lock
     
     # External Tools
     ffmpeg_path: str = "ffmpeg"
     tesseract_path: str = "tesseract"
     
+    # Conversion Execution
+    executor_enabled: bool = True
+    process_pool_start_method: str = "spawn"
+    process_pool_default_size: int = 2
+    process_pool_sizes: Dict[str, int] = {
+        "document": 2,
+        "image": 2,
+        "audio": 2,
+        "video": 1,
+        "archive": 1,
+        "code": 1,
+        "design": 1,
+        "database": 1,
+        "ai": 1
+    }
+    # Categories whose work mostly releases the GIL (hashing, encryption)
+    thread_pool_size: int = 4
+    thread_pool_categories: List[str] = ["security"]
+    # Modules imported ahead of first use, per pool category ("main" = API process)
+    warmup_modules: Dict[str, List[str]] = {}
+    
+    # Scratch space for intermediates: one directory per conversion, on tmpfs while
+    # the space reserved there fits the budget and on disk otherwise
+    scratch_tmpfs_dir: str = "/dev/shm"
+    scratch_tmpfs_budget_mb: int = 512  # 0 = always use disk
+    scratch_disk_dir: Optional[str] = None  # default: the system temp directory
+    # Space reserved per conversion: input size x multiplier
+    scratch_size_multipliers: Dict[str, float] = {
+        "archive": 8.0,  # extracted contents
+        "ai": 6.0,  # rendered pages
+        "video": 4.0,
+    }
+    scratch_size_multiplier_default: float = 2.0
+    
+    # Limits per conversion: a pool worker that runs past its timeout, or whose
+    # conversion is cancelled, is killed and its pool replaced
+    conversion_timeout_seconds: Dict[str, float] = {
+        "video": 3600.0,
+        "ai": 1800.0,
+        "audio": 900.0,
+    }
+    conversion_timeout_default_seconds: float = 600.0  # 0 = no limit
+    # Address space (RLIMIT_AS) of each pool worker, in MB; 0 = no limit (not enforced on Windows)
+    worker_memory_limits_mb: Dict[str, int] = {
+        "video": 8192,
+        "ai": 8192,
+    }
+    worker_memory_limit_default_mb: int = 4096
+    # How often running conversions check for cancel requests received by other processes
+    conversion_cancel_poll_seconds: float = 2.0
+    
+    # Image conversion: images placed on PDF pages are decoded at no more than this
+    # resolution at their printed size (0 = always decode in full)
+    image_pdf_dpi: int = 300
+    # TIFFs and PNGs with at least this many megapixels are converted to TIFF or PNG a band
+    # of rows at a time (needs tifffile for TIFF, pypng for PNG; 0 = never)
+    image_tiled_min_megapixels: int = 64
+    image_tile_size: int = 512  # rows per band, and the tile size of TIFF outputs (a multiple of 16)
+    # Renditions (GET /api/images/{id}/rendition): uploads are decoded to at most this
+    # size and kept in memory as mipmap chains; encoded renditions go in the result cache
+    image_rendition_max_dimension: int = 4096
+    image_rendition_default_quality: int = 80
+    image_rendition_max_age_seconds: int = 86400  # Cache-Control max-age
+    image_mipmap_cache_mb: int = 256  # per API process
+    # Bulk image conversion (POST /api/images/bulk): one request, many images, converted
+    # on a thread pool in the API process and streamed back as a zip
+    image_codec_threads: int = 0  # 0 = one per CPU
+    image_bulk_max_files: int = 5000
+    image_bulk_max_mb: int = 2048  # request body, and the contents of uploaded zips
+    image_bulk_in_flight: int = 0  # images converted at once per request; 0 = one per codec thread
+    # Multi-page PDFs from images (POST /api/images/pdf, same limits): pages prepared
+    # ahead of the one being written
+    image_pdf_prefetch_pages: int = 8
+    
+    # Admission Control (per API process)
+    admission_enabled: bool = True
+    # Conversions allowed to run at once, per category
+    category_concurrency: Dict[str, int] = {
+        "video": 1,
+        "audio": 2,
+        "ai": 1,
+        "document": 4,
+        "image": 8,
+        "archive": 2
+    }
+    category_concurrency_default: int = 4
+    # Combined working-memory estimate allowed in flight (input size x multiplier)
+    admission_memory_budget_mb: int = 2048
+    admission_memory_multipliers: Dict[str, float] = {
+        "image": 12.0,  # compressed pixels decode to raw bitmaps
+        "audio": 12.0,  # pydub holds decoded PCM in memory
+        "ai": 12.0,
+        "video": 3.0,
+        "document": 6.0
+    }
+    admission_memory_multiplier_default: float = 4.0
+    # Waiters per category before requests are refused immediately
+    admission_max_queue: int = 16
+    admission_queue_timeout_seconds: float = 10.0
+    
+    # Result Cache
+    result_cache_enabled: bool = True
+    result_cache_max_mb: int = 1024
+    result_cache_exclude_categories: List[str] = ["security"]
+    
+    # Single-flight: concurrent identical conversions (same input, target and
+    # parameters) run once and every request receives the output, across processes
+    single_flight_enabled: bool = True
+    single_flight_exclude_categories: List[str] = ["security"]
+    single_flight_lease_seconds: float = 60.0
+    single_flight_heartbeat_seconds: float = 15.0
+    single_flight_poll_seconds: float = 1.0  # how often waiters in other processes check the leader
+    single_flight_linger_seconds: float = 30.0  # finished results stay joinable this long
+    
+    # Background Job Queue
+    job_workers: int = 4
+    job_poll_interval_seconds: float = 2.0
+    # Run job workers inside the API; turn off when they run separately (python -m app.worker)
+    job_workers_in_api: bool = True
+    # Running jobs hold a lease renewed every job_heartbeat_seconds; when a worker
+    # dies the lease runs out and the job is re-queued, up to job_max_attempts runs
+    job_lease_seconds: float = 60.0
+    job_heartbeat_seconds: float = 15.0
+    job_max_attempts: int = 3
+    # Jobs estimated to take longer than this go to the long lane
+    job_short_lane_max_seconds: float = 10.0
+    # Workers (out of job_workers) that serve the long lane; they take short jobs when it is empty
+    job_long_lane_workers: int = 1
+    # Priority classes (lower runs first) and the class of each API key (X-API-Key header)
+    job_priority_classes: Dict[str, int] = {"high": 0, "standard": 1, "low": 2}
+    job_default_priority_class: str = "standard"
+    api_key_priority_classes: Dict[str, str] = {}
+    
+    # Cost model (job duration estimates fitted to recorded conversion timings)
+    cost_model_max_samples: int = 20000
+    cost_model_refit_seconds: int = 300
+    # Used for conversions with too little history: base + per_mb * input size
+    cost_model_default_seconds: float = 2.0
+    cost_model_default_seconds_per_mb: float = 0.5
+    
+    # Progress streams (Server-Sent Events)
+    progress_heartbeat_seconds: float = 15.0  # keep-alive and database re-check interval
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -43,6 +234,10 @@ class Settings(BaseSettings):
     def max_file_size_bytes(self) -> int:
         return self.max_file_size_mb * 1024 * 1024
 
+    @property
+    def result_cache_dir(self) -> str:
+        return os.path.join(self.output_dir, ".cache")
+
 settings = Settings()
 
 # Ensure directories exist
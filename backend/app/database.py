@@ -1,15 +1,27 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, BigInteger, Boolean, String, DateTime, Float, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import datetime, timedelta
 from app.config import settings
 
 # Create engine
 engine = create_engine(
     settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
+    connect_args={
+        "check_same_thread": False,
+        "timeout": settings.database_busy_timeout_seconds
+    } if "sqlite" in settings.database_url else {},
+    pool_pre_ping="sqlite" not in settings.database_url
 )
 
+if "sqlite" in settings.database_url:
+    @event.listens_for(engine, "connect")
+    def _enable_wal(dbapi_connection, connection_record):
+        # Lets the API and standalone workers read while one of them writes
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
 # Create session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -29,9 +41,119 @@ class Conversion(Base):
     completed_at = Column(DateTime, nullable=True)
     ip_address = Column(String, nullable=True)
     error_message = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True, index=True)  # SHA-256 of the upload
+    detected_format = Column(String, nullable=True)  # format sniffed from magic bytes
+    output_path = Column(String, nullable=True)
+    expires_at = Column(DateTime, nullable=True, index=True)  # files and row are deleted after this
+    last_downloaded_at = Column(DateTime, nullable=True)
+    cancel_requested_at = Column(DateTime, nullable=True)  # set by DELETE /run when another process runs it
+
+def get_expiry(start: datetime = None) -> datetime:
+    """Expiry time for an artifact created (or refreshed) at ``start``"""
+    return (start or datetime.utcnow()) + timedelta(hours=settings.file_retention_hours)
+
+class ConversionJob(Base):
+    __tablename__ = "conversion_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    conversion_id = Column(Integer, ForeignKey("conversions.id"), index=True)
+    category = Column(String)
+    target_format = Column(String)
+    status = Column(String, index=True)  # queued, running, completed, failed
+    priority = Column(Integer, default=1)  # lower runs first, see settings.job_priority_classes
+    lane = Column(String, default="short", index=True)  # "short" or "long", from estimated_seconds
+    estimated_seconds = Column(Float, nullable=True)
+    attempts = Column(Integer, default=0)
+    worker_id = Column(String, nullable=True)  # "{host}-{pid}-{nonce}-{n}" of the claiming worker
+    lease_expires_at = Column(DateTime, nullable=True, index=True)  # running jobs are re-queued after this
+    heartbeat_at = Column(DateTime, nullable=True)
+    output_filename = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    error_message = Column(String, nullable=True)
+
+class ConversionTiming(Base):
+    """Measured conversion times, used to fit the scheduler's cost model"""
+    __tablename__ = "conversion_timings"
+    
+    id = Column(Integer, primary_key=True)
+    category = Column(String)
+    pair = Column(String, index=True)  # "{source}_to_{target}"
+    input_mb = Column(Float)
+    seconds = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class UploadSession(Base):
+    """A resumable (tus) upload; its Conversion row is created once every byte has arrived"""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True)  # random token, part of the upload URL
+    original_filename = Column(String, nullable=True)
+    filename = Column(String)  # unique name, stored in its upload_dir shard (with ".part" until complete)
+    upload_length = Column(BigInteger)  # declared total size in bytes
+    offset = Column(BigInteger, default=0)  # bytes received so far
+    target_format = Column(String, nullable=True)
+    is_partial = Column(Boolean, default=False)  # one part of a parallel upload, concatenated later
+    status = Column(String, default="uploading")  # uploading, completed
+    conversion_id = Column(Integer, nullable=True)
+    ip_address = Column(String, nullable=True)
+    lease_owner = Column(String, nullable=True)  # token of the PATCH writing a chunk
+    lease_expires_at = Column(DateTime, nullable=True)  # another PATCH may claim the upload after this
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=True, index=True)
+
+class CacheEntry(Base):
+    __tablename__ = "cache_entries"
+    
+    key = Column(String, primary_key=True)  # SHA-256 of input hash + target + params + version
+    path = Column(String)
+    size_bytes = Column(BigInteger)  # outputs can pass 2 GB (PostgreSQL INTEGER is 32-bit)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class InflightConversion(Base):
+    """A conversion being run on behalf of every concurrent request for the same input and parameters"""
+    __tablename__ = "inflight_conversions"
+    
+    key = Column(String, primary_key=True)  # same key as the result cache
+    owner = Column(String)  # "{host}-{pid}-{nonce}" of the request running it
+    status = Column(String, default="running")  # running, completed, failed
+    result_path = Column(String, nullable=True)
+    error_message = Column(String, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    lease_expires_at = Column(DateTime, index=True)  # a waiter takes over if the owner stops renewing
+    finished_at = Column(DateTime, nullable=True)
+
+def add_missing_columns():
+    """
+    Add columns (and their indexes) introduced after a table was first created (create_all never alters tables).
+    
+    On PostgreSQL, INTEGER columns since declared BigInteger are widened
+    too; SQLite's INTEGER is 64-bit already.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                column_type = column.type.compile(dialect=engine.dialect)
+                if column.name not in existing:
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                elif (engine.dialect.name == "postgresql" and isinstance(column.type, BigInteger)
+                      and not isinstance(existing[column.name], BigInteger)):
+                    connection.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE {column_type}"))
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns()
 
 # Dependency
 def get_db():
@@ -1,5 +1,8 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
@@ -7,13 +10,29 @@ from datetime import datetime
 import os
 
 from app.config import settings
-from app.database import get_db, Conversion, Base, engine
+from app.database import get_db, Conversion, ConversionJob, Base, engine, get_expiry, SessionLocal
 from app.models import ConversionResponse, ConversionStatus, ErrorResponse
 from app.utils.file_handler import FileHandler
 from app.utils.validators import FileValidator
-from app.utils.cleanup import schedule_cleanup
+from app.utils.sniffer import resolve_format
+from app.utils.cleanup import ExpiryScheduler, schedule_cleanup
+from app.utils.executor import ConversionExecutor
+from app.utils.job_queue import JobQueue, schedule_job_workers, stop_job_workers
+from app.utils.result_cache import ResultCache
+from app.utils.storage import Storage
+from app.utils.scratch import ScratchSpace
+from app.utils.admission import AdmissionController
+from app.utils.cost_model import CostModel
 from app.middleware.rate_limiter import RateLimitMiddleware
-from app.routers import documents, images, audio, video, archives, code, design, database_conv, security, ai_powered, batch
+from app.middleware.upload_limit import UploadLimitMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.utils.lazy_import import LazyImporter
+from app.utils.metrics import REGISTRY, JOB_QUEUE_DEPTH, CACHE_LOOKUPS, SCRATCH_RESERVED
+from app.utils.progress import ProgressHub, watch_conversion_status
+from app.routers import documents, images, audio, video, archives, code, design, database_conv, security, ai_powered, batch, convert, progress, uploads
+
+# Time spent importing the app itself (converter libraries load lazily on first use)
+APP_IMPORT_SECONDS = time.perf_counter() - _import_started
 
 # Create tables
 Base.metadata.create_all(bind=engine)
@@ -34,11 +53,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read rate-limit, admission and resumable upload headers
+    expose_headers=[
+        "Retry-After", "Location", "Tus-Resumable", "Upload-Offset", "Upload-Length",
+        "Upload-Expires", "Upload-Conversion-Id"
+    ],
 )
 
+# Reject oversized uploads before the body is read (added first so it sits
+# inside the rate limiter and sees the raw receive channel)
+app.add_middleware(UploadLimitMiddleware)
+
 # Add rate limiting middleware
 app.add_middleware(RateLimitMiddleware)
 
+# Outermost, so rate-limited and rejected requests are counted too
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(documents.router)
 app.include_router(images.router)
@@ -51,15 +82,39 @@ app.include_router(database_conv.router)
 app.include_router(security.router)
 app.include_router(ai_powered.router)
 app.include_router(batch.router)
+app.include_router(convert.router)
+app.include_router(progress.router)
+app.include_router(uploads.router)
+
+# Push conversion status changes to progress streams
+watch_conversion_status(SessionLocal, Conversion)
 
 # Schedule cleanup task on startup
 @app.on_event("startup")
 async def startup_event():
+    ProgressHub.start()
+    removed = ScratchSpace.sweep()
+    if removed:
+        print(f"Removed {removed} scratch directories left by stopped workers")
     schedule_cleanup()
+    if settings.job_workers_in_api:
+        schedule_job_workers()
     print(f"[STARTED] {settings.app_name} v{settings.app_version}")
     print(f"Upload directory: {settings.upload_dir}")
     print(f"Output directory: {settings.output_dir}")
+    print(f"Storage backend: {settings.storage_backend}")
     print(f"Max file size: {settings.max_file_size_mb}MB")
+    print(f"Job workers: {settings.job_workers if settings.job_workers_in_api else 0}")
+    
+    warmed = LazyImporter.warmup(settings.warmup_modules.get("main", []))
+    print(f"App imported in {APP_IMPORT_SECONDS * 1000:.0f} ms")
+    for name, seconds in warmed.items():
+        print(f"  warmed {name}: {seconds * 1000:.0f} ms")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_job_workers()
+    ConversionExecutor.shutdown()
 
 @app.get("/")
 async def root():
@@ -91,23 +146,21 @@ async def upload_file(
     - **target_format**: Target format for conversion (optional, can be specified later)
     """
     try:
-        # Save uploaded file
-        file_path = await FileHandler.save_upload_file(file)
-        
-        # Validate file size
-        FileHandler.validate_file_size(file_path)
+        # Stream uploaded file to disk (size limit enforced while streaming)
+        saved = await FileHandler.save_upload_file(file)
+        file_path = saved.path
         
         # Get file info
-        source_format = FileHandler.get_file_extension(file.filename)
-        file_size_mb = FileHandler.get_file_size_mb(file_path)
+        file_size_mb = saved.size_bytes / (1024 * 1024)
         
-        # Validate source format
-        if not FileValidator.is_format_supported(source_format):
+        # Route by what the content is, not what the name says; reject junk
+        try:
+            source_format = resolve_format(FileHandler.get_file_extension(file.filename), saved.detected_format)
+        except HTTPException:
             FileHandler.delete_file(file_path)
-            raise HTTPException(
-                status_code=400,
-                detail=f"Unsupported source format: {source_format}"
-            )
+            raise
+        file_path = FileHandler.match_extension(file_path, source_format)
+        await Storage.persist(file_path)
         
         # Create conversion record
         conversion = Conversion(
@@ -116,11 +169,15 @@ async def upload_file(
             target_format=target_format or "",
             file_size=file_size_mb,
             status="uploaded",
-            ip_address=request.client.host if request else None
+            ip_address=request.client.host if request and request.client else None,
+            content_hash=saved.content_hash,
+            detected_format=saved.detected_format,
+            expires_at=get_expiry()
         )
         db.add(conversion)
         db.commit()
         db.refresh(conversion)
+        ExpiryScheduler.schedule(conversion.id, conversion.expires_at)
         
         return conversion
         
@@ -137,7 +194,16 @@ async def get_conversion(conversion_id: int, db: Session = Depends(get_db)):
     if not conversion:
         raise HTTPException(status_code=404, detail="Conversion not found")
     
-    return conversion
+    response = ConversionResponse.model_validate(conversion)
+    if conversion.status in ("queued", "processing"):
+        job = db.query(ConversionJob).filter(
+            ConversionJob.conversion_id == conversion.id
+        ).order_by(ConversionJob.id.desc()).first()
+        if job is not None:
+            response.estimated_seconds = job.estimated_seconds
+            response.eta_seconds = JobQueue.estimate_eta(db, job)
+    
+    return response
 
 @app.get("/api/conversions")
 async def list_conversions(
@@ -160,6 +226,11 @@ async def download_file(conversion_id: int, db: Session = Depends(get_db)):
     if not conversion:
         raise HTTPException(status_code=404, detail="Conversion not found")
     
+    if conversion.status == "evicted":
+        raise HTTPException(
+            status_code=410,
+            detail="Converted file was removed to free disk space; convert the upload again"
+        )
     if conversion.status != "completed":
         raise HTTPException(
             status_code=400,
@@ -167,19 +238,21 @@ async def download_file(conversion_id: int, db: Session = Depends(get_db)):
         )
     
     # Build output file path
-    output_filename = FileHandler.get_output_filename(
-        conversion.filename,
-        conversion.target_format
-    )
-    output_path = os.path.join(settings.output_dir, output_filename)
+    output_path = await Storage.fetch(conversion.output_path or Storage.output_path(
+        FileHandler.get_output_filename(conversion.filename, conversion.target_format)
+    ))
     
     if not os.path.exists(output_path):
         raise HTTPException(status_code=404, detail="Converted file not found")
     
+    # Recently downloaded outputs are evicted last under disk pressure
+    conversion.last_downloaded_at = datetime.utcnow()
+    db.commit()
+    
     return FileResponse(
         output_path,
         media_type="application/octet-stream",
-        filename=output_filename
+        filename=os.path.basename(output_path)
     )
 
 @app.get("/api/formats")
@@ -187,6 +260,49 @@ async def get_supported_formats():
     """Get all supported file formats"""
     return FileValidator.get_all_supported_formats()
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Get conversion result cache statistics"""
+    return ResultCache.get_stats()
+
+@app.get("/api/admission/stats")
+async def get_admission_stats():
+    """Get running and queued conversions per category against their limits"""
+    return AdmissionController.get_stats()
+
+@app.get("/api/cost-model")
+async def get_cost_model():
+    """Get the fitted conversion time model used to schedule background jobs"""
+    return {
+        "short_lane_max_seconds": settings.job_short_lane_max_seconds,
+        "fits": CostModel.describe()
+    }
+
+@app.get("/api/imports")
+async def get_import_report():
+    """Get import costs for this API process (to tune worker boot and warm-up lists)"""
+    return {
+        "app_import_ms": round(APP_IMPORT_SECONDS * 1000, 1),
+        "modules": LazyImporter.get_report()
+    }
+
+def _job_queue_depth():
+    db = SessionLocal()
+    try:
+        return {(status,): count for status, count in JobQueue.count_by_status(db).items()}
+    finally:
+        db.close()
+
+JOB_QUEUE_DEPTH.set_function(_job_queue_depth)
+CACHE_LOOKUPS.set_function(lambda: {("hit",): ResultCache.hits, ("miss",): ResultCache.misses})
+SCRATCH_RESERVED.set_function(ScratchSpace.get_stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus text-format metrics for this API process"""
+    body = await ConversionExecutor.run_in_thread(REGISTRY.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 @app.delete("/api/conversions/{conversion_id}")
 async def delete_conversion(conversion_id: int, db: Session = Depends(get_db)):
     """Delete a conversion and its files"""
@@ -195,24 +311,36 @@ async def delete_conversion(conversion_id: int, db: Session = Depends(get_db)):
     if not conversion:
         raise HTTPException(status_code=404, detail="Conversion not found")
     
-    # Delete files
-    input_path = os.path.join(settings.upload_dir, conversion.filename)
-    FileHandler.delete_file(input_path)
-    
-    if conversion.target_format:
-        output_filename = FileHandler.get_output_filename(
-            conversion.filename,
-            conversion.target_format
-        )
-        output_path = os.path.join(settings.output_dir, output_filename)
-        FileHandler.delete_file(output_path)
-    
-    # Delete database record
-    db.delete(conversion)
+    # Delete files and database records
+    ExpiryScheduler.delete_conversion(db, conversion)
     db.commit()
     
     return {"message": "Conversion deleted successfully"}
 
+@app.delete("/api/conversions/{conversion_id}/run")
+async def cancel_conversion(conversion_id: int, db: Session = Depends(get_db)):
+    """
+    Stop a queued or running conversion.
+    
+    If it runs in this process, its pool worker is killed and its scratch
+    space freed right away; a queued job is taken off the queue. A
+    conversion running in another process is flagged and stopped there
+    within conversion_cancel_poll_seconds (202 Accepted).
+    """
+    conversion = db.query(Conversion).filter(Conversion.id == conversion_id).first()
+    
+    if not conversion:
+        raise HTTPException(status_code=404, detail="Conversion not found")
+    if conversion.status not in ("queued", "processing"):
+        raise HTTPException(status_code=409, detail=f"Conversion is not running (status: {conversion.status})")
+    
+    if ConversionExecutor.cancel(conversion_id) or JobQueue.cancel_queued(db, conversion_id):
+        return {"id": conversion_id, "status": "cancelled"}
+    
+    conversion.cancel_requested_at = datetime.utcnow()
+    db.commit()
+    return JSONResponse(status_code=202, content={"id": conversion_id, "status": "cancelling"})
+
 # Mount static files for frontend
 import os
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "..", "frontend")
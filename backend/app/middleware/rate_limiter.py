@@ -1,44 +1,219 @@
-from fastapi import Request, HTTPException
+from fastapi import Request
+from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
-from collections import defaultdict
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+import asyncio
+import functools
+import math
+import os
+import sqlite3
+import threading
 import time
 from app.config import settings
+from app.utils.metrics import RATE_LIMIT_REJECTIONS
+
+# Paths that are never rate limited
+EXEMPT_PATHS = {"/health", "/", "/docs", "/openapi.json", "/metrics"}
+
+class MemoryRateLimitBackend:
+    """
+    Per-process store of GCRA theoretical arrival times.
+    
+    Keys are kept in least-recently-updated order, so idle keys collect at
+    the front and are evicted in O(1) once their bucket has refilled.
+    """
+    
+    # Checks are cheap enough to run on the event loop
+    blocking = False
+    
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def update(self, key: str, now: float, increment: float, tolerance: float) -> Tuple[bool, float]:
+        with self._lock:
+            tat = max(self._tats.get(key, now), now)
+            new_tat = tat + increment
+            allowed = new_tat - now <= tolerance
+            if allowed:
+                self._tats[key] = new_tat
+                self._tats.move_to_end(key)
+            self._evict(now)
+            return allowed, new_tat if allowed else tat
+    
+    def _evict(self, now: float) -> None:
+        while self._tats:
+            key, tat = next(iter(self._tats.items()))
+            if tat > now and len(self._tats) <= self.max_keys:
+                break
+            self._tats.popitem(last=False)
+
+class SQLiteRateLimitBackend:
+    """
+    GCRA store shared by every worker process through a small SQLite file.
+    
+    Each check is a single-row read and upsert inside an IMMEDIATE
+    transaction, so concurrent workers serialize on the row and the limit
+    holds no matter how many processes serve requests. Checks block, so
+    they run off the event loop on the backend's own small thread pool (a
+    busy conversion pool must not delay them); a check that cannot get the
+    lock within ``lock_timeout`` seconds lets the request through (fails
+    open) rather than holding it up.
+    """
+    
+    # Delete refilled buckets every this many checks
+    SWEEP_EVERY = 1000
+    # Checks wait on a file lock, so they run in a thread
+    blocking = True
+    
+    def __init__(self, path: str, lock_timeout: float = 5.0, threads: int = 2):
+        self.path = path
+        self.lock_timeout = lock_timeout
+        self.threads = max(1, threads)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._checks = 0
+        
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limits_tat ON rate_limits (tat)")
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.lock_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def get_executor(self) -> ThreadPoolExecutor:
+        """Get the thread pool that runs this backend's checks"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="ratelimit")
+        return self._executor
+    
+    def update(self, key: str, now: float, increment: float, tolerance: float) -> Tuple[bool, float]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            # Locked by another worker for too long: allow rather than stall the request
+            print(f"Rate limit check skipped: {e}")
+            return True, now
+        try:
+            row = conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            tat = max(row[0], now) if row else now
+            new_tat = tat + increment
+            allowed = new_tat - now <= tolerance
+            if allowed:
+                conn.execute(
+                    "INSERT INTO rate_limits (key, tat) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tat = excluded.tat",
+                    (key, new_tat)
+                )
+            
+            self._checks += 1
+            if self._checks % self.SWEEP_EVERY == 0:
+                conn.execute("DELETE FROM rate_limits WHERE tat <= ?", (now,))
+            
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, new_tat if allowed else tat
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Rate limiting middleware to prevent abuse"""
+    """
+    Rate limiting middleware to prevent abuse.
     
-    def __init__(self, app, rate_limit: int = None):
+    Uses the generic cell rate algorithm (a token bucket that stores one
+    timestamp per client): each client earns ``rate_limit`` tokens per
+    minute up to ``rate_limit_burst``, and each request spends the cost of
+    its route from ``rate_limit_route_costs``.
+    """
+    
+    def __init__(self, app, rate_limit: int = None, backend=None):
         super().__init__(app)
         self.rate_limit = rate_limit or settings.rate_limit_per_minute
-        self.requests = defaultdict(list)
+        self.burst = settings.rate_limit_burst or self.rate_limit
+        self.emission_interval = 60.0 / self.rate_limit
+        self.tolerance = self.emission_interval * self.burst
+        self.backend = backend or self.create_backend()
     
-    async def dispatch(self, request: Request, call_next):
-        # Get client IP
-        client_ip = request.client.host
+    @staticmethod
+    def create_backend():
+        if settings.rate_limit_backend == "sqlite":
+            directory = os.path.dirname(settings.rate_limit_db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            return SQLiteRateLimitBackend(
+                settings.rate_limit_db_path,
+                settings.rate_limit_lock_timeout_ms / 1000,
+                settings.rate_limit_threads
+            )
+        return MemoryRateLimitBackend(settings.rate_limit_max_keys)
+    
+    @staticmethod
+    def get_cost(method: str, path: str) -> float:
+        """Cost of a request: the longest matching "METHOD /prefix" rule, or 1"""
+        route = f"{method} {path}"
+        best_prefix, cost = "", 1.0
+        for prefix, prefix_cost in settings.rate_limit_route_costs.items():
+            if route.startswith(prefix) and len(prefix) > len(best_prefix):
+                best_prefix, cost = prefix, prefix_cost
+        return cost
+    
+    def check(self, key: str, cost: float, now: Optional[float] = None) -> Tuple[bool, int, float]:
+        """
+        Spend ``cost`` tokens for a client.
         
+        Returns:
+            (allowed, remaining tokens, seconds until the request would be allowed)
+        """
+        now = time.time() if now is None else now
+        increment = self.emission_interval * cost
+        allowed, tat = self.backend.update(key, now, increment, self.tolerance)
+        
+        remaining = max(0, int((self.tolerance - (tat - now)) / self.emission_interval))
+        retry_after = 0.0 if allowed else tat + increment - self.tolerance - now
+        return allowed, remaining, retry_after
+    
+    async def dispatch(self, request: Request, call_next):
         # Skip rate limiting for health checks
-        if request.url.path in ["/health", "/", "/docs", "/openapi.json"]:
+        if request.url.path in EXEMPT_PATHS:
             return await call_next(request)
         
-        # Get current timestamp
-        current_time = time.time()
+        # Get client IP (absent for some ASGI servers and test clients)
+        client_ip = request.client.host if request.client else "unknown"
         
-        # Clean old requests (older than 1 minute)
-        self.requests[client_ip] = [
-            req_time for req_time in self.requests[client_ip]
-            if current_time - req_time < 60
-        ]
+        cost = self.get_cost(request.method, request.url.path)
+        if self.backend.blocking:
+            loop = asyncio.get_running_loop()
+            allowed, remaining, retry_after = await loop.run_in_executor(
+                self.backend.get_executor(), functools.partial(self.check, client_ip, cost)
+            )
+        else:
+            allowed, remaining, retry_after = self.check(client_ip, cost)
+        
+        headers = {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(remaining)
+        }
         
-        # Check rate limit
-        if len(self.requests[client_ip]) >= self.rate_limit:
-            raise HTTPException(
+        if not allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+            RATE_LIMIT_REJECTIONS.inc(prefix="/".join(request.url.path.split("/")[:3]))
+            return JSONResponse(
                 status_code=429,
-                detail=f"Rate limit exceeded. Maximum {self.rate_limit} requests per minute."
+                content={"detail": f"Rate limit exceeded. Maximum {self.rate_limit} requests per minute."},
+                headers=headers
             )
         
-        # Add current request
-        self.requests[client_ip].append(current_time)
-        
         # Process request
         response = await call_next(request)
+        response.headers.update(headers)
         return response
@@ -0,0 +1,66 @@
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.config import settings
+
+# Allowance for multipart boundaries and part headers on top of the file bytes
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+class UploadLimitMiddleware:
+    """
+    Reject oversized request bodies before they are spooled to disk.
+    
+    Requests that declare a Content-Length over the limit get a 413 without
+    reading the body; bodies without a declared length are counted as they
+    stream in and aborted as soon as the limit is crossed.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    @staticmethod
+    def get_limit(path: str) -> int:
+        """Maximum body size for a request path"""
+        if path.startswith(("/api/images/bulk", "/api/images/pdf")):
+            return settings.image_bulk_max_mb * 1024 * 1024
+        files = settings.max_batch_files if path.startswith("/api/batch") else 1
+        return settings.max_file_size_bytes * files + MULTIPART_OVERHEAD_BYTES * files
+    
+    @staticmethod
+    def describe_limit(path: str) -> str:
+        """The limit of ``get_limit``, as told to clients"""
+        if path.startswith(("/api/images/bulk", "/api/images/pdf")):
+            return f"{settings.image_bulk_max_mb}MB per request"
+        if path.startswith("/api/batch"):
+            return f"{settings.max_file_size_mb}MB per file, {settings.max_batch_files} files"
+        return f"{settings.max_file_size_mb}MB per file"
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+        
+        limit = self.get_limit(scope["path"])
+        detail = f"Request body exceeds maximum allowed size ({self.describe_limit(scope['path'])})"
+        
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(
+                status_code=413,
+                content={"detail": detail}
+            )
+            await response(scope, receive, send)
+            return
+        
+        received = 0
+        
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+        
+        await self.app(scope, limited_receive, send)
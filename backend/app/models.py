@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class ConversionRequest(BaseModel):
@@ -17,6 +17,10 @@ class ConversionResponse(BaseModel):
     completed_at: Optional[datetime] = None
     download_url: Optional[str] = None
     error_message: Optional[str] = None
+    plan: Optional[List[str]] = None
+    expires_at: Optional[datetime] = None
+    estimated_seconds: Optional[float] = None  # predicted run time of a queued conversion
+    eta_seconds: Optional[float] = None  # predicted time until a queued conversion finishes
 
     class Config:
         from_attributes = True
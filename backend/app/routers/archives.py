@@ -1,14 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Form
 from sqlalchemy.orm import Session
-from app.database import get_db, Conversion
+from app.database import get_db, Conversion, get_expiry
 from app.services.archive_converter import ArchiveConverter
+from app.utils.executor import ConversionExecutor, ConversionCancelled, ConversionTimeout, conversion_stopped
+from app.utils.storage import Storage
+from app.utils.admission import admission
 from app.models import ConversionResponse
 import os
 from datetime import datetime
 
 router = APIRouter(prefix="/api/archives", tags=["archives"])
 
-@router.post("/convert/{conversion_id}", response_model=ConversionResponse)
+@router.post("/convert/{conversion_id}", response_model=ConversionResponse, dependencies=[Depends(admission("archive"))])
 async def convert_archive(
     conversion_id: int,
     target_format: str = Form(...),
@@ -35,29 +38,31 @@ async def convert_archive(
         db.commit()
         
         # Build input path from filename
-        from app.config import settings
-        input_path = os.path.join(settings.upload_dir, conversion.filename)
+        input_path = await Storage.fetch_upload(conversion.filename)
         
         if not os.path.exists(input_path):
             raise HTTPException(status_code=404, detail="Input file not found")
         
         base_name = os.path.splitext(os.path.basename(input_path))[0]
         output_filename = f"{base_name}_converted.{target_format.lower()}"
-        output_dir = os.path.dirname(input_path).replace('uploads', 'outputs')
-        os.makedirs(output_dir, exist_ok=True)
-        output_path = os.path.join(output_dir, output_filename)
+        output_path = Storage.output_path(output_filename)
         
-        result_path = await ArchiveConverter.convert(
+        result_path = await ConversionExecutor.convert(
+            "archive",
+            ArchiveConverter,
             input_path=input_path,
             output_path=output_path,
             source_format=conversion.source_format,
-            target_format=target_format
+            target_format=target_format,
+            content_hash=conversion.content_hash,
+            progress_key=conversion.id
         )
         
         conversion.output_path = result_path
         conversion.target_format = target_format
         conversion.status = "completed"
         conversion.completed_at = datetime.utcnow()
+        conversion.expires_at = get_expiry(conversion.completed_at)
         db.commit()
         
         return {
@@ -73,6 +78,8 @@ async def convert_archive(
             "error_message": None
         }
         
+    except (ConversionTimeout, ConversionCancelled) as e:
+        raise conversion_stopped(db, conversion, e)
     except NotImplementedError as e:
         conversion.status = "failed"
         conversion.error_message = str(e)
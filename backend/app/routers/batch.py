@@ -1,9 +1,15 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, Request, Header
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db, Conversion
+from typing import List, Optional
+from app.config import settings
+from app.database import get_db, Conversion, ConversionJob, get_expiry
+from app.utils.cleanup import ExpiryScheduler
 from app.utils.file_handler import FileHandler
+from app.utils.storage import Storage
 from app.utils.validators import FileValidator
+from app.utils.sniffer import resolve_format
+from app.utils.job_queue import JobQueue
+from app.services.registry import registry
 from app.models import ConversionResponse
 from datetime import datetime
 import zipfile
@@ -15,6 +21,7 @@ router = APIRouter(prefix="/api/batch", tags=["batch"])
 @router.post("/upload")
 async def batch_upload(
     files: List[UploadFile] = File(...),
+    request: Request = None,
     db: Session = Depends(get_db)
 ):
     """
@@ -23,34 +30,53 @@ async def batch_upload(
     Returns list of conversion IDs for each uploaded file.
     """
     
-    if len(files) > 20:
+    if len(files) > settings.max_batch_files:
         raise HTTPException(
             status_code=400, 
-            detail="Maximum 20 files allowed per batch"
+            detail=f"Maximum {settings.max_batch_files} files allowed per batch"
         )
     
     results = []
     
     for file in files:
         try:
-            # Validate file
-            FileValidator.validate_file(file)
+            # Validate format
+            file_format = FileHandler.get_file_extension(file.filename)
+            if not FileValidator.is_format_supported(file_format):
+                raise ValueError(f"Unsupported source format: {file_format}")
             
-            # Save file
-            saved_path, file_format = await FileHandler.save_upload(file)
+            # Stream file to disk
+            try:
+                saved = await FileHandler.save_upload_file(file)
+            except HTTPException as e:
+                raise ValueError(e.detail)
+            
+            # Route by the sniffed content; reject junk
+            try:
+                file_format = resolve_format(file_format, saved.detected_format)
+            except HTTPException as e:
+                FileHandler.delete_file(saved.path)
+                raise ValueError(e.detail)
+            saved = saved._replace(path=FileHandler.match_extension(saved.path, file_format))
+            await Storage.persist(saved.path)
             
             # Create conversion record
             conversion = Conversion(
+                filename=os.path.basename(saved.path),
                 source_format=file_format,
-                original_filename=file.filename,
-                input_path=saved_path,
+                target_format="",
+                file_size=saved.size_bytes / (1024 * 1024),
                 status="uploaded",
-                uploaded_at=datetime.utcnow()
+                ip_address=request.client.host if request and request.client else None,
+                content_hash=saved.content_hash,
+                detected_format=saved.detected_format,
+                expires_at=get_expiry()
             )
             
             db.add(conversion)
             db.commit()
             db.refresh(conversion)
+            ExpiryScheduler.schedule(conversion.id, conversion.expires_at)
             
             results.append({
                 "id": conversion.id,
@@ -77,22 +103,26 @@ async def batch_upload(
 async def batch_convert(
     conversion_ids: List[int],
     target_format: str,
+    x_api_key: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
     Convert multiple files to the same target format.
     
-    This endpoint triggers conversions but returns immediately.
-    Use /batch/status to check progress.
+    This endpoint queues conversions for the background workers and
+    returns immediately. Use /batch/status to check progress. Jobs are
+    scheduled by the priority class of the X-API-Key header, if any.
     """
     
-    if len(conversion_ids) > 20:
+    if len(conversion_ids) > settings.max_batch_files:
         raise HTTPException(
             status_code=400,
-            detail="Maximum 20 conversions per batch"
+            detail=f"Maximum {settings.max_batch_files} conversions per batch"
         )
     
     results = []
+    queued_jobs = []
+    priority = JobQueue.get_priority(x_api_key)
     
     for conv_id in conversion_ids:
         conversion = db.query(Conversion).filter(Conversion.id == conv_id).first()
@@ -105,19 +135,48 @@ async def batch_convert(
             })
             continue
         
-        # Update target format
-        conversion.target_format = target_format
-        conversion.status = "queued"
-        db.commit()
+        if conversion.status in ("queued", "processing"):
+            results.append({
+                "id": conv_id,
+                "status": "error",
+                "error": f"Conversion is already {conversion.status}"
+            })
+            continue
+        
+        plan = registry.plan(conversion.source_format, target_format)
+        if plan is None:
+            results.append({
+                "id": conv_id,
+                "status": "error",
+                "error": f"Conversion from {conversion.source_format} to {target_format} is not supported"
+            })
+            continue
+        
+        # Queue for the background workers
+        job = JobQueue.enqueue(db, conversion, plan.category, target_format, priority)
+        queued_jobs.append(job)
         
         results.append({
             "id": conv_id,
-            "filename": conversion.original_filename,
+            "job_id": job.id,
+            "filename": conversion.filename,
             "status": "queued",
             "source_format": conversion.source_format,
-            "target_format": target_format
+            "target_format": target_format,
+            "plan": plan.describe(),
+            "lane": job.lane,
+            "estimated_seconds": round(job.estimated_seconds, 2)
         })
     
+    # ETAs once the whole batch is queued, since its jobs wait on each other
+    etas = {job.id: JobQueue.estimate_eta(db, job) for job in queued_jobs}
+    for result in results:
+        if "job_id" in result:
+            eta = etas.get(result["job_id"])
+            result["eta_seconds"] = round(eta, 2) if eta is not None else None
+    
+    JobQueue.notify()
+    
     return {
         "total": len(conversion_ids),
         "queued": len([r for r in results if r.get("status") == "queued"]),
@@ -127,7 +186,7 @@ async def batch_convert(
 
 @router.get("/status")
 async def batch_status(
-    conversion_ids: List[int],
+    conversion_ids: List[int] = Query(...),
     db: Session = Depends(get_db)
 ):
     """
@@ -146,13 +205,21 @@ async def batch_status(
             })
             continue
         
+        job = db.query(ConversionJob).filter(
+            ConversionJob.conversion_id == conversion.id
+        ).order_by(ConversionJob.id.desc()).first()
+        
+        eta = JobQueue.estimate_eta(db, job) if job and conversion.status in ("queued", "processing") else None
+        
         results.append({
             "id": conversion.id,
-            "filename": conversion.original_filename,
+            "filename": conversion.filename,
             "status": conversion.status,
             "source_format": conversion.source_format,
             "target_format": conversion.target_format,
-            "error": conversion.error_message
+            "error": conversion.error_message,
+            "duration_seconds": job.duration_seconds if job else None,
+            "eta_seconds": round(eta, 2) if eta is not None else None
         })
     
     completed = len([r for r in results if r.get("status") == "completed"])
@@ -191,15 +258,18 @@ async def download_batch_as_zip(
     
     # Create ZIP file
     zip_filename = f"batch_conversion_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip"
-    zip_path = os.path.join(FileHandler.get_output_dir(), zip_filename)
+    zip_path = Storage.output_path(zip_filename)
     
     with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
         for conversion in conversions:
-            if conversion.output_path and os.path.exists(conversion.output_path):
-                # Add file to ZIP with original name
-                base_name = os.path.splitext(conversion.original_filename)[0]
-                output_filename = f"{base_name}.{conversion.target_format}"
-                zipf.write(conversion.output_path, output_filename)
+            output_path = await Storage.fetch(conversion.output_path or Storage.output_path(
+                FileHandler.get_output_filename(conversion.filename, conversion.target_format)
+            ))
+            if os.path.exists(output_path):
+                zipf.write(output_path, os.path.basename(output_path))
+                conversion.last_downloaded_at = datetime.utcnow()
+    
+    db.commit()
     
     return FileResponse(
         path=zip_path,
@@ -0,0 +1,121 @@
+from fastapi import APIRouter, Depends, HTTPException, Form
+from sqlalchemy.orm import Session
+from app.database import get_db, Conversion, get_expiry
+from app.services.registry import registry, normalize_format
+from app.utils.admission import admit_request
+from app.utils.executor import ConversionExecutor, ConversionCancelled, ConversionTimeout, conversion_stopped
+from app.utils.storage import Storage
+from app.utils.file_handler import FileHandler
+from app.models import ConversionResponse
+import os
+from datetime import datetime
+
+router = APIRouter(prefix="/api/convert", tags=["convert"])
+
+@router.get("/targets/{source_format}")
+async def get_conversion_targets(source_format: str):
+    """List every format a source format can be converted to, directly or in several hops"""
+    return {
+        "source_format": normalize_format(source_format),
+        "targets": registry.targets(normalize_format(source_format))
+    }
+
+async def admit_plan(conversion_id: int, target_format: str = Form(...), db: Session = Depends(get_db)):
+    """Admission for the category of the plan's costliest hop (unknown conversions and paths pass through)"""
+    conversion = db.query(Conversion).filter(Conversion.id == conversion_id).first()
+    plan = registry.plan(conversion.source_format, target_format) if conversion else None
+    if plan is None:
+        yield
+        return
+    
+    async with admit_request(plan.category, conversion.file_size or 0.0):
+        yield
+
+@router.post("/{conversion_id}", response_model=ConversionResponse, dependencies=[Depends(admit_plan)])
+async def convert_any(
+    conversion_id: int,
+    target_format: str = Form(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Convert an uploaded file to any reachable format.
+    
+    The conversion registry picks the cheapest chain of converters, so
+    pairs without a direct converter still work when two or three
+    existing hops connect them, e.g.:
+    - XLSX → CSV → SQL
+    - HEIC → JPG → PDF
+    - YAML → JSON → CSV
+    
+    The chosen plan is returned in the response.
+    """
+    conversion = db.query(Conversion).filter(Conversion.id == conversion_id).first()
+    
+    if not conversion:
+        raise HTTPException(status_code=404, detail="Conversion not found")
+    
+    plan = registry.plan(conversion.source_format, target_format)
+    if plan is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No conversion path from {conversion.source_format} to {target_format}"
+        )
+    
+    try:
+        conversion.status = "processing"
+        db.commit()
+        
+        input_path = await Storage.fetch_upload(conversion.filename)
+        
+        if not os.path.exists(input_path):
+            raise HTTPException(status_code=404, detail="Input file not found")
+        
+        output_filename = FileHandler.get_output_filename(conversion.filename, target_format)
+        output_path = Storage.output_path(output_filename)
+        
+        await ConversionExecutor.convert_plan(
+            plan,
+            input_path=input_path,
+            output_path=output_path,
+            content_hash=conversion.content_hash,
+            progress_key=conversion.id
+        )
+        
+        conversion.target_format = target_format
+        conversion.output_path = output_path
+        conversion.status = "completed"
+        conversion.completed_at = datetime.utcnow()
+        conversion.expires_at = get_expiry(conversion.completed_at)
+        conversion.error_message = None
+        db.commit()
+        
+        return {
+            "id": conversion.id,
+            "filename": conversion.filename,
+            "source_format": conversion.source_format,
+            "target_format": conversion.target_format,
+            "file_size": conversion.file_size,
+            "status": "completed",
+            "created_at": conversion.created_at,
+            "completed_at": conversion.completed_at,
+            "download_url": f"/api/download/{conversion.id}",
+            "error_message": None,
+            "plan": plan.describe()
+        }
+    
+    except (ConversionTimeout, ConversionCancelled) as e:
+        raise conversion_stopped(db, conversion, e)
+    except HTTPException:
+        conversion.status = "failed"
+        db.commit()
+        raise
+    except NotImplementedError as e:
+        conversion.status = "failed"
+        conversion.error_message = str(e)
+        db.commit()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        conversion.status = "failed"
+        conversion.error_message = str(e)
+        db.commit()
+        raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
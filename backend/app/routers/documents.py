@@ -3,14 +3,16 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 import os
 
-from app.database import get_db, Conversion
-from app.config import settings
+from app.database import get_db, Conversion, get_expiry
 from app.services.document_converter import DocumentConverter
+from app.utils.executor import ConversionExecutor, ConversionCancelled, ConversionTimeout, conversion_stopped
+from app.utils.storage import Storage
+from app.utils.admission import admission
 from app.utils.file_handler import FileHandler
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
 
-@router.post("/convert/{conversion_id}")
+@router.post("/convert/{conversion_id}", dependencies=[Depends(admission("document"))])
 async def convert_document(
     conversion_id: int,
     target_format: str,
@@ -42,25 +44,31 @@ async def convert_document(
         db.commit()
         
         # Build file paths
-        input_path = os.path.join(settings.upload_dir, conversion.filename)
+        input_path = await Storage.fetch_upload(conversion.filename)
         output_filename = FileHandler.get_output_filename(conversion.filename, target_format)
-        output_path = os.path.join(settings.output_dir, output_filename)
+        output_path = Storage.output_path(output_filename)
         
         # Check if input file exists
         if not os.path.exists(input_path):
             raise HTTPException(status_code=404, detail="Input file not found")
         
         # Perform conversion
-        result_path = await DocumentConverter.convert(
+        result_path = await ConversionExecutor.convert(
+            "document",
+            DocumentConverter,
             input_path,
             output_path,
             conversion.source_format,
-            target_format
+            target_format,
+            content_hash=conversion.content_hash,
+            progress_key=conversion.id
         )
         
         # Update conversion status
+        conversion.output_path = result_path
         conversion.status = "completed"
         conversion.completed_at = datetime.utcnow()
+        conversion.expires_at = get_expiry(conversion.completed_at)
         conversion.error_message = None
         db.commit()
         
@@ -71,6 +79,8 @@ async def convert_document(
             "output_filename": output_filename
         }
         
+    except (ConversionTimeout, ConversionCancelled) as e:
+        raise conversion_stopped(db, conversion, e)
     except NotImplementedError as e:
         conversion.status = "failed"
         conversion.error_message = str(e)
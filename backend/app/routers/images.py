@@ -1,17 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, Form
+from fastapi import APIRouter, Depends, HTTPException, Form, File, UploadFile, Request, Query
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from PIL import Image
 from sqlalchemy.orm import Session
-from app.database import get_db, Conversion
+from app.config import settings
+from app.database import get_db, Conversion, get_expiry
 from app.services.image_converter import ImageConverter
+from app.services.bulk_images import BulkImageConverter
+from app.services.image_pdf import ImagePdfConverter
+from app.services.renditions import ImageRenditions, RENDITION_FORMATS
+from app.utils.executor import ConversionExecutor, ConversionCancelled, ConversionTimeout, conversion_stopped
+from app.middleware.upload_limit import UploadLimitMiddleware
+from app.utils.file_handler import FileHandler
+from app.utils.scratch import ScratchSpace
+from app.utils.storage import Storage
+from app.utils.admission import admission, body_admission
+from app.utils.result_cache import ResultCache
+from app.utils.validators import SUPPORTED_FORMATS
+from app.utils.metrics import IMAGE_RENDITIONS
 from app.models import ConversionResponse
 import os
+import shutil
+from contextlib import AsyncExitStack
 from datetime import datetime
+from typing import List, Optional
 
 router = APIRouter(prefix="/api/images", tags=["images"])
 
-@router.post("/convert/{conversion_id}", response_model=ConversionResponse)
+@router.post("/convert/{conversion_id}", response_model=ConversionResponse, dependencies=[Depends(admission("image"))])
 async def convert_image(
     conversion_id: int,
     target_format: str = Form(...),
+    max_dimension: Optional[int] = Form(None),
+    color_mode: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
     """
@@ -27,6 +48,15 @@ async def convert_image(
     - SVG → PNG/JPG
     - Image → PDF
     - ICO ↔ PNG
+    
+    With ``max_dimension`` the result is scaled down to fit within that many
+    pixels on its longer side; JPEGs are then decoded at reduced resolution,
+    which is much faster than decoding in full and resizing.
+    
+    ``color_mode`` (L, LA, RGB or RGBA) converts the result to that colour
+    mode, flattening transparency onto white when the mode has no alpha.
+    Very large TIFFs and PNGs converted to TIFF or PNG are processed in
+    bands of rows, so their size is not limited by memory.
     """
     # Get conversion record
     conversion = db.query(Conversion).filter(Conversion.id == conversion_id).first()
@@ -40,6 +70,18 @@ async def convert_image(
     if conversion.status == "failed":
         raise HTTPException(status_code=400, detail="Conversion previously failed")
     
+    if max_dimension is not None and max_dimension < 1:
+        raise HTTPException(status_code=400, detail="max_dimension must be a positive number of pixels")
+    if color_mode is not None and color_mode not in ImageConverter.COLOR_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"color_mode must be one of: {', '.join(ImageConverter.COLOR_MODES)}"
+        )
+    # Only passed when set, so the cache key matches the same conversion run as a job
+    params = {"max_dimension": max_dimension} if max_dimension else {}
+    if color_mode:
+        params["color_mode"] = color_mode
+    
     try:
         # Update status
         conversion.status = "processing"
@@ -47,8 +89,7 @@ async def convert_image(
         
         # Get paths
         # Build input path from filename
-        from app.config import settings
-        input_path = os.path.join(settings.upload_dir, conversion.filename)
+        input_path = await Storage.fetch_upload(conversion.filename)
         source_format = conversion.source_format
         
         # Validate input file exists
@@ -58,22 +99,27 @@ async def convert_image(
         # Create output filename
         base_name = os.path.splitext(os.path.basename(input_path))[0]
         output_filename = f"{base_name}_converted.{target_format.lower()}"
-        output_dir = os.path.dirname(input_path).replace('uploads', 'outputs')
-        os.makedirs(output_dir, exist_ok=True)
-        output_path = os.path.join(output_dir, output_filename)
+        output_path = Storage.output_path(output_filename)
         
         # Perform conversion
-        result_path = await ImageConverter.convert(
+        result_path = await ConversionExecutor.convert(
+            "image",
+            ImageConverter,
             input_path=input_path,
             output_path=output_path,
             source_format=source_format,
-            target_format=target_format
+            target_format=target_format,
+            content_hash=conversion.content_hash,
+            progress_key=conversion.id,
+            **params
         )
         
         # Update conversion record
         conversion.target_format = target_format
+        conversion.output_path = result_path
         conversion.status = "completed"
         conversion.completed_at = datetime.utcnow()
+        conversion.expires_at = get_expiry(conversion.completed_at)
         db.commit()
         
         return {
@@ -89,6 +135,8 @@ async def convert_image(
             "error_message": None
         }
         
+    except (ConversionTimeout, ConversionCancelled) as e:
+        raise conversion_stopped(db, conversion, e)
     except NotImplementedError as e:
         conversion.status = "failed"
         conversion.error_message = str(e)
@@ -103,3 +151,195 @@ async def convert_image(
             status_code=500, 
             detail=f"Image conversion failed: {str(e)}"
         )
+
+@router.post("/bulk")
+async def bulk_convert_images(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    target_format: str = Form(...),
+    quality: Optional[int] = Form(None),
+    max_dimension: Optional[int] = Form(None),
+    admitted: AsyncExitStack = Depends(body_admission("image"))
+):
+    """
+    Convert many images at once with the same settings.
+    
+    Send images and/or zips of images as ``files``. Every image is
+    converted to ``target_format`` (jpg, png, webp, tiff, bmp or gif) with
+    the same ``quality`` (JPEG and WebP, 1-100) and ``max_dimension``, and
+    the response streams a zip of the results as they finish. Nothing is
+    stored: ``manifest.json`` at the end of the zip reports each file's
+    status, error and stage timings. The request counts as one image
+    conversion for admission control until the zip is complete.
+    """
+    target_format = target_format.lower().lstrip('.')
+    if target_format not in ImageConverter.RASTER_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Bulk conversion supports: {', '.join(sorted(ImageConverter.RASTER_FORMATS))}"
+        )
+    if quality is not None and not 1 <= quality <= 100:
+        raise HTTPException(status_code=400, detail="quality must be between 1 and 100")
+    if max_dimension is not None and max_dimension < 1:
+        raise HTTPException(status_code=400, detail="max_dimension must be a positive number of pixels")
+    
+    # Inputs, extracted zips and outputs side by side
+    content_length = request.headers.get("content-length", "")
+    body_bytes = int(content_length) if content_length.isdigit() else settings.image_bulk_max_mb * 1024 * 1024
+    _, work_dir = await ConversionExecutor.run_in_thread(ScratchSpace.create, body_bytes * 3)
+    try:
+        uploads = []
+        for file in files:
+            saved = await FileHandler.save_upload_file(
+                file, directory=work_dir, max_bytes=settings.image_bulk_max_mb * 1024 * 1024,
+                limit_description=UploadLimitMiddleware.describe_limit(request.url.path)
+            )
+            uploads.append((file.filename or "image", saved.path))
+        items = await ConversionExecutor.run_in_thread(BulkImageConverter.collect, uploads, work_dir)
+    except BaseException:
+        await ConversionExecutor.run_in_thread(shutil.rmtree, work_dir, True)
+        raise
+    
+    filename = f"images_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(
+        BulkImageConverter.stream(items, work_dir, target_format, quality, max_dimension, admitted.pop_all()),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Image-Count": str(len(items))
+        }
+    )
+
+@router.post("/pdf")
+async def images_to_pdf(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    max_dimension: Optional[int] = Form(None),
+    admitted: AsyncExitStack = Depends(body_admission("image"))
+):
+    """
+    Assemble images into one PDF, a page per image.
+    
+    Send images and/or zips of images as ``files``; pages follow the upload
+    order, and the order of the entries inside each zip. JPEG and JPEG 2000
+    pages are embedded without re-encoding. The PDF is streamed back as
+    pages are written and is not stored.
+    """
+    if max_dimension is not None and max_dimension < 1:
+        raise HTTPException(status_code=400, detail="max_dimension must be a positive number of pixels")
+    
+    content_length = request.headers.get("content-length", "")
+    body_bytes = int(content_length) if content_length.isdigit() else settings.image_bulk_max_mb * 1024 * 1024
+    _, work_dir = await ConversionExecutor.run_in_thread(ScratchSpace.create, body_bytes * 2)
+    try:
+        uploads = []
+        for file in files:
+            saved = await FileHandler.save_upload_file(
+                file, directory=work_dir, max_bytes=settings.image_bulk_max_mb * 1024 * 1024,
+                limit_description=UploadLimitMiddleware.describe_limit(request.url.path)
+            )
+            uploads.append((file.filename or "image", saved.path))
+        items = await ConversionExecutor.run_in_thread(BulkImageConverter.collect, uploads, work_dir)
+        # Once streaming starts a bad page can only cut the PDF short, so check them all first
+        await ConversionExecutor.run_in_thread(ImagePdfConverter.check, items)
+    except ValueError as e:
+        await ConversionExecutor.run_in_thread(shutil.rmtree, work_dir, True)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        await ConversionExecutor.run_in_thread(shutil.rmtree, work_dir, True)
+        raise
+    
+    filename = f"images_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
+    return StreamingResponse(
+        ImagePdfConverter.stream(items, work_dir, max_dimension, admitted.pop_all()),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Page-Count": str(len(items))
+        }
+    )
+
+@router.get("/{conversion_id}/rendition")
+async def get_rendition(
+    conversion_id: int,
+    request: Request,
+    w: Optional[int] = Query(None),
+    h: Optional[int] = Query(None),
+    fmt: Optional[str] = Query(None),
+    q: Optional[int] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """
+    A resized and/or re-encoded variant of an uploaded image, for display.
+    
+    The image is scaled down (never up) to fit within ``w`` x ``h`` pixels
+    (either may be left out), encoded as ``fmt`` (jpg, png or webp; default:
+    the upload's format, or jpg) with quality ``q`` (jpg and webp). EXIF
+    orientation is applied. Renditions are cached, and responses carry an
+    ETag and Cache-Control so that browsers revalidate them for free.
+    """
+    for name, value in (("w", w), ("h", h)):
+        if value is not None and not 1 <= value <= settings.image_rendition_max_dimension:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{name} must be between 1 and {settings.image_rendition_max_dimension}"
+            )
+    if q is not None and not 1 <= q <= 100:
+        raise HTTPException(status_code=400, detail="q must be between 1 and 100")
+    
+    conversion = db.query(Conversion).filter(Conversion.id == conversion_id).first()
+    if not conversion:
+        raise HTTPException(status_code=404, detail="Conversion not found")
+    if conversion.source_format not in SUPPORTED_FORMATS["image"]:
+        raise HTTPException(status_code=400, detail="Renditions are only available for images")
+    
+    source_format = "jpg" if conversion.source_format == "jpeg" else conversion.source_format
+    image_format = (fmt or (source_format if source_format in RENDITION_FORMATS else "jpg")).lower().lstrip('.')
+    image_format = "jpg" if image_format == "jpeg" else image_format
+    if image_format not in RENDITION_FORMATS:
+        raise HTTPException(status_code=400, detail=f"fmt must be one of: {', '.join(RENDITION_FORMATS)}")
+    # The quality actually used is part of the key, so changing the default changes the ETag
+    quality = None
+    if RENDITION_FORMATS[image_format][0] in ImageConverter.DEFAULT_QUALITY:
+        quality = q or settings.image_rendition_default_quality
+    
+    input_path = Storage.upload_path(conversion.filename)
+    content_hash = conversion.content_hash
+    if not content_hash:
+        input_path = await Storage.fetch(input_path)
+        if not os.path.exists(input_path):
+            raise HTTPException(status_code=404, detail="Input file not found")
+        content_hash = await ConversionExecutor.run_in_thread(ResultCache.hash_file, input_path)
+    
+    key = ImageRenditions.make_key(content_hash, w, h, image_format, quality)
+    headers = {
+        "ETag": f'"{key[:32]}"',
+        "Cache-Control": f"public, max-age={settings.image_rendition_max_age_seconds}"
+    }
+    if _etag_matches(request.headers.get("if-none-match", ""), headers["ETag"]):
+        IMAGE_RENDITIONS.inc(result="not_modified")
+        return Response(status_code=304, headers=headers)
+    
+    input_path = await Storage.fetch(input_path)
+    if not os.path.exists(input_path):
+        raise HTTPException(status_code=404, detail="Input file not found")
+    try:
+        path, work_dir = await ImageRenditions.render(key, content_hash, input_path, w, h, image_format, quality)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # Unreadable files, and images Pillow cannot handle (it raises ValueError for unsupported modes)
+        raise HTTPException(status_code=400, detail=f"Cannot render image: {str(e)}")
+    
+    return FileResponse(
+        path,
+        media_type=RENDITION_FORMATS[image_format][1],
+        headers=headers,
+        background=BackgroundTask(shutil.rmtree, work_dir, True) if work_dir else None
+    )
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag (weak comparison)"""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
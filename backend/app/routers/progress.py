@@ -0,0 +1,99 @@
+import asyncio
+from typing import Any, Dict, Iterable, List
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.config import settings
+from app.database import SessionLocal, Conversion
+from app.models import ConversionStatus
+from app.utils.executor import ConversionExecutor
+from app.utils.progress import ProgressHub, TERMINAL_STATUSES, conversion_state, format_event
+
+router = APIRouter(prefix="/api/progress", tags=["progress"])
+
+def _load_states(conversion_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Current state of each conversion from the database ("not_found" for unknown ids)"""
+    conversion_ids = list(conversion_ids)
+    db = SessionLocal()
+    try:
+        rows = db.query(Conversion).filter(Conversion.id.in_(conversion_ids)).all()
+        states = {row.id: conversion_state(row) for row in rows}
+    finally:
+        db.close()
+    
+    for conversion_id in conversion_ids:
+        if conversion_id not in states:
+            states[conversion_id] = {"id": conversion_id, "status": "not_found"}
+        elif states[conversion_id]["status"] not in TERMINAL_STATUSES:
+            # Prefer the live progress this process has seen over the bare row
+            states[conversion_id].update(ProgressHub.get_latest(conversion_id) or {})
+    return states
+
+def _is_final(state: Dict[str, Any]) -> bool:
+    return state["status"] in TERMINAL_STATUSES or state["status"] == "not_found"
+
+async def _event_stream(conversion_ids: List[int]):
+    """
+    Yield progress events until every conversion has finished.
+    
+    Updates are pushed by the ProgressHub. The database is read once on
+    connect and again at each heartbeat, which also catches conversions
+    that finished in another API process.
+    """
+    queue = ProgressHub.subscribe(conversion_ids)
+    pending = set(conversion_ids)
+    last_status: Dict[int, str] = {}
+    loop = asyncio.get_running_loop()
+    
+    try:
+        while pending:
+            states = await ConversionExecutor.run_in_thread(_load_states, pending)
+            for conversion_id, state in states.items():
+                if state["status"] != last_status.get(conversion_id):
+                    last_status[conversion_id] = state["status"]
+                    yield format_event(state)
+                if _is_final(state):
+                    pending.discard(conversion_id)
+            
+            deadline = loop.time() + settings.progress_heartbeat_seconds
+            while pending:
+                try:
+                    state = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if state["id"] not in pending:
+                    continue
+                last_status[state["id"]] = state["status"]
+                yield format_event(state)
+                if _is_final(state):
+                    pending.discard(state["id"])
+            
+            if pending:
+                yield ": keep-alive\n\n"
+    finally:
+        ProgressHub.unsubscribe(conversion_ids, queue)
+
+@router.get("")
+async def stream_progress(conversion_ids: List[int] = Query(...)):
+    """
+    Stream progress for one or more conversions as Server-Sent Events.
+    
+    Each event is named after the conversion status (``processing``,
+    ``completed``, ``failed``, ...) and carries a ConversionStatus payload.
+    The stream ends once every listed conversion has completed or failed.
+    """
+    if len(conversion_ids) > settings.max_batch_files:
+        raise HTTPException(status_code=400, detail=f"Maximum {settings.max_batch_files} conversions per stream")
+    
+    return StreamingResponse(
+        _event_stream(list(dict.fromkeys(conversion_ids))),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/{conversion_id}", response_model=ConversionStatus)
+async def get_progress(conversion_id: int):
+    """Current status and progress of a single conversion"""
+    state = (await ConversionExecutor.run_in_thread(_load_states, [conversion_id]))[conversion_id]
+    if state["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Conversion not found")
+    return state
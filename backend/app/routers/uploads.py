@@ -0,0 +1,152 @@
+from email.utils import format_datetime
+from datetime import timezone
+from typing import Dict, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import get_db, UploadSession
+from app.utils.cleanup import ExpiryScheduler
+from app.utils.resumable_upload import ResumableUploads, CHECKSUM_ALGORITHMS
+
+router = APIRouter(prefix="/api/uploads", tags=["uploads"])
+
+TUS_VERSION = "1.0.0"
+TUS_EXTENSIONS = "creation,checksum,termination,concatenation,expiration"
+
+def _tus_headers(upload: Optional[UploadSession] = None) -> Dict[str, str]:
+    """Headers every tus response carries, plus the upload's state"""
+    headers = {"Tus-Resumable": TUS_VERSION, "Cache-Control": "no-store"}
+    if upload is not None:
+        headers["Upload-Offset"] = str(upload.offset)
+        headers["Upload-Length"] = str(upload.upload_length)
+        if upload.is_partial:
+            headers["Upload-Concat"] = "partial"
+        if upload.status == "uploading" and upload.expires_at is not None:
+            headers["Upload-Expires"] = format_datetime(upload.expires_at.replace(tzinfo=timezone.utc), usegmt=True)
+        if upload.conversion_id is not None:
+            headers["Upload-Conversion-Id"] = str(upload.conversion_id)
+    return headers
+
+def _check_version(tus_resumable: Optional[str]) -> None:
+    if tus_resumable != TUS_VERSION:
+        raise HTTPException(
+            status_code=412,
+            detail=f"Unsupported Tus-Resumable version (expected {TUS_VERSION})",
+            headers={"Tus-Version": TUS_VERSION}
+        )
+
+@router.options("")
+async def describe_uploads():
+    """Advertise the supported tus version, extensions and limits"""
+    return Response(status_code=204, headers={
+        "Tus-Resumable": TUS_VERSION,
+        "Tus-Version": TUS_VERSION,
+        "Tus-Extension": TUS_EXTENSIONS,
+        "Tus-Max-Size": str(settings.max_file_size_bytes),
+        "Tus-Checksum-Algorithm": ",".join(CHECKSUM_ALGORITHMS)
+    })
+
+@router.post("", status_code=201)
+async def create_upload(
+    request: Request,
+    upload_length: Optional[int] = Header(None),
+    upload_metadata: Optional[str] = Header(None),
+    upload_concat: Optional[str] = Header(None),
+    tus_resumable: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Start a resumable upload.
+    
+    - **Upload-Length**: Total size in bytes
+    - **Upload-Metadata**: ``filename`` (required) and optionally ``target_format``, base64-encoded
+    - **Upload-Concat**: ``partial`` for one part of a parallel upload, or
+      ``final;/api/uploads/a /api/uploads/b`` to join finished parts
+    """
+    _check_version(tus_resumable)
+    metadata = ResumableUploads.parse_metadata(upload_metadata)
+    ip_address = request.client.host if request.client else None
+    
+    if upload_concat and upload_concat.startswith("final;"):
+        part_ids = [url.rstrip("/").rsplit("/", 1)[-1] for url in upload_concat[len("final;"):].split()]
+        upload = await ResumableUploads.concatenate(
+            db, part_ids, metadata.get("filename"), metadata.get("target_format"), ip_address
+        )
+    else:
+        if upload_length is None:
+            raise HTTPException(status_code=400, detail="Upload-Length header is required")
+        upload = ResumableUploads.create(
+            db, upload_length, metadata.get("filename"), metadata.get("target_format"),
+            is_partial=upload_concat == "partial", ip_address=ip_address
+        )
+    
+    # Empty files (and concatenations) are complete as soon as they exist
+    conversion = await ResumableUploads.finish(db, upload)
+    if conversion is not None:
+        ExpiryScheduler.schedule(conversion.id, conversion.expires_at)
+    
+    headers = _tus_headers(upload)
+    headers["Location"] = f"{router.prefix}/{upload.id}"
+    return Response(status_code=201, headers=headers)
+
+@router.head("/{upload_id}")
+async def get_upload_offset(upload_id: str, db: Session = Depends(get_db)):
+    """Current offset of an upload, to resume from after a dropped connection"""
+    upload = ResumableUploads.get(db, upload_id)
+    return Response(status_code=200, headers=_tus_headers(upload))
+
+@router.get("/{upload_id}")
+async def get_upload(upload_id: str, db: Session = Depends(get_db)):
+    """Upload progress as JSON (for clients that do not speak tus)"""
+    upload = ResumableUploads.get(db, upload_id)
+    return {
+        "id": upload.id,
+        "filename": upload.original_filename,
+        "status": upload.status,
+        "offset": upload.offset,
+        "length": upload.upload_length,
+        "partial": bool(upload.is_partial),
+        "conversion_id": upload.conversion_id,
+        "expires_at": upload.expires_at
+    }
+
+@router.patch("/{upload_id}")
+async def append_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(...),
+    upload_checksum: Optional[str] = Header(None),
+    content_type: Optional[str] = Header(None),
+    tus_resumable: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Append a chunk at Upload-Offset.
+    
+    Once the last byte arrives the file is registered as a conversion,
+    whose id is returned in the Upload-Conversion-Id header.
+    """
+    _check_version(tus_resumable)
+    if content_type != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Content-Type must be application/offset+octet-stream")
+    
+    upload = ResumableUploads.get(db, upload_id)
+    await ResumableUploads.append(db, upload, upload_offset, request.stream(), upload_checksum)
+    
+    conversion = await ResumableUploads.finish(db, upload)
+    if conversion is not None:
+        ExpiryScheduler.schedule(conversion.id, conversion.expires_at)
+    
+    return Response(status_code=204, headers=_tus_headers(upload))
+
+@router.delete("/{upload_id}")
+async def terminate_upload(
+    upload_id: str,
+    tus_resumable: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Abandon an upload and delete the bytes received so far"""
+    _check_version(tus_resumable)
+    upload = ResumableUploads.get(db, upload_id)
+    ResumableUploads.delete(db, upload)
+    return Response(status_code=204, headers=_tus_headers())
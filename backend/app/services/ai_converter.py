@@ -1,17 +1,21 @@
-import pytesseract
 from PIL import Image
 import os
 from typing import Optional
-import PyPDF2
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas as pdf_canvas
-from reportlab.lib.utils import ImageReader
-import cv2
-import numpy as np
+from app.utils.lazy_import import lazy_import
+from app.utils.metrics import stage
+from app.utils.scratch import ScratchSpace
+
+pytesseract = lazy_import("pytesseract")
+PyPDF2 = lazy_import("PyPDF2")
+pdf_canvas = lazy_import("reportlab.pdfgen.canvas")
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
 
 class AIConverter:
     """Handles AI-powered conversions like OCR and text extraction"""
     
+    VERSION = "1"
+    
     @staticmethod
     async def convert(input_path: str, output_path: str, 
                      source_format: str, target_format: str) -> str:
@@ -36,21 +40,24 @@ class AIConverter:
     async def image_to_text_ocr(input_path: str, output_path: str) -> str:
         """Extract text from image using OCR"""
         try:
-            image = Image.open(input_path)
-            
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            with stage("decode"):
+                image = Image.open(input_path)
+                
+                # Convert to RGB if needed
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
             
             # Perform OCR
-            text = pytesseract.image_to_string(image, lang='eng')
+            with stage("ocr"):
+                text = pytesseract.image_to_string(image, lang='eng')
             
             if not text.strip():
                 text = "[No text detected in image]"
             
             # Save extracted text
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(text)
+            with stage("output_write"):
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
             
             return output_path
             
@@ -69,39 +76,45 @@ class AIConverter:
             # First try regular text extraction
             text_content = []
             
-            pdf_reader = PyPDF2.PdfReader(input_path)
-            for page in pdf_reader.pages:
-                text = page.extract_text()
-                if text.strip():
-                    text_content.append(text)
+            with stage("decode"):
+                pdf_reader = PyPDF2.PdfReader(input_path)
+                for page in pdf_reader.pages:
+                    text = page.extract_text()
+                    if text.strip():
+                        text_content.append(text)
             
             # If no text found, it might be a scanned PDF - use OCR
             if not text_content or len(''.join(text_content).strip()) < 50:
                 # Convert PDF pages to images and OCR them
                 import pdf2image
-                images = pdf2image.convert_from_path(input_path)
+                with stage("decode"):
+                    images = pdf2image.convert_from_path(input_path)
                 
                 for i, image in enumerate(images):
-                    page_text = pytesseract.image_to_string(image, lang='eng')
+                    with stage("ocr"):
+                        page_text = pytesseract.image_to_string(image, lang='eng')
                     if page_text.strip():
                         text_content.append(f"\n--- Page {i+1} ---\n{page_text}")
             
             final_text = '\n'.join(text_content) if text_content else "[No text detected in PDF]"
             
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(final_text)
+            with stage("output_write"):
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    f.write(final_text)
             
             return output_path
             
         except Exception as e:
             # Fallback to basic PDF text extraction
-            pdf_reader = PyPDF2.PdfReader(input_path)
-            text_content = []
-            for page in pdf_reader.pages:
-                text_content.append(page.extract_text())
+            with stage("decode"):
+                pdf_reader = PyPDF2.PdfReader(input_path)
+                text_content = []
+                for page in pdf_reader.pages:
+                    text_content.append(page.extract_text())
             
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(text_content))
+            with stage("output_write"):
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    f.write('\n'.join(text_content))
             
             return output_path
     
@@ -114,36 +127,42 @@ class AIConverter:
             from reportlab.lib.pagesizes import letter
             
             # Convert PDF pages to images
-            images = pdf2image.convert_from_path(input_path, dpi=300)
+            with stage("decode"):
+                images = pdf2image.convert_from_path(input_path, dpi=300)
             
             # Create new PDF with OCR'd text
             c = pdf_canvas.Canvas(output_path, pagesize=letter)
             width, height = letter
             
-            for i, image in enumerate(images):
-                # OCR the image
-                text = pytesseract.image_to_string(image, lang='eng')
-                
-                # Add image to PDF
-                img_path = f"temp_page_{i}.png"
-                image.save(img_path, 'PNG')
-                
-                c.drawImage(img_path, 0, 0, width, height)
-                
-                # Add invisible text layer for searchability
-                text_object = c.beginText(0, height)
-                text_object.setFont("Helvetica", 0.1)  # Invisible font size
-                text_object.setTextRenderMode(3)  # Invisible text
-                text_object.textLines(text)
-                c.drawText(text_object)
-                
-                c.showPage()
+            # Page images go in this conversion's scratch space, so concurrent jobs never share names
+            with ScratchSpace.directory("ocr") as work_dir:
+                for i, image in enumerate(images):
+                    # OCR the image
+                    with stage("ocr"):
+                        text = pytesseract.image_to_string(image, lang='eng')
+                    
+                    # Add image to PDF
+                    with stage("encode"):
+                        img_path = os.path.join(work_dir, f"page_{i}.png")
+                        image.save(img_path, 'PNG')
+                        
+                        c.drawImage(img_path, 0, 0, width, height)
+                    
+                    # Add invisible text layer for searchability
+                    text_object = c.beginText(0, height)
+                    text_object.setFont("Helvetica", 0.1)  # Invisible font size
+                    text_object.setTextRenderMode(3)  # Invisible text
+                    text_object.textLines(text)
+                    c.drawText(text_object)
+                    
+                    c.showPage()
+                    
+                    # Free the scratch space as we go (reportlab has read the image by now)
+                    if os.path.exists(img_path):
+                        os.remove(img_path)
                 
-                # Cleanup temp file
-                if os.path.exists(img_path):
-                    os.remove(img_path)
-            
-            c.save()
+                with stage("encode"):
+                    c.save()
             return output_path
             
         except ImportError:
@@ -156,16 +175,17 @@ class AIConverter:
         
         if source_format == 'pdf':
             # Extract text from PDF
-            pdf_reader = PyPDF2.PdfReader(input_path)
-            pages = []
-            
-            for i, page in enumerate(pdf_reader.pages):
-                text = page.extract_text()
-                pages.append({
-                    'page_number': i + 1,
-                    'text': text.strip(),
-                    'word_count': len(text.split())
-                })
+            with stage("decode"):
+                pdf_reader = PyPDF2.PdfReader(input_path)
+                pages = []
+                
+                for i, page in enumerate(pdf_reader.pages):
+                    text = page.extract_text()
+                    pages.append({
+                        'page_number': i + 1,
+                        'text': text.strip(),
+                        'word_count': len(text.split())
+                    })
             
             result = {
                 'document_type': 'pdf',
@@ -178,7 +198,8 @@ class AIConverter:
             image = Image.open(input_path)
             
             # Get detailed OCR data
-            ocr_data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, lang='eng')
+            with stage("ocr"):
+                ocr_data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, lang='eng')
             
             # Structure the data
             words = []
@@ -193,7 +214,8 @@ class AIConverter:
                         'height': ocr_data['height'][i]
                     })
             
-            full_text = pytesseract.image_to_string(image, lang='eng')
+            with stage("ocr"):
+                full_text = pytesseract.image_to_string(image, lang='eng')
             
             result = {
                 'document_type': 'image',
@@ -203,8 +225,9 @@ class AIConverter:
                 'words': words
             }
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        with stage("encode"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
         
         return output_path
     
@@ -226,12 +249,14 @@ class AIConverter:
         
         # OCR with custom configuration
         custom_config = r'--oem 3 --psm 6'
-        text = pytesseract.image_to_string(processed_image, config=custom_config, lang='eng')
+        with stage("ocr"):
+            text = pytesseract.image_to_string(processed_image, config=custom_config, lang='eng')
         
         if not text.strip():
             text = "[No handwritten text detected or text is unclear]"
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(text)
+        with stage("output_write"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(text)
         
         return output_path
@@ -1,9 +1,13 @@
 import zipfile
-import py7zr
 import tarfile
 import os
 import shutil
 from typing import Optional
+from app.utils.lazy_import import lazy_import
+from app.utils.metrics import stage
+from app.utils.scratch import ScratchSpace
+
+py7zr = lazy_import("py7zr")
 
 try:
     import rarfile
@@ -14,6 +18,8 @@ except ImportError:
 class ArchiveConverter:
     """Handles archive/compression format conversions"""
     
+    VERSION = "1"
+    
     @staticmethod
     async def convert(input_path: str, output_path: str, 
                      source_format: str, target_format: str) -> str:
@@ -22,23 +28,17 @@ class ArchiveConverter:
         source_format = source_format.lower().replace('.', '')
         target_format = target_format.lower().replace('.', '')
         
-        # Extract to temp directory
-        temp_dir = output_path + '_temp_extract'
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        try:
+        # Extract into scratch space (removed afterwards, even on failure)
+        with ScratchSpace.directory("extract") as temp_dir:
             # Extract source archive
-            await ArchiveConverter.extract_archive(input_path, temp_dir, source_format)
+            with stage("decode"):
+                await ArchiveConverter.extract_archive(input_path, temp_dir, source_format)
             
-            # Create target archive
-            await ArchiveConverter.create_archive(temp_dir, output_path, target_format)
+            # Create target archive (compressed straight into the output file)
+            with stage("encode"):
+                await ArchiveConverter.create_archive(temp_dir, output_path, target_format)
             
             return output_path
-            
-        finally:
-            # Cleanup temp directory
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
     
     @staticmethod
     async def extract_archive(archive_path: str, extract_dir: str, format: str):
@@ -1,19 +1,23 @@
 from pydub import AudioSegment
-from gtts import gTTS
-import speech_recognition as sr
 import os
 from typing import Optional
+from app.utils.lazy_import import LazyImporter, lazy_import
+from app.utils.metrics import stage
+from app.utils.progress import moviepy_logger, report_progress
+from app.utils.scratch import ScratchSpace
+
+gtts = lazy_import("gtts")
+sr = lazy_import("speech_recognition")
 
 # Optional dependency
-try:
-    from moviepy.editor import VideoFileClip
-    MOVIEPY_AVAILABLE = True
-except ImportError:
-    MOVIEPY_AVAILABLE = False
+moviepy_editor = lazy_import("moviepy.editor")
+MOVIEPY_AVAILABLE = LazyImporter.is_available("moviepy")
 
 class AudioConverter:
     """Handles all audio format conversions"""
     
+    VERSION = "1"
+    
     @staticmethod
     async def convert(input_path: str, output_path: str, 
                      source_format: str, target_format: str) -> str:
@@ -42,7 +46,9 @@ class AudioConverter:
         """Convert between audio formats using pydub"""
         
         # Load audio file
-        audio = AudioSegment.from_file(input_path, format=source_format)
+        with stage("decode"):
+            audio = AudioSegment.from_file(input_path, format=source_format)
+        report_progress(1, 2, "Decoded, encoding")
         
         # Set export parameters based on target format
         export_params = {
@@ -59,8 +65,9 @@ class AudioConverter:
         elif target_format == 'ogg':
             export_params['parameters'] = ['-q:a', '10']
         
-        # Export audio
-        audio.export(output_path, **export_params)
+        # Export audio (ffmpeg encodes straight to the output file)
+        with stage("encode"):
+            audio.export(output_path, **export_params)
         
         return output_path
     
@@ -69,26 +76,31 @@ class AudioConverter:
         """Convert text file to speech using gTTS"""
         
         # Read text from file
-        with open(input_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                text = f.read()
         
         if not text.strip():
             raise ValueError("Input text file is empty")
         
         # Generate speech
-        tts = gTTS(text=text, lang='en', slow=False)
+        tts = gtts.gTTS(text=text, lang='en', slow=False)
         
-        # Save as MP3 first (gTTS only supports MP3)
-        temp_mp3 = output_path.replace(f'.{target_format}', '_temp.mp3')
-        tts.save(temp_mp3)
+        # gTTS only writes MP3; convert from there for other targets
+        # (the speech is synthesized remotely while saving)
+        if target_format.lower() == 'mp3':
+            with stage("synthesize"):
+                tts.save(output_path)
+            return output_path
         
-        # Convert to target format if not MP3
-        if target_format.lower() != 'mp3':
-            audio = AudioSegment.from_mp3(temp_mp3)
-            audio.export(output_path, format=target_format)
-            os.remove(temp_mp3)
-        else:
-            os.rename(temp_mp3, output_path)
+        with ScratchSpace.directory("tts") as work_dir:
+            temp_mp3 = os.path.join(work_dir, 'speech.mp3')
+            with stage("synthesize"):
+                tts.save(temp_mp3)
+            with stage("decode"):
+                audio = AudioSegment.from_mp3(temp_mp3)
+            with stage("encode"):
+                audio.export(output_path, format=target_format)
         
         return output_path
     
@@ -98,31 +110,30 @@ class AudioConverter:
         
         recognizer = sr.Recognizer()
         
-        # Convert to WAV if not already
+        # Convert to WAV if not already (in scratch space, not next to the upload)
         audio_format = os.path.splitext(input_path)[1].lower().replace('.', '')
-        wav_path = input_path
-        
-        if audio_format != 'wav':
-            audio = AudioSegment.from_file(input_path, format=audio_format)
-            wav_path = input_path.replace(f'.{audio_format}', '_temp.wav')
-            audio.export(wav_path, format='wav')
         
-        try:
+        with ScratchSpace.directory("stt") as work_dir:
+            with stage("decode"):
+                wav_path = input_path
+                if audio_format != 'wav':
+                    audio = AudioSegment.from_file(input_path, format=audio_format)
+                    wav_path = os.path.join(work_dir, 'audio.wav')
+                    audio.export(wav_path, format='wav')
+                
+                with sr.AudioFile(wav_path) as source:
+                    audio_data = recognizer.record(source)
+            
             # Recognize speech
-            with sr.AudioFile(wav_path) as source:
-                audio_data = recognizer.record(source)
+            with stage("recognize"):
                 text = recognizer.recognize_google(audio_data)
-            
-            # Save to text file
+        
+        # Save to text file
+        with stage("output_write"):
             with open(output_path, 'w', encoding='utf-8') as f:
                 f.write(text)
-            
-            return output_path
-            
-        finally:
-            # Cleanup temp file
-            if wav_path != input_path and os.path.exists(wav_path):
-                os.remove(wav_path)
+        
+        return output_path
     
     @staticmethod
     async def video_to_audio(input_path: str, output_path: str, target_format: str = 'mp3') -> str:
@@ -130,19 +141,21 @@ class AudioConverter:
         if not MOVIEPY_AVAILABLE:
             raise NotImplementedError("Video to audio conversion requires moviepy library")
         
-        video = VideoFileClip(input_path)
+        with stage("decode"):
+            video = moviepy_editor.VideoFileClip(input_path)
         audio = video.audio
         
         if audio is None:
             raise ValueError("Video file has no audio track")
         
-        # Export audio
-        if target_format == 'mp3':
-            audio.write_audiofile(output_path, codec='libmp3lame', bitrate='320k', logger=None)
-        elif target_format == 'wav':
-            audio.write_audiofile(output_path, codec='pcm_s16le', logger=None)
-        else:
-            audio.write_audiofile(output_path, logger=None)
+        # Export audio (decoding continues as ffmpeg reads the track)
+        with stage("encode"):
+            if target_format == 'mp3':
+                audio.write_audiofile(output_path, codec='libmp3lame', bitrate='320k', logger=moviepy_logger())
+            elif target_format == 'wav':
+                audio.write_audiofile(output_path, codec='pcm_s16le', logger=moviepy_logger())
+            else:
+                audio.write_audiofile(output_path, logger=moviepy_logger())
         
         video.close()
         
@@ -0,0 +1,279 @@
+import asyncio
+import functools
+import json
+import os
+import posixpath
+import shutil
+import time
+import zipfile
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Set, Tuple
+from fastapi import HTTPException
+from app.config import settings
+from app.services.image_converter import ImageConverter
+from app.utils.executor import ConversionExecutor
+from app.utils.file_handler import FileHandler
+from app.utils.validators import SUPPORTED_FORMATS
+from app.utils.metrics import (
+    CONVERSIONS, CONVERSION_SECONDS, CONVERSION_STAGE_SECONDS, start_stages, collect_stages
+)
+
+class BulkItem(NamedTuple):
+    """One image of a bulk conversion"""
+    name: str  # path in the result zip, from the upload or zip member name
+    path: str  # local input file
+    source_format: str
+
+class _ZipStream:
+    """Write-only file object that keeps what ``zipfile`` writes until it is taken for the response"""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._offset
+    
+    def flush(self) -> None:
+        pass
+    
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class BulkImageConverter:
+    """
+    Converts many images with one set of settings (catalog imports).
+    
+    Inputs are uploaded images and the images inside uploaded zips. Each
+    file is decoded and encoded on the codec thread pool: Pillow releases
+    the GIL in its codecs, so threads use every core without the pickling
+    and start-up cost of the conversion process pools. Results are streamed
+    back as a zip in the order they finish. No Conversion rows are written;
+    ``manifest.json``, the last entry of the zip, lists every file's outcome
+    and stage timings.
+    """
+    
+    @staticmethod
+    def archive_name(name: str) -> str:
+        """Relative path (no "..", no leading "/") for a name taken from an upload or a zip"""
+        name = posixpath.normpath(name.replace("\\", "/")).lstrip("/")
+        if name.startswith("../") or name in ("", ".", ".."):
+            name = posixpath.basename(name)
+        return name if name not in ("", ".", "..") else "image"
+    
+    @staticmethod
+    def collect(uploads: List[Tuple[str, str]], work_dir: str) -> List[BulkItem]:
+        """
+        Images to convert from (upload name, local path) pairs, extracting zips (blocking).
+        
+        Zip entries that are not images (by extension) are skipped, as are
+        hidden files and ``__MACOSX`` metadata.
+        """
+        limit_bytes = settings.image_bulk_max_mb * 1024 * 1024
+        image_formats = SUPPORTED_FORMATS["image"]
+        items: List[BulkItem] = []
+        
+        for upload_name, path in uploads:
+            if not zipfile.is_zipfile(path):
+                items.append(BulkItem(
+                    BulkImageConverter.archive_name(upload_name),
+                    path,
+                    FileHandler.get_file_extension(upload_name)
+                ))
+                continue
+            
+            with zipfile.ZipFile(path) as archive:
+                members = []
+                for member in archive.infolist():
+                    name = BulkImageConverter.archive_name(member.filename)
+                    if member.is_dir() or name.startswith("__MACOSX/") or posixpath.basename(name).startswith("."):
+                        continue
+                    if FileHandler.get_file_extension(name) in image_formats:
+                        members.append((member, name))
+                
+                # Declared sizes are enforced while reading, so this bounds what is written
+                limit_bytes -= sum(member.file_size for member, _ in members)
+                if limit_bytes < 0:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Zip contents exceed the bulk conversion limit ({settings.image_bulk_max_mb}MB)"
+                    )
+                
+                for member, name in members:
+                    source_format = FileHandler.get_file_extension(name)
+                    member_path = os.path.join(work_dir, f"{len(items)}.{source_format}")
+                    with archive.open(member) as src, open(member_path, "wb") as dst:
+                        shutil.copyfileobj(src, dst, settings.upload_chunk_size_kb * 1024)
+                    items.append(BulkItem(name, member_path, source_format))
+            FileHandler.delete_file(path)
+            
+            if len(items) > settings.image_bulk_max_files:
+                break
+        
+        if len(items) > settings.image_bulk_max_files:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Maximum {settings.image_bulk_max_files} images per bulk conversion"
+            )
+        if not items:
+            raise HTTPException(status_code=400, detail="No images to convert")
+        return items
+    
+    @staticmethod
+    def output_names(items: List[BulkItem], target_format: str) -> List[str]:
+        """Result zip entry per item: its name with the target extension, numbered if taken"""
+        names, taken = [], set()
+        for item in items:
+            stem = posixpath.splitext(item.name)[0]
+            name, n = f"{stem}.{target_format}", 1
+            while name in taken:
+                name, n = f"{stem}_{n}.{target_format}", n + 1
+            taken.add(name)
+            names.append(name)
+        return names
+    
+    @staticmethod
+    def convert_file(item: BulkItem, output_path: str, target_format: str,
+                     quality: Optional[int], max_dimension: Optional[int]) -> Dict:
+        """Convert one image on a codec thread and report how it went"""
+        pair = f"{item.source_format or 'unknown'}_to_{target_format}"
+        start_stages()
+        started = time.perf_counter()
+        error = None
+        try:
+            asyncio.run(ImageConverter.convert_raster(item.path, output_path, target_format, quality, max_dimension))
+        except Exception as e:
+            error = (str(e) or type(e).__name__).replace(item.path, item.name)
+        finally:
+            stages = collect_stages()
+        seconds = time.perf_counter() - started
+        
+        status = "failed" if error else "completed"
+        CONVERSIONS.inc(category="image", pair=pair, status=status)
+        CONVERSION_SECONDS.observe(seconds, category="image", pair=pair)
+        for stage_name, stage_seconds in stages.items():
+            CONVERSION_STAGE_SECONDS.observe(stage_seconds, category="image", pair=pair, stage=stage_name)
+        
+        return {
+            "name": item.name,
+            "status": status,
+            "error": error,
+            "seconds": round(seconds, 4),
+            "stages": {name: round(value, 4) for name, value in stages.items()},
+            "bytes_in": os.path.getsize(item.path),
+            "bytes_out": os.path.getsize(output_path) if not error else 0
+        }
+    
+    @staticmethod
+    def timeout_entry(item: BulkItem, seconds: float) -> Dict:
+        """Manifest entry of an image still converting after ``seconds``"""
+        return {
+            "name": item.name,
+            "status": "failed",
+            "error": f"Conversion timed out after {seconds:g} seconds",
+            "seconds": round(seconds, 4),
+            "stages": {},
+            "bytes_in": os.path.getsize(item.path),
+            "bytes_out": 0
+        }
+    
+    @staticmethod
+    async def stream(items: List[BulkItem], work_dir: str, target_format: str,
+                     quality: Optional[int] = None, max_dimension: Optional[int] = None,
+                     release: Optional[AsyncExitStack] = None) -> AsyncIterator[bytes]:
+        """
+        Convert ``items`` and yield the result zip as files finish.
+        
+        At most ``image_bulk_in_flight`` images are converting at once, the
+        next one starting as each finishes, so one request cannot take over
+        the codec thread pool or fill scratch space with outputs waiting to
+        be sent. An image still converting after the image conversion
+        timeout is reported as failed; its thread cannot be stopped, so it
+        keeps its place until it ends. ``work_dir`` is removed, and
+        ``release`` (the request's admission) closed, at the end or when the
+        client goes away (conversions not started by then are dropped).
+        """
+        loop = asyncio.get_running_loop()
+        pool = ConversionExecutor.get_codec_pool()
+        in_flight = max(1, settings.image_bulk_in_flight or settings.image_codec_threads or os.cpu_count() or 1)
+        timeout = ConversionExecutor.get_timeout("image")
+        output_names = BulkImageConverter.output_names(items, target_format)
+        output_dir = os.path.join(work_dir, "out")
+        os.makedirs(output_dir, exist_ok=True)
+        
+        running: Dict[asyncio.Future, Tuple[int, Optional[float]]] = {}  # -> (index, deadline)
+        timed_out: Set[int] = set()
+        next_index = 0
+        buffer = _ZipStream()
+        archive = zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED)  # images are already compressed
+        manifest = []
+        started = time.perf_counter()
+        try:
+            while len(manifest) < len(items):
+                while next_index < len(items) and len(running) < in_flight:
+                    future = loop.run_in_executor(pool, functools.partial(
+                        BulkImageConverter.convert_file,
+                        items[next_index],
+                        os.path.join(output_dir, f"{next_index}.{target_format}"),
+                        target_format,
+                        quality,
+                        max_dimension
+                    ))
+                    running[future] = (next_index, loop.time() + timeout if timeout else None)
+                    next_index += 1
+                
+                deadlines = [deadline for index, deadline in running.values()
+                             if deadline is not None and index not in timed_out]
+                wait = max(0.0, min(deadlines) - loop.time()) if deadlines else None
+                done, _ = await asyncio.wait(running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                
+                finished = []
+                for future in done:
+                    index, _ = running.pop(future)
+                    if index in timed_out:
+                        timed_out.discard(index)  # already reported; its output goes with work_dir
+                    else:
+                        finished.append((index, future.result()))
+                now = loop.time()
+                for index, deadline in running.values():
+                    if deadline is not None and deadline <= now and index not in timed_out:
+                        timed_out.add(index)
+                        finished.append((index, BulkImageConverter.timeout_entry(items[index], timeout)))
+                
+                for index, entry in finished:
+                    if entry["status"] == "completed":
+                        entry["output"] = output_names[index]
+                        output_path = os.path.join(output_dir, f"{index}.{target_format}")
+                        await ConversionExecutor.run_in_thread(archive.write, output_path, output_names[index])
+                        FileHandler.delete_file(output_path)
+                    manifest.append(entry)
+                chunk = buffer.take()
+                if chunk:
+                    yield chunk
+            
+            completed = sum(1 for entry in manifest if entry["status"] == "completed")
+            archive.writestr("manifest.json", json.dumps({
+                "target_format": target_format,
+                "quality": quality,
+                "max_dimension": max_dimension,
+                "total": len(manifest),
+                "completed": completed,
+                "failed": len(manifest) - completed,
+                "seconds": round(time.perf_counter() - started, 3),
+                "files": manifest
+            }, indent=2))
+            archive.close()
+            yield buffer.take()
+        finally:
+            for future in running:
+                future.cancel()
+            await ConversionExecutor.run_in_thread(shutil.rmtree, work_dir, True)
+            if release is not None:
+                await release.aclose()
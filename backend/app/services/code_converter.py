@@ -4,21 +4,44 @@ import yaml
 import xml.etree.ElementTree as ET
 import xml.dom.minidom as minidom
 from typing import Any, Dict, List
-import pandas as pd
-from bs4 import BeautifulSoup
 import markdown
 import os
+from app.utils.lazy_import import LazyImporter, lazy_import
+from app.utils.metrics import stage
+from app.utils.scratch import ScratchSpace
 
-try:
-    from nbconvert import HTMLExporter, PDFExporter
-    from nbformat import read as nb_read
-    NBCONVERT_AVAILABLE = True
-except ImportError:
-    NBCONVERT_AVAILABLE = False
+pd = lazy_import("pandas")
+bs4 = lazy_import("bs4")
+
+nbconvert = lazy_import("nbconvert")
+nbformat = lazy_import("nbformat")
+NBCONVERT_AVAILABLE = LazyImporter.is_available("nbconvert") and LazyImporter.is_available("nbformat")
 
 class CodeConverter:
     """Handles code and data format conversions"""
     
+    VERSION = "1"
+    
+    # "{source}_to_{target}" -> method name, built once at import
+    CONVERTERS = {
+        'json_to_csv': 'json_to_csv',
+        'csv_to_json': 'csv_to_json',
+        'json_to_xml': 'json_to_xml',
+        'xml_to_json': 'xml_to_json',
+        'csv_to_xml': 'csv_to_xml',
+        'xml_to_csv': 'xml_to_csv',
+        'json_to_yaml': 'json_to_yaml',
+        'yaml_to_json': 'yaml_to_json',
+        'xlsx_to_json': 'excel_to_json',
+        'xls_to_json': 'excel_to_json',
+        'html_to_pdf': 'html_to_pdf',
+        'html_to_markdown': 'html_to_markdown',
+        'md_to_html': 'markdown_to_html',
+        'markdown_to_html': 'markdown_to_html',
+        'ipynb_to_html': 'notebook_to_html',
+        'ipynb_to_pdf': 'notebook_to_pdf',
+    }
+    
     @staticmethod
     async def convert(input_path: str, output_path: str, 
                      source_format: str, target_format: str) -> str:
@@ -29,27 +52,10 @@ class CodeConverter:
         
         conversion_key = f"{source_format}_to_{target_format}"
         
-        converters = {
-            'json_to_csv': CodeConverter.json_to_csv,
-            'csv_to_json': CodeConverter.csv_to_json,
-            'json_to_xml': CodeConverter.json_to_xml,
-            'xml_to_json': CodeConverter.xml_to_json,
-            'csv_to_xml': CodeConverter.csv_to_xml,
-            'xml_to_csv': CodeConverter.xml_to_csv,
-            'json_to_yaml': CodeConverter.json_to_yaml,
-            'yaml_to_json': CodeConverter.yaml_to_json,
-            'xlsx_to_json': CodeConverter.excel_to_json,
-            'xls_to_json': CodeConverter.excel_to_json,
-            'html_to_pdf': CodeConverter.html_to_pdf,
-            'html_to_markdown': CodeConverter.html_to_markdown,
-            'md_to_html': CodeConverter.markdown_to_html,
-            'markdown_to_html': CodeConverter.markdown_to_html,
-            'ipynb_to_html': CodeConverter.notebook_to_html,
-            'ipynb_to_pdf': CodeConverter.notebook_to_pdf,
-        }
-        
-        converter_func = converters.get(conversion_key)
-        if converter_func:
+        
+        converter_name = CodeConverter.CONVERTERS.get(conversion_key)
+        if converter_name:
+            converter_func = getattr(CodeConverter, converter_name)
             return await converter_func(input_path, output_path)
         
         raise NotImplementedError(f"Conversion from {source_format} to {target_format} not supported")
@@ -57,8 +63,9 @@ class CodeConverter:
     @staticmethod
     async def json_to_csv(input_path: str, output_path: str) -> str:
         """Convert JSON to CSV"""
-        with open(input_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
         
         # Handle list of dicts
         if isinstance(data, list):
@@ -68,25 +75,29 @@ class CodeConverter:
         else:
             raise ValueError("JSON must be a list or dict")
         
-        df.to_csv(output_path, index=False)
+        with stage("encode"):
+            df.to_csv(output_path, index=False)
         return output_path
     
     @staticmethod
     async def csv_to_json(input_path: str, output_path: str) -> str:
         """Convert CSV to JSON"""
-        df = pd.read_csv(input_path)
+        with stage("decode"):
+            df = pd.read_csv(input_path)
         data = df.to_dict(orient='records')
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        with stage("encode"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
         
         return output_path
     
     @staticmethod
     async def json_to_xml(input_path: str, output_path: str) -> str:
         """Convert JSON to XML"""
-        with open(input_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
         
         def dict_to_xml(tag, d):
             elem = ET.Element(tag)
@@ -106,9 +117,11 @@ class CodeConverter:
         tree = ET.ElementTree(root)
         
         # Pretty print
-        xml_str = minidom.parseString(ET.tostring(root)).toprettyxml(indent="  ")
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(xml_str)
+        with stage("encode"):
+            xml_str = minidom.parseString(ET.tostring(root)).toprettyxml(indent="  ")
+        with stage("output_write"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(xml_str)
         
         return output_path
     
@@ -130,19 +143,22 @@ class CodeConverter:
                     result[child.tag] = child_data
             return result
         
-        tree = ET.parse(input_path)
+        with stage("decode"):
+            tree = ET.parse(input_path)
         root = tree.getroot()
         data = {root.tag: xml_to_dict(root)}
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        with stage("encode"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
         
         return output_path
     
     @staticmethod
     async def csv_to_xml(input_path: str, output_path: str) -> str:
         """Convert CSV to XML"""
-        df = pd.read_csv(input_path)
+        with stage("decode"):
+            df = pd.read_csv(input_path)
         data = df.to_dict(orient='records')
         
         root = ET.Element('data')
@@ -152,16 +168,19 @@ class CodeConverter:
                 field = ET.SubElement(record, key)
                 field.text = str(value)
         
-        xml_str = minidom.parseString(ET.tostring(root)).toprettyxml(indent="  ")
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(xml_str)
+        with stage("encode"):
+            xml_str = minidom.parseString(ET.tostring(root)).toprettyxml(indent="  ")
+        with stage("output_write"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(xml_str)
         
         return output_path
     
     @staticmethod
     async def xml_to_csv(input_path: str, output_path: str) -> str:
         """Convert XML to CSV"""
-        tree = ET.parse(input_path)
+        with stage("decode"):
+            tree = ET.parse(input_path)
         root = tree.getroot()
         
         data = []
@@ -172,39 +191,46 @@ class CodeConverter:
             data.append(row)
         
         df = pd.DataFrame(data)
-        df.to_csv(output_path, index=False)
+        with stage("encode"):
+            df.to_csv(output_path, index=False)
         return output_path
     
     @staticmethod
     async def json_to_yaml(input_path: str, output_path: str) -> str:
         """Convert JSON to YAML"""
-        with open(input_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            yaml.dump(data, f, default_flow_style=False, allow_unicode=True)
+        with stage("encode"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                yaml.dump(data, f, default_flow_style=False, allow_unicode=True)
         
         return output_path
     
     @staticmethod
     async def yaml_to_json(input_path: str, output_path: str) -> str:
         """Convert YAML to JSON"""
-        with open(input_path, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f)
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        with stage("encode"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
         
         return output_path
     
     @staticmethod
     async def excel_to_json(input_path: str, output_path: str) -> str:
         """Convert Excel to JSON"""
-        df = pd.read_excel(input_path)
+        with stage("decode"):
+            df = pd.read_excel(input_path)
         data = df.to_dict(orient='records')
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        with stage("encode"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
         
         return output_path
     
@@ -214,11 +240,12 @@ class CodeConverter:
         from reportlab.lib.pagesizes import letter
         from reportlab.pdfgen import canvas
         
-        with open(input_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                html_content = f.read()
         
         # Extract text from HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = bs4.BeautifulSoup(html_content, 'html.parser')
         text = soup.get_text()
         
         # Create PDF
@@ -233,32 +260,37 @@ class CodeConverter:
             c.drawString(40, y, line[:80])  # Truncate long lines
             y -= 15
         
-        c.save()
+        with stage("encode"):
+            c.save()
         return output_path
     
     @staticmethod
     async def html_to_markdown(input_path: str, output_path: str) -> str:
         """Convert HTML to Markdown"""
-        with open(input_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                html_content = f.read()
         
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = bs4.BeautifulSoup(html_content, 'html.parser')
         
         # Simple conversion (could be enhanced)
         md_content = soup.get_text()
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(md_content)
+        with stage("output_write"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(md_content)
         
         return output_path
     
     @staticmethod
     async def markdown_to_html(input_path: str, output_path: str) -> str:
         """Convert Markdown to HTML"""
-        with open(input_path, 'r', encoding='utf-8') as f:
-            md_content = f.read()
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                md_content = f.read()
         
-        html_content = markdown.markdown(md_content, extensions=['extra', 'codehilite'])
+        with stage("encode"):
+            html_content = markdown.markdown(md_content, extensions=['extra', 'codehilite'])
         
         # Wrap in HTML template
         full_html = f"""<!DOCTYPE html>
@@ -277,8 +309,9 @@ class CodeConverter:
 </body>
 </html>"""
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_html)
+        with stage("output_write"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(full_html)
         
         return output_path
     
@@ -288,14 +321,17 @@ class CodeConverter:
         if not NBCONVERT_AVAILABLE:
             raise NotImplementedError("nbconvert not available")
         
-        with open(input_path, 'r', encoding='utf-8') as f:
-            notebook = nb_read(f, as_version=4)
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                notebook = nbformat.read(f, as_version=4)
         
-        html_exporter = HTMLExporter()
-        body, resources = html_exporter.from_notebook_node(notebook)
+        with stage("encode"):
+            html_exporter = nbconvert.HTMLExporter()
+            body, resources = html_exporter.from_notebook_node(notebook)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(body)
+        with stage("output_write"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(body)
         
         return output_path
     
@@ -303,9 +339,7 @@ class CodeConverter:
     async def notebook_to_pdf(input_path: str, output_path: str) -> str:
         """Convert Jupyter notebook to PDF"""
         # First convert to HTML then use simpler PDF conversion
-        html_path = output_path.replace('.pdf', '_temp.html')
-        await CodeConverter.notebook_to_html(input_path, html_path)
-        result = await CodeConverter.html_to_pdf(html_path, output_path)
-        if os.path.exists(html_path):
-            os.remove(html_path)
-        return result
+        with ScratchSpace.directory("notebook") as work_dir:
+            html_path = os.path.join(work_dir, 'notebook.html')
+            await CodeConverter.notebook_to_html(input_path, html_path)
+            return await CodeConverter.html_to_pdf(html_path, output_path)
@@ -1,24 +1,34 @@
-import pandas as pd
 import json
 import os
 from typing import Optional
+from app.utils.lazy_import import LazyImporter, lazy_import
+from app.utils.metrics import stage
 
-try:
-    import pyarrow.parquet as pq
-    PYARROW_AVAILABLE = True
-except ImportError:
-    PYARROW_AVAILABLE = False
+pd = lazy_import("pandas")
 
-try:
-    from avro.datafile import DataFileReader
-    from avro.io import DatumReader
-    AVRO_AVAILABLE = True
-except ImportError:
-    AVRO_AVAILABLE = False
+pq = lazy_import("pyarrow.parquet")
+PYARROW_AVAILABLE = LazyImporter.is_available("pyarrow")
+
+avro_datafile = lazy_import("avro.datafile")
+avro_io = lazy_import("avro.io")
+AVRO_AVAILABLE = LazyImporter.is_available("avro")
 
 class DatabaseConverter:
     """Handles database and big-data format conversions"""
     
+    VERSION = "1"
+    
+    # "{source}_to_{target}" -> method name, built once at import
+    CONVERTERS = {
+        'sql_to_csv': 'sql_to_csv',
+        'csv_to_sql': 'csv_to_sql',
+        'json_to_sql': 'json_to_sql',
+        'xlsx_to_sql': 'excel_to_sql',
+        'xls_to_sql': 'excel_to_sql',
+        'parquet_to_csv': 'parquet_to_csv',
+        'avro_to_json': 'avro_to_json',
+    }
+    
     @staticmethod
     async def convert(input_path: str, output_path: str, 
                      source_format: str, target_format: str) -> str:
@@ -29,18 +39,10 @@ class DatabaseConverter:
         
         conversion_key = f"{source_format}_to_{target_format}"
         
-        converters = {
-            'sql_to_csv': DatabaseConverter.sql_to_csv,
-            'csv_to_sql': DatabaseConverter.csv_to_sql,
-            'json_to_sql': DatabaseConverter.json_to_sql,
-            'xlsx_to_sql': DatabaseConverter.excel_to_sql,
-            'xls_to_sql': DatabaseConverter.excel_to_sql,
-            'parquet_to_csv': DatabaseConverter.parquet_to_csv,
-            'avro_to_json': DatabaseConverter.avro_to_json,
-        }
-        
-        converter_func = converters.get(conversion_key)
-        if converter_func:
+        
+        converter_name = DatabaseConverter.CONVERTERS.get(conversion_key)
+        if converter_name:
+            converter_func = getattr(DatabaseConverter, converter_name)
             return await converter_func(input_path, output_path)
         
         raise NotImplementedError(f"Conversion from {source_format} to {target_format} not supported")
@@ -49,8 +51,9 @@ class DatabaseConverter:
     async def sql_to_csv(input_path: str, output_path: str) -> str:
         """Convert SQL dump to CSV"""
         # Simple SQL INSERT parser
-        with open(input_path, 'r', encoding='utf-8') as f:
-            sql_content = f.read()
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                sql_content = f.read()
         
         # Extract INSERT statements (simplified)
         import re
@@ -68,64 +71,71 @@ class DatabaseConverter:
         
         # Write to CSV
         df = pd.DataFrame(rows)
-        df.to_csv(output_path, index=False, header=False)
+        with stage("encode"):
+            df.to_csv(output_path, index=False, header=False)
         
         return output_path
     
     @staticmethod
     async def csv_to_sql(input_path: str, output_path: str, table_name: str = 'data') -> str:
         """Convert CSV to SQL INSERT statements"""
-        df = pd.read_csv(input_path)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            # Write CREATE TABLE statement
-            columns = ', '.join([f'{col} VARCHAR(255)' for col in df.columns])
-            f.write(f"CREATE TABLE {table_name} ({columns});\n\n")
-            
-            # Write INSERT statements
-            for _, row in df.iterrows():
-                values = ', '.join([f"'{str(v)}'" for v in row.values])
-                f.write(f"INSERT INTO {table_name} VALUES ({values});\n")
+        with stage("decode"):
+            df = pd.read_csv(input_path)
+        
+        with stage("encode"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                # Write CREATE TABLE statement
+                columns = ', '.join([f'{col} VARCHAR(255)' for col in df.columns])
+                f.write(f"CREATE TABLE {table_name} ({columns});\n\n")
+                
+                # Write INSERT statements
+                for _, row in df.iterrows():
+                    values = ', '.join([f"'{str(v)}'" for v in row.values])
+                    f.write(f"INSERT INTO {table_name} VALUES ({values});\n")
         
         return output_path
     
     @staticmethod
     async def json_to_sql(input_path: str, output_path: str, table_name: str = 'data') -> str:
         """Convert JSON to SQL INSERT statements"""
-        with open(input_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
         
         if not isinstance(data, list):
             data = [data]
         
         df = pd.DataFrame(data)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            # Write CREATE TABLE statement
-            columns = ', '.join([f'{col} VARCHAR(255)' for col in df.columns])
-            f.write(f"CREATE TABLE {table_name} ({columns});\n\n")
-            
-            # Write INSERT statements
-            for _, row in df.iterrows():
-                values = ', '.join([f"'{str(v)}'" for v in row.values])
-                f.write(f"INSERT INTO {table_name} VALUES ({values});\n")
+        with stage("encode"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                # Write CREATE TABLE statement
+                columns = ', '.join([f'{col} VARCHAR(255)' for col in df.columns])
+                f.write(f"CREATE TABLE {table_name} ({columns});\n\n")
+                
+                # Write INSERT statements
+                for _, row in df.iterrows():
+                    values = ', '.join([f"'{str(v)}'" for v in row.values])
+                    f.write(f"INSERT INTO {table_name} VALUES ({values});\n")
         
         return output_path
     
     @staticmethod
     async def excel_to_sql(input_path: str, output_path: str, table_name: str = 'data') -> str:
         """Convert Excel to SQL INSERT statements"""
-        df = pd.read_excel(input_path)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            # Write CREATE TABLE statement
-            columns = ', '.join([f'{col} VARCHAR(255)' for col in df.columns])
-            f.write(f"CREATE TABLE {table_name} ({columns});\n\n")
-            
-            # Write INSERT statements
-            for _, row in df.iterrows():
-                values = ', '.join([f"'{str(v)}'" for v in row.values])
-                f.write(f"INSERT INTO {table_name} VALUES ({values});\n")
+        with stage("decode"):
+            df = pd.read_excel(input_path)
+        
+        with stage("encode"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                # Write CREATE TABLE statement
+                columns = ', '.join([f'{col} VARCHAR(255)' for col in df.columns])
+                f.write(f"CREATE TABLE {table_name} ({columns});\n\n")
+                
+                # Write INSERT statements
+                for _, row in df.iterrows():
+                    values = ', '.join([f"'{str(v)}'" for v in row.values])
+                    f.write(f"INSERT INTO {table_name} VALUES ({values});\n")
         
         return output_path
     
@@ -135,9 +145,11 @@ class DatabaseConverter:
         if not PYARROW_AVAILABLE:
             raise NotImplementedError("pyarrow not available")
         
-        table = pq.read_table(input_path)
-        df = table.to_pandas()
-        df.to_csv(output_path, index=False)
+        with stage("decode"):
+            table = pq.read_table(input_path)
+            df = table.to_pandas()
+        with stage("encode"):
+            df.to_csv(output_path, index=False)
         
         return output_path
     
@@ -148,13 +160,15 @@ class DatabaseConverter:
             raise NotImplementedError("avro not available")
         
         records = []
-        with open(input_path, 'rb') as f:
-            reader = DataFileReader(f, DatumReader())
-            for record in reader:
-                records.append(record)
-            reader.close()
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(records, f, indent=2, ensure_ascii=False)
+        with stage("decode"):
+            with open(input_path, 'rb') as f:
+                reader = avro_datafile.DataFileReader(f, avro_io.DatumReader())
+                for record in reader:
+                    records.append(record)
+                reader.close()
+        
+        with stage("encode"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=2, ensure_ascii=False)
         
         return output_path
@@ -2,6 +2,9 @@ from PIL import Image
 import os
 from typing import Optional
 import io
+from app.services.image_converter import ImageConverter
+from app.utils.lazy_import import LazyImporter, lazy_import
+from app.utils.metrics import stage
 
 # Optional dependency
 try:
@@ -10,21 +13,26 @@ try:
 except (ImportError, OSError):
     CAIROSVG_AVAILABLE = False
 
-try:
-    from psd_tools import PSDImage
-    PSD_TOOLS_AVAILABLE = True
-except ImportError:
-    PSD_TOOLS_AVAILABLE = False
+psd_tools = lazy_import("psd_tools")
+PSD_TOOLS_AVAILABLE = LazyImporter.is_available("psd_tools")
 
-try:
-    import ezdxf
-    EZDXF_AVAILABLE = True
-except ImportError:
-    EZDXF_AVAILABLE = False
+ezdxf = lazy_import("ezdxf")
+EZDXF_AVAILABLE = LazyImporter.is_available("ezdxf")
 
 class DesignConverter:
     """Handles design and CAD file conversions"""
     
+    VERSION = "1"
+    
+    # "{source}_to_{target}" -> method name, built once at import
+    CONVERTERS = {
+        'psd_to_png': 'psd_to_image',
+        'psd_to_jpg': 'psd_to_image',
+        'psd_to_jpeg': 'psd_to_image',
+        'svg_to_pdf': 'svg_to_pdf',
+        'dxf_to_svg': 'dxf_to_svg',
+    }
+    
     @staticmethod
     async def convert(input_path: str, output_path: str, 
                      source_format: str, target_format: str) -> str:
@@ -35,16 +43,10 @@ class DesignConverter:
         
         conversion_key = f"{source_format}_to_{target_format}"
         
-        converters = {
-            'psd_to_png': DesignConverter.psd_to_image,
-            'psd_to_jpg': DesignConverter.psd_to_image,
-            'psd_to_jpeg': DesignConverter.psd_to_image,
-            'svg_to_pdf': DesignConverter.svg_to_pdf,
-            'dxf_to_svg': DesignConverter.dxf_to_svg,
-        }
         
-        converter_func = converters.get(conversion_key)
-        if converter_func:
+        converter_name = DesignConverter.CONVERTERS.get(conversion_key)
+        if converter_name:
+            converter_func = getattr(DesignConverter, converter_name)
             return await converter_func(input_path, output_path, target_format)
         
         raise NotImplementedError(f"Conversion from {source_format} to {target_format} not supported")
@@ -55,8 +57,9 @@ class DesignConverter:
         if not PSD_TOOLS_AVAILABLE:
             raise NotImplementedError("psd-tools not available")
         
-        psd = PSDImage.open(input_path)
-        image = psd.topil()
+        with stage("decode"):
+            psd = psd_tools.PSDImage.open(input_path)
+            image = psd.topil()
         
         if target_format.lower() in ('jpg', 'jpeg'):
             if image.mode in ('RGBA', 'LA', 'P'):
@@ -65,9 +68,9 @@ class DesignConverter:
                     image = image.convert('RGBA')
                 rgb_img.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
                 image = rgb_img
-            image.save(output_path, 'JPEG', quality=95)
+            ImageConverter._save(image, output_path, 'JPEG', quality=95)
         else:
-            image.save(output_path, 'PNG')
+            ImageConverter._save(image, output_path, 'PNG')
         
         return output_path
     
@@ -77,10 +80,13 @@ class DesignConverter:
         if not CAIROSVG_AVAILABLE:
             raise NotImplementedError("SVG conversion requires Cairo library")
         
-        pdf_data = cairosvg.svg2pdf(url=input_path)
+        # cairosvg parses and renders in one call
+        with stage("render"):
+            pdf_data = cairosvg.svg2pdf(url=input_path)
         
-        with open(output_path, 'wb') as f:
-            f.write(pdf_data)
+        with stage("output_write"):
+            with open(output_path, 'wb') as f:
+                f.write(pdf_data)
         
         return output_path
     
@@ -90,7 +96,8 @@ class DesignConverter:
         if not EZDXF_AVAILABLE:
             raise NotImplementedError("ezdxf not available")
         
-        doc = ezdxf.readfile(input_path)
+        with stage("decode"):
+            doc = ezdxf.readfile(input_path)
         msp = doc.modelspace()
         
         # Simple SVG generation
@@ -112,7 +119,8 @@ class DesignConverter:
         
         svg_content.append('</svg>')
         
-        with open(output_path, 'w') as f:
-            f.write('\n'.join(svg_content))
+        with stage("output_write"):
+            with open(output_path, 'w') as f:
+                f.write('\n'.join(svg_content))
         
         return output_path
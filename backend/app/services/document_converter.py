@@ -1,18 +1,24 @@
 import os
 from pathlib import Path
 from typing import Optional
-import PyPDF2
-from pdf2docx import Converter
-from docx import Document
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
-import pandas as pd
+from app.utils.lazy_import import lazy_import
+from app.utils.metrics import stage
+from app.utils.progress import report_progress
+
+PyPDF2 = lazy_import("PyPDF2")
+pdf2docx = lazy_import("pdf2docx")
+docx = lazy_import("docx")
+pagesizes = lazy_import("reportlab.lib.pagesizes")
+platypus = lazy_import("reportlab.platypus")
+styles_module = lazy_import("reportlab.lib.styles")
+units = lazy_import("reportlab.lib.units")
+pd = lazy_import("pandas")
 
 class DocumentConverter:
     """Handles document format conversions"""
     
+    VERSION = "1"
+    
     @staticmethod
     async def convert(input_path: str, output_path: str, source_format: str, target_format: str) -> str:
         """
@@ -70,9 +76,11 @@ class DocumentConverter:
     @staticmethod
     async def pdf_to_docx(input_path: str, output_path: str) -> str:
         """Convert PDF to DOCX"""
-        cv = Converter(input_path)
-        cv.convert(output_path)
-        cv.close()
+        # pdf2docx parses and writes in one pass
+        with stage("transcode"):
+            cv = pdf2docx.Converter(input_path)
+            cv.convert(output_path)
+            cv.close()
         return output_path
     
     @staticmethod
@@ -80,13 +88,17 @@ class DocumentConverter:
         """Convert PDF to TXT"""
         text_content = []
         
-        with open(input_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text_content.append(page.extract_text())
+        with stage("decode"):
+            with open(input_path, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                page_count = len(pdf_reader.pages)
+                for number, page in enumerate(pdf_reader.pages, start=1):
+                    text_content.append(page.extract_text())
+                    report_progress(number, page_count, f"Page {number} of {page_count}")
         
-        with open(output_path, 'w', encoding='utf-8') as output_file:
-            output_file.write('\n\n'.join(text_content))
+        with stage("output_write"):
+            with open(output_path, 'w', encoding='utf-8') as output_file:
+                output_file.write('\n\n'.join(text_content))
         
         return output_path
     
@@ -94,42 +106,47 @@ class DocumentConverter:
     async def docx_to_pdf(input_path: str, output_path: str) -> str:
         """Convert DOCX to PDF using reportlab"""
         # Read DOCX
-        doc = Document(input_path)
+        with stage("decode"):
+            doc = docx.Document(input_path)
         
         # Create PDF
-        pdf = SimpleDocTemplate(output_path, pagesize=letter)
-        styles = getSampleStyleSheet()
+        pdf = platypus.SimpleDocTemplate(output_path, pagesize=pagesizes.letter)
+        styles = styles_module.getSampleStyleSheet()
         story = []
         
         # Extract text from DOCX and add to PDF
         for paragraph in doc.paragraphs:
             if paragraph.text.strip():
-                p = Paragraph(paragraph.text, styles['Normal'])
+                p = platypus.Paragraph(paragraph.text, styles['Normal'])
                 story.append(p)
-                story.append(Spacer(1, 0.2 * inch))
+                story.append(platypus.Spacer(1, 0.2 * units.inch))
         
-        pdf.build(story)
+        with stage("encode"):
+            pdf.build(story)
         return output_path
     
     @staticmethod
     async def docx_to_txt(input_path: str, output_path: str) -> str:
         """Convert DOCX to TXT"""
-        doc = Document(input_path)
+        with stage("decode"):
+            doc = docx.Document(input_path)
         
-        with open(output_path, 'w', encoding='utf-8') as output_file:
-            for paragraph in doc.paragraphs:
-                output_file.write(paragraph.text + '\n')
+        with stage("output_write"):
+            with open(output_path, 'w', encoding='utf-8') as output_file:
+                for paragraph in doc.paragraphs:
+                    output_file.write(paragraph.text + '\n')
         
         return output_path
     
     @staticmethod
     async def txt_to_pdf(input_path: str, output_path: str) -> str:
         """Convert TXT to PDF"""
-        with open(input_path, 'r', encoding='utf-8') as file:
-            content = file.read()
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as file:
+                content = file.read()
         
-        pdf = SimpleDocTemplate(output_path, pagesize=letter)
-        styles = getSampleStyleSheet()
+        pdf = platypus.SimpleDocTemplate(output_path, pagesize=pagesizes.letter)
+        styles = styles_module.getSampleStyleSheet()
         story = []
         
         # Split content into paragraphs
@@ -138,20 +155,22 @@ class DocumentConverter:
             if para_text.strip():
                 # Replace line breaks within paragraphs
                 para_text = para_text.replace('\n', ' ')
-                p = Paragraph(para_text, styles['Normal'])
+                p = platypus.Paragraph(para_text, styles['Normal'])
                 story.append(p)
-                story.append(Spacer(1, 0.2 * inch))
+                story.append(platypus.Spacer(1, 0.2 * units.inch))
         
-        pdf.build(story)
+        with stage("encode"):
+            pdf.build(story)
         return output_path
     
     @staticmethod
     async def txt_to_docx(input_path: str, output_path: str) -> str:
         """Convert TXT to DOCX"""
-        doc = Document()
+        doc = docx.Document()
         
-        with open(input_path, 'r', encoding='utf-8') as file:
-            content = file.read()
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as file:
+                content = file.read()
         
         # Split content into paragraphs
         paragraphs = content.split('\n\n')
@@ -159,67 +178,76 @@ class DocumentConverter:
             if para_text.strip():
                 doc.add_paragraph(para_text)
         
-        doc.save(output_path)
+        with stage("encode"):
+            doc.save(output_path)
         return output_path
     
     @staticmethod
     async def excel_to_csv(input_path: str, output_path: str) -> str:
         """Convert Excel to CSV"""
         # Read first sheet
-        df = pd.read_excel(input_path, sheet_name=0)
-        df.to_csv(output_path, index=False)
+        with stage("decode"):
+            df = pd.read_excel(input_path, sheet_name=0)
+        with stage("encode"):
+            df.to_csv(output_path, index=False)
         return output_path
     
     @staticmethod
     async def csv_to_excel(input_path: str, output_path: str) -> str:
         """Convert CSV to Excel"""
-        df = pd.read_csv(input_path)
-        df.to_excel(output_path, index=False, engine='openpyxl')
+        with stage("decode"):
+            df = pd.read_csv(input_path)
+        with stage("encode"):
+            df.to_excel(output_path, index=False, engine='openpyxl')
         return output_path
     
     @staticmethod
     async def excel_to_pdf(input_path: str, output_path: str) -> str:
         """Convert Excel to PDF"""
         # Read Excel
-        df = pd.read_excel(input_path, sheet_name=0)
+        with stage("decode"):
+            df = pd.read_excel(input_path, sheet_name=0)
         
         # Create PDF
-        pdf = SimpleDocTemplate(output_path, pagesize=letter)
-        styles = getSampleStyleSheet()
+        pdf = platypus.SimpleDocTemplate(output_path, pagesize=pagesizes.letter)
+        styles = styles_module.getSampleStyleSheet()
         story = []
         
         # Add table data as text (simplified)
         for idx, row in df.iterrows():
             row_text = ' | '.join([str(val) for val in row])
-            p = Paragraph(row_text, styles['Normal'])
+            p = platypus.Paragraph(row_text, styles['Normal'])
             story.append(p)
-            story.append(Spacer(1, 0.1 * inch))
+            story.append(platypus.Spacer(1, 0.1 * units.inch))
         
-        pdf.build(story)
+        with stage("encode"):
+            pdf.build(story)
         return output_path
     
     @staticmethod
     async def csv_to_pdf(input_path: str, output_path: str) -> str:
         """Convert CSV to PDF"""
         # Read CSV
-        df = pd.read_csv(input_path)
+        with stage("decode"):
+            df = pd.read_csv(input_path)
         
         # Create PDF
-        pdf = SimpleDocTemplate(output_path, pagesize=letter)
-        styles = getSampleStyleSheet()
+        pdf = platypus.SimpleDocTemplate(output_path, pagesize=pagesizes.letter)
+        styles = styles_module.getSampleStyleSheet()
         story = []
         
         # Add headers
         headers = ' | '.join(df.columns)
-        story.append(Paragraph(headers, styles['Heading2']))
-        story.append(Spacer(1, 0.2 * inch))
+        story.append(platypus.Paragraph(headers, styles['Heading2']))
+        story.append(platypus.Spacer(1, 0.2 * units.inch))
         
         # Add data rows
         for idx, row in df.iterrows():
             row_text = ' | '.join([str(val) for val in row])
-            p = Paragraph(row_text, styles['Normal'])
+            p = platypus.Paragraph(row_text, styles['Normal'])
             story.append(p)
-            story.append(Spacer(1, 0.1 * inch))
+            story.append(platypus.Spacer(1, 0.1 * units.inch))
         
-        pdf.build(story)
+        with stage("encode"):
+            pdf.build(story)
         return output_path
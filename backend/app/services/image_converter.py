@@ -1,12 +1,11 @@
 from PIL import Image
 import io
 import os
-from typing import Optional
-import cv2
-import numpy as np
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas as pdf_canvas
-from reportlab.lib.utils import ImageReader
+from typing import Optional, Tuple
+from app.utils.lazy_import import lazy_import
+from app.utils.metrics import stage
+
+pagesizes = lazy_import("reportlab.lib.pagesizes")
 
 # Optional dependency - handle if not available
 try:
@@ -18,79 +17,215 @@ except (ImportError, OSError):
 class ImageConverter:
     """Handles all image format conversions"""
     
+    VERSION = "4"
+    
+    # "{source}_to_{target}" -> method name, built once at import
+    CONVERTERS = {
+        # Common formats
+        'jpg_to_png': 'jpg_to_png',
+        'png_to_jpg': 'png_to_jpg',
+        'jpeg_to_png': 'jpg_to_png',
+        'png_to_jpeg': 'png_to_jpg',
+        'jpg_to_webp': 'to_webp',
+        'jpeg_to_webp': 'to_webp',
+        'png_to_webp': 'to_webp',
+        'webp_to_jpg': 'from_webp',
+        'webp_to_png': 'from_webp',
+        'tiff_to_jpg': 'standard_convert',
+        'tiff_to_png': 'standard_convert',
+        'bmp_to_jpg': 'standard_convert',
+        'bmp_to_png': 'standard_convert',
+        'heic_to_jpg': 'heic_to_jpg',
+        'heic_to_png': 'heic_to_png',
+        
+        # SVG conversions
+        'svg_to_png': 'svg_to_raster',
+        'svg_to_jpg': 'svg_to_raster',
+        
+        # Image to PDF
+        'jpg_to_pdf': 'image_to_pdf',
+        'jpeg_to_pdf': 'image_to_pdf',
+        'png_to_pdf': 'image_to_pdf',
+        'webp_to_pdf': 'image_to_pdf',
+        'tiff_to_pdf': 'image_to_pdf',
+        'bmp_to_pdf': 'image_to_pdf',
+        'jp2_to_pdf': 'image_to_pdf',
+        'j2k_to_pdf': 'image_to_pdf',
+        
+        # ICO conversions
+        'ico_to_png': 'standard_convert',
+        'png_to_ico': 'png_to_ico',
+    }
+    
+    # Targets of convert_raster (bulk conversions): extension -> Pillow format
+    RASTER_FORMATS = {
+        'jpg': 'JPEG',
+        'jpeg': 'JPEG',
+        'png': 'PNG',
+        'webp': 'WEBP',
+        'tiff': 'TIFF',
+        'tif': 'TIFF',
+        'bmp': 'BMP',
+        'gif': 'GIF',
+    }
+    # Default quality for lossy targets
+    DEFAULT_QUALITY = {'JPEG': 95, 'WEBP': 90}
+    # Colour modes a conversion can be asked for (color_mode)
+    COLOR_MODES = ('L', 'LA', 'RGB', 'RGBA')
+    # Modes Pillow's reduce() rejects; they are only resized
+    NO_REDUCE_MODES = ('1', 'P')
+    # 16-bit greyscale modes, which Pillow can neither reduce nor resize (smoothly): scaled as 'I'
+    WIDE_MODES = ('I;16', 'I;16L', 'I;16B', 'I;16N')
+    
+    @staticmethod
+    def _fit_size(size: Tuple[int, int], max_dimension: int) -> Tuple[int, int]:
+        """``size`` scaled down (never up) so that its longer side is at most max_dimension"""
+        width, height = size
+        scale = min(1.0, max_dimension / max(width, height))
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    
+    @staticmethod
+    def _scale(img: "Image.Image", scale) -> "Image.Image":
+        """``scale(img)``, with 16-bit greyscale images scaled as 32-bit ('I') and converted back"""
+        if img.mode not in ImageConverter.WIDE_MODES:
+            return scale(img)
+        mode = img.mode if img.mode != 'I;16N' else 'I;16'  # Pillow clips 'I' converted to 'I;16N'
+        info = img.info
+        img = scale(img.convert('I')).convert(mode)
+        img.info.update(info)
+        return img
+    
+    @staticmethod
+    def _fit(img: "Image.Image", max_dimension: Optional[int]) -> "Image.Image":
+        """Resize a decoded image to fit within max_dimension pixels (no-op if it already does)"""
+        if not max_dimension or max(img.size) <= max_dimension:
+            return img
+        size = ImageConverter._fit_size(img.size, max_dimension)
+        with stage("resize"):
+            return ImageConverter._scale(img, lambda scaled: scaled.resize(size, Image.Resampling.LANCZOS))
+    
+    @staticmethod
+    def _open(path: str, max_dimension: Optional[int] = None,
+              min_size: Optional[Tuple[int, int]] = None) -> "Image.Image":
+        """Open and fully decode an image (PIL decodes lazily otherwise), see ``_decode``"""
+        return ImageConverter._decode(Image.open(path), max_dimension, min_size)
+    
+    @staticmethod
+    def _decode(img: "Image.Image", max_dimension: Optional[int] = None,
+                min_size: Optional[Tuple[int, int]] = None) -> "Image.Image":
+        """
+        Fully decode an opened image, fitted within ``max_dimension`` pixels.
+        
+        When the output needs fewer pixels than the source has (a
+        ``max_dimension``, or a ``min_size`` that is enough for the caller),
+        the decoder does most of the downscaling: JPEGs are decoded at 1/2,
+        1/4 or 1/8 scale (``draft``), which saves most of the decode time
+        and memory, and other formats are shrunk by an integer factor
+        (``reduce``) right after decoding. Neither goes below the size
+        needed, so the final resize keeps full quality.
+        """
+        needed = min_size
+        if max_dimension:
+            fitted = ImageConverter._fit_size(img.size, max_dimension)
+            needed = fitted if needed is None else (min(fitted[0], needed[0]), min(fitted[1], needed[1]))
+        
+        with stage("decode"):
+            if needed is not None:
+                img.draft(img.mode, needed)  # JPEG only; other formats ignore it
+            img.load()
+            if needed is not None and img.mode not in ImageConverter.NO_REDUCE_MODES:
+                factor = min(img.width // max(1, needed[0]), img.height // max(1, needed[1]))
+                if factor >= 2:
+                    info = img.info
+                    img = ImageConverter._scale(img, lambda scaled: scaled.reduce(factor))
+                    img.info.update(info)
+        return ImageConverter._fit(img, max_dimension)
+    
+    @staticmethod
+    def _to_mode(img: "Image.Image", mode: str) -> "Image.Image":
+        """``img`` in colour mode ``mode``, with transparency flattened onto white if ``mode`` has no alpha"""
+        if img.mode == mode:
+            return img
+        if img.mode == 'P':
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        if img.mode in ('RGBA', 'LA', 'PA') and mode not in ('RGBA', 'LA', 'PA'):
+            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+            rgb_img.paste(img, mask=img.split()[-1])
+            img = rgb_img
+        return img if img.mode == mode else img.convert(mode)
+    
+    @staticmethod
+    def _save(img: "Image.Image", output_path: str, image_format: str, **params) -> None:
+        """Encode in memory, then write, so encode and disk time are measured apart"""
+        buffer = io.BytesIO()
+        with stage("encode"):
+            img.save(buffer, image_format, **params)
+        with stage("output_write"):
+            with open(output_path, "wb") as f:
+                f.write(buffer.getbuffer())
+    
     @staticmethod
     async def convert(input_path: str, output_path: str, 
-                     source_format: str, target_format: str) -> str:
-        """Main conversion dispatcher"""
+                     source_format: str, target_format: str,
+                     max_dimension: Optional[int] = None,
+                     color_mode: Optional[str] = None) -> str:
+        """
+        Main conversion dispatcher.
+        
+        ``max_dimension`` scales the result down to fit within that many
+        pixels on its longer side, letting the decoder skip most of the
+        source's pixels. ``color_mode`` (one of COLOR_MODES) converts the
+        result to that colour mode. TIFFs and PNGs of more than
+        ``image_tiled_min_megapixels`` converted to TIFF or PNG are
+        processed in bands (see ``TiledImageConverter``).
+        """
+        from app.services.tiled_images import TiledImageConverter
         
         # Normalize formats
         source_format = source_format.lower().replace('.', '')
         target_format = target_format.lower().replace('.', '')
         
+        if TiledImageConverter.should_tile(input_path, source_format, target_format, max_dimension):
+            return await TiledImageConverter.convert(input_path, output_path, source_format, target_format,
+                                                     color_mode=color_mode)
+        if color_mode:
+            return await ImageConverter.convert_raster(input_path, output_path, target_format,
+                                                       max_dimension=max_dimension, color_mode=color_mode)
+        
         # Route to appropriate converter
         conversion_key = f"{source_format}_to_{target_format}"
         
-        converters = {
-            # Common formats
-            'jpg_to_png': ImageConverter.jpg_to_png,
-            'png_to_jpg': ImageConverter.png_to_jpg,
-            'jpeg_to_png': ImageConverter.jpg_to_png,
-            'png_to_jpeg': ImageConverter.png_to_jpg,
-            'jpg_to_webp': ImageConverter.to_webp,
-            'jpeg_to_webp': ImageConverter.to_webp,
-            'png_to_webp': ImageConverter.to_webp,
-            'webp_to_jpg': ImageConverter.from_webp,
-            'webp_to_png': ImageConverter.from_webp,
-            'tiff_to_jpg': ImageConverter.standard_convert,
-            'tiff_to_png': ImageConverter.standard_convert,
-            'bmp_to_jpg': ImageConverter.standard_convert,
-            'bmp_to_png': ImageConverter.standard_convert,
-            'heic_to_jpg': ImageConverter.heic_to_jpg,
-            'heic_to_png': ImageConverter.heic_to_png,
-            
-            # SVG conversions
-            'svg_to_png': ImageConverter.svg_to_raster,
-            'svg_to_jpg': ImageConverter.svg_to_raster,
-            
-            # Image to PDF
-            'jpg_to_pdf': ImageConverter.image_to_pdf,
-            'jpeg_to_pdf': ImageConverter.image_to_pdf,
-            'png_to_pdf': ImageConverter.image_to_pdf,
-            'webp_to_pdf': ImageConverter.image_to_pdf,
-            'tiff_to_pdf': ImageConverter.image_to_pdf,
-            'bmp_to_pdf': ImageConverter.image_to_pdf,
-            
-            # ICO conversions
-            'ico_to_png': ImageConverter.standard_convert,
-            'png_to_ico': ImageConverter.png_to_ico,
-        }
         
-        converter_func = converters.get(conversion_key)
-        if converter_func:
-            return await converter_func(input_path, output_path, target_format)
+        converter_name = ImageConverter.CONVERTERS.get(conversion_key)
+        if converter_name:
+            converter_func = getattr(ImageConverter, converter_name)
+            return await converter_func(input_path, output_path, target_format, max_dimension=max_dimension)
         
         # Try standard PIL conversion as fallback
         try:
-            return await ImageConverter.standard_convert(input_path, output_path, target_format)
+            return await ImageConverter.standard_convert(input_path, output_path, target_format,
+                                                         max_dimension=max_dimension)
         except Exception as e:
             raise NotImplementedError(
                 f"Conversion from {source_format} to {target_format} not supported: {str(e)}"
             )
     
     @staticmethod
-    async def jpg_to_png(input_path: str, output_path: str, target_format: str = 'png') -> str:
+    async def jpg_to_png(input_path: str, output_path: str, target_format: str = 'png',
+                         max_dimension: Optional[int] = None) -> str:
         """Convert JPG to PNG"""
-        img = Image.open(input_path)
+        img = ImageConverter._open(input_path, max_dimension)
         # Remove alpha channel if present
         if img.mode in ('RGBA', 'LA', 'P'):
             img = img.convert('RGB')
-        img.save(output_path, 'PNG')
+        ImageConverter._save(img, output_path, 'PNG')
         return output_path
     
     @staticmethod
-    async def png_to_jpg(input_path: str, output_path: str, target_format: str = 'jpg') -> str:
+    async def png_to_jpg(input_path: str, output_path: str, target_format: str = 'jpg',
+                         max_dimension: Optional[int] = None) -> str:
         """Convert PNG to JPG"""
-        img = Image.open(input_path)
+        img = ImageConverter._open(input_path, max_dimension)
         # Convert RGBA to RGB
         if img.mode in ('RGBA', 'LA', 'P'):
             rgb_img = Image.new('RGB', img.size, (255, 255, 255))
@@ -100,20 +235,22 @@ class ImageConverter:
             img = rgb_img
         elif img.mode != 'RGB':
             img = img.convert('RGB')
-        img.save(output_path, 'JPEG', quality=95)
+        ImageConverter._save(img, output_path, 'JPEG', quality=95)
         return output_path
     
     @staticmethod
-    async def to_webp(input_path: str, output_path: str, target_format: str = 'webp') -> str:
+    async def to_webp(input_path: str, output_path: str, target_format: str = 'webp',
+                      max_dimension: Optional[int] = None) -> str:
         """Convert any image to WebP"""
-        img = Image.open(input_path)
-        img.save(output_path, 'WEBP', quality=90)
+        img = ImageConverter._open(input_path, max_dimension)
+        ImageConverter._save(img, output_path, 'WEBP', quality=90)
         return output_path
     
     @staticmethod
-    async def from_webp(input_path: str, output_path: str, target_format: str) -> str:
+    async def from_webp(input_path: str, output_path: str, target_format: str,
+                        max_dimension: Optional[int] = None) -> str:
         """Convert WebP to other formats"""
-        img = Image.open(input_path)
+        img = ImageConverter._open(input_path, max_dimension)
         if target_format.upper() == 'JPG' or target_format.upper() == 'JPEG':
             if img.mode in ('RGBA', 'LA', 'P'):
                 rgb_img = Image.new('RGB', img.size, (255, 255, 255))
@@ -121,15 +258,16 @@ class ImageConverter:
                     img = img.convert('RGBA')
                 rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
                 img = rgb_img
-            img.save(output_path, 'JPEG', quality=95)
+            ImageConverter._save(img, output_path, 'JPEG', quality=95)
         else:
-            img.save(output_path, target_format.upper())
+            ImageConverter._save(img, output_path, target_format.upper())
         return output_path
     
     @staticmethod
-    async def standard_convert(input_path: str, output_path: str, target_format: str) -> str:
+    async def standard_convert(input_path: str, output_path: str, target_format: str,
+                               max_dimension: Optional[int] = None) -> str:
         """Standard PIL-based conversion"""
-        img = Image.open(input_path)
+        img = ImageConverter._open(input_path, max_dimension)
         
         # Handle alpha channel for formats that don't support it
         if target_format.lower() in ('jpg', 'jpeg', 'bmp') and img.mode in ('RGBA', 'LA', 'P'):
@@ -141,6 +279,8 @@ class ImageConverter:
             else:
                 rgb_img.paste(img)
             img = rgb_img
+        elif target_format.lower() in ('jpg', 'jpeg') and img.mode not in ('L', 'RGB', 'CMYK'):
+            img = img.convert('RGB')  # e.g. 16-bit greyscale TIFFs
         
         # Save with appropriate format
         save_format = target_format.upper()
@@ -148,14 +288,15 @@ class ImageConverter:
             save_format = 'JPEG'
         
         if save_format == 'JPEG':
-            img.save(output_path, save_format, quality=95)
+            ImageConverter._save(img, output_path, save_format, quality=95)
         else:
-            img.save(output_path, save_format)
+            ImageConverter._save(img, output_path, save_format)
         
         return output_path
     
     @staticmethod
-    async def heic_to_jpg(input_path: str, output_path: str, target_format: str = 'jpg') -> str:
+    async def heic_to_jpg(input_path: str, output_path: str, target_format: str = 'jpg',
+                          max_dimension: Optional[int] = None) -> str:
         """Convert HEIC to JPG"""
         try:
             import pillow_heif
@@ -164,17 +305,19 @@ class ImageConverter:
                 heif_file.mode, heif_file.size, heif_file.data,
                 "raw", heif_file.mode, heif_file.stride
             )
-            img.save(output_path, 'JPEG', quality=95)
+            img = ImageConverter._fit(img, max_dimension)
+            ImageConverter._save(img, output_path, 'JPEG', quality=95)
             return output_path
         except ImportError:
             # Fallback to Pillow if pillow-heif not available
-            img = Image.open(input_path)
+            img = ImageConverter._open(input_path, max_dimension)
             img = img.convert('RGB')
-            img.save(output_path, 'JPEG', quality=95)
+            ImageConverter._save(img, output_path, 'JPEG', quality=95)
             return output_path
     
     @staticmethod
-    async def heic_to_png(input_path: str, output_path: str, target_format: str = 'png') -> str:
+    async def heic_to_png(input_path: str, output_path: str, target_format: str = 'png',
+                          max_dimension: Optional[int] = None) -> str:
         """Convert HEIC to PNG"""
         try:
             import pillow_heif
@@ -183,15 +326,17 @@ class ImageConverter:
                 heif_file.mode, heif_file.size, heif_file.data,
                 "raw", heif_file.mode, heif_file.stride
             )
-            img.save(output_path, 'PNG')
+            img = ImageConverter._fit(img, max_dimension)
+            ImageConverter._save(img, output_path, 'PNG')
             return output_path
         except ImportError:
-            img = Image.open(input_path)
-            img.save(output_path, 'PNG')
+            img = ImageConverter._open(input_path, max_dimension)
+            ImageConverter._save(img, output_path, 'PNG')
             return output_path
     
     @staticmethod
-    async def svg_to_raster(input_path: str, output_path: str, target_format: str) -> str:
+    async def svg_to_raster(input_path: str, output_path: str, target_format: str,
+                            max_dimension: Optional[int] = None) -> str:
         """Convert SVG to PNG/JPG using cairosvg"""
         if not CAIROSVG_AVAILABLE:
             raise NotImplementedError("SVG conversion requires Cairo library. Install GTK+ on Windows or cairo on Linux/Mac.")
@@ -199,45 +344,45 @@ class ImageConverter:
         # First convert SVG to PNG
         png_data = cairosvg.svg2png(url=input_path, scale=2.0)
         
-        if target_format.lower() in ('png',):
+        if target_format.lower() in ('png',) and not max_dimension:
             with open(output_path, 'wb') as f:
                 f.write(png_data)
+        elif target_format.lower() in ('png',):
+            img = ImageConverter._open(io.BytesIO(png_data), max_dimension)
+            ImageConverter._save(img, output_path, 'PNG')
         else:
             # Convert PNG to JPG
-            img = Image.open(io.BytesIO(png_data))
+            img = ImageConverter._open(io.BytesIO(png_data), max_dimension)
             if img.mode in ('RGBA', 'LA'):
                 rgb_img = Image.new('RGB', img.size, (255, 255, 255))
                 rgb_img.paste(img, mask=img.split()[-1])
                 img = rgb_img
-            img.save(output_path, 'JPEG', quality=95)
+            ImageConverter._save(img, output_path, 'JPEG', quality=95)
         
         return output_path
     
     @staticmethod
-    async def image_to_pdf(input_path: str, output_path: str, target_format: str = 'pdf') -> str:
-        """Convert any image to PDF"""
-        img = Image.open(input_path)
+    async def image_to_pdf(input_path: str, output_path: str, target_format: str = 'pdf',
+                           max_dimension: Optional[int] = None) -> str:
+        """
+        Convert any image to PDF.
         
-        # Convert to RGB if needed
-        if img.mode in ('RGBA', 'LA', 'P'):
-            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            if img.mode in ('RGBA', 'LA'):
-                if 'transparency' in img.info:
-                    rgb_img.paste(img, mask=img.split()[-1])
-                else:
-                    rgb_img.paste(img)
-            img = rgb_img
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
+        The image is placed on a letter page. JPEG and JPEG 2000 files are
+        embedded as they are, without decoding; other images are decoded at
+        no more than ``image_pdf_dpi`` at their printed size, so large
+        photos are not decoded in full (see ``ImagePdfConverter``).
+        """
+        from app.services.image_pdf import ImagePdfConverter
         
-        # Create PDF
-        c = pdf_canvas.Canvas(output_path, pagesize=letter)
-        width, height = letter
+        return ImagePdfConverter.write([input_path], output_path, max_dimension)
+    
+    @staticmethod
+    def _page_layout(size: Tuple[int, int]) -> Tuple[float, float, float, float]:
+        """(x, y, width, height) in points of an image of ``size`` scaled to fit a letter page, centred"""
+        width, height = pagesizes.letter
         
         # Scale image to fit page
-        img_width, img_height = img.size
+        img_width, img_height = size
         aspect = img_height / float(img_width)
         
         if aspect > 1:  # Portrait
@@ -250,22 +395,52 @@ class ImageConverter:
         # Center image
         x = (width - display_width) / 2
         y = (height - display_height) / 2
+        return x, y, display_width, display_height
+    
+    @staticmethod
+    async def convert_raster(input_path: str, output_path: str, target_format: str,
+                             quality: Optional[int] = None, max_dimension: Optional[int] = None,
+                             color_mode: Optional[str] = None) -> str:
+        """
+        Convert any image Pillow can read to a raster format in RASTER_FORMATS.
         
-        # Draw image
-        img_reader = ImageReader(img)
-        c.drawImage(img_reader, x, y, display_width, display_height)
-        c.save()
+        Used for bulk conversions, where one set of settings applies to every
+        file: ``quality`` (JPEG and WebP) and ``max_dimension``, and for
+        conversions to a given ``color_mode``.
+        """
+        save_format = ImageConverter.RASTER_FORMATS.get(target_format.lower())
+        if save_format is None:
+            raise NotImplementedError(f"Conversion to {target_format} not supported with these options")
+        img = ImageConverter._open(input_path, max_dimension)
+        if color_mode:
+            img = ImageConverter._to_mode(img, color_mode)
         
+        # Flatten transparency onto white for formats without alpha
+        if save_format in ('JPEG', 'BMP') and img.mode in ('RGBA', 'LA', 'P'):
+            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            rgb_img.paste(img, mask=img.split()[-1])
+            img = rgb_img
+        elif save_format == 'JPEG' and img.mode not in ('RGB', 'L', 'CMYK'):
+            img = img.convert('RGB')
+        
+        params = {}
+        if save_format in ImageConverter.DEFAULT_QUALITY:
+            params['quality'] = quality or ImageConverter.DEFAULT_QUALITY[save_format]
+        ImageConverter._save(img, output_path, save_format, **params)
         return output_path
     
     @staticmethod
-    async def png_to_ico(input_path: str, output_path: str, target_format: str = 'ico') -> str:
+    async def png_to_ico(input_path: str, output_path: str, target_format: str = 'ico',
+                         max_dimension: Optional[int] = None) -> str:
         """Convert PNG to ICO"""
-        img = Image.open(input_path)
-        
         # ICO supports multiple sizes, create common sizes
         sizes = [(16, 16), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)]
         
+        # Nothing larger than the biggest icon needs decoding
+        img = ImageConverter._open(input_path, max_dimension, min_size=sizes[-1])
+        
         # Create list of resized images
         images = []
         for size in sizes:
@@ -275,8 +450,10 @@ class ImageConverter:
         
         # Save as ICO with multiple sizes
         if images:
-            images[0].save(output_path, format='ICO', sizes=[img.size for img in images])
+            # Saved from the largest size; the smaller ones are stored as resized above
+            ImageConverter._save(images[-1], output_path, 'ICO', sizes=[img.size for img in images],
+                                 append_images=images[:-1])
         else:
-            img.save(output_path, format='ICO')
+            ImageConverter._save(img, output_path, 'ICO')
         
         return output_path
@@ -0,0 +1,263 @@
+import asyncio
+import io
+import math
+import os
+import shutil
+import time
+import zlib
+from collections import deque
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+from PIL import Image
+from app.config import settings
+from app.services.image_converter import ImageConverter, pagesizes
+from app.services.bulk_images import BulkItem
+from app.utils.executor import ConversionExecutor
+from app.utils.metrics import CONVERSIONS, CONVERSION_SECONDS, stage
+
+# Compressed formats a PDF can hold unchanged: Pillow format -> PDF filter
+PASSTHROUGH_FILTERS = {"JPEG": "DCTDecode", "JPEG2000": "JPXDecode"}
+# PDF colour space of each image mode written to a PDF
+COLOR_SPACES = {"L": "DeviceGray", "RGB": "DeviceRGB", "CMYK": "DeviceCMYK"}
+
+class PdfImage(NamedTuple):
+    """An image ready to be placed on a PDF page"""
+    size: Tuple[int, int]  # pixels
+    entries: str  # image dictionary entries besides /Width, /Height and /Length
+    path: Optional[str]  # file whose bytes are the image stream (passthrough)...
+    data: Optional[bytes]  # ...or the encoded stream
+
+class PdfWriter:
+    """
+    Writes a PDF with one image per page, a page at a time.
+    
+    Each page's objects are written to ``stream`` as soon as the page is
+    added, so only their offsets are kept however many pages there are;
+    the page tree, catalog and cross-reference table are written by
+    ``close``. Pages are letter sized with the image scaled to fit, as in
+    ``ImageConverter._page_layout``.
+    """
+    
+    PAGES_ID = 1
+    CATALOG_ID = 2
+    
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._offset = 0
+        self._offsets: Dict[int, int] = {}
+        self._page_ids: List[int] = []
+        self._next_id = 3
+        # Binary comment so that transfer tools treat the file as binary
+        self._write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+    
+    @property
+    def page_count(self) -> int:
+        return len(self._page_ids)
+    
+    def _write(self, data: bytes) -> None:
+        self._stream.write(data)
+        self._offset += len(data)
+    
+    def _begin(self, object_id: int, dictionary: str) -> None:
+        self._offsets[object_id] = self._offset
+        self._write(f"{object_id} 0 obj\n{dictionary}\n".encode("latin-1"))
+    
+    def _object(self, object_id: int, dictionary: str) -> None:
+        self._begin(object_id, dictionary)
+        self._write(b"endobj\n")
+    
+    def _allocate(self) -> int:
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+    
+    def add_page(self, image: PdfImage) -> None:
+        """Write a page showing ``image`` (blocking)"""
+        image_id, content_id, page_id = self._allocate(), self._allocate(), self._allocate()
+        width, height = image.size
+        length = os.path.getsize(image.path) if image.path is not None else len(image.data)
+        
+        self._begin(image_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"{image.entries} /Length {length} >>\nstream"
+        ))
+        if image.path is not None:
+            with stage("embed"):
+                with open(image.path, "rb") as f:
+                    for chunk in iter(lambda: f.read(settings.upload_chunk_size_kb * 1024), b""):
+                        self._write(chunk)
+        else:
+            self._write(image.data)
+        self._write(b"\nendstream\nendobj\n")
+        
+        x, y, display_width, display_height = ImageConverter._page_layout(image.size)
+        content = " ".join([
+            "q", _number(display_width), "0", "0", _number(display_height), _number(x), _number(y), "cm /Im0 Do Q"
+        ]).encode("latin-1")
+        self._begin(content_id, f"<< /Length {len(content)} >>\nstream")
+        self._write(content + b"\nendstream\nendobj\n")
+        
+        page_width, page_height = pagesizes.letter
+        self._object(page_id, (
+            f"<< /Type /Page /Parent {self.PAGES_ID} 0 R "
+            f"/MediaBox [0 0 {_number(page_width)} {_number(page_height)}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ))
+        self._page_ids.append(page_id)
+    
+    def close(self) -> None:
+        """Write the page tree, catalog and cross-reference table (blocking). The stream is left open."""
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._object(self.PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>")
+        self._object(self.CATALOG_ID, f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>")
+        
+        xref_offset = self._offset
+        lines = [f"xref\n0 {self._next_id}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{self._offsets[object_id]:010d} 00000 n \n" for object_id in range(1, self._next_id))
+        lines.append(f"trailer\n<< /Size {self._next_id} /Root {self.CATALOG_ID} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self._write("".join(lines).encode("latin-1"))
+
+class ImagePdfConverter:
+    """
+    Builds PDFs from images, one image per page.
+    
+    JPEG and JPEG 2000 files are embedded byte for byte (the PDF viewer
+    decodes them), so they keep their quality and cost no decoding or
+    encoding. Other images, and any image that has to be scaled down for
+    ``max_dimension``, are decoded at no more than ``image_pdf_dpi`` at
+    their printed size and stored losslessly (Flate).
+    """
+    
+    @staticmethod
+    def _passthrough_entries(img: "Image.Image") -> Optional[str]:
+        """Image dictionary entries for embedding the file as-is, or None if it must be decoded"""
+        filter_name = PASSTHROUGH_FILTERS.get(img.format)
+        if filter_name is None:
+            return None
+        if img.format == "JPEG2000":
+            # The JPEG 2000 stream carries its own colour space and bit depth
+            return f"/Filter /{filter_name}" if img.mode in ("L", "RGB") else None
+        
+        color_space = COLOR_SPACES.get(img.mode)
+        if color_space is None:
+            return None
+        entries = f"/ColorSpace /{color_space} /BitsPerComponent 8 /Filter /{filter_name}"
+        if img.mode == "CMYK" and "adobe" in img.info:
+            # Adobe applications write CMYK JPEGs inverted
+            entries += " /Decode [1 0 1 0 1 0 1 0]"
+        return entries
+    
+    @staticmethod
+    def prepare(path: str, max_dimension: Optional[int] = None) -> PdfImage:
+        """Read an image's header and embed it as-is, or decode and compress it (blocking)"""
+        with Image.open(path) as img:
+            if not max_dimension or max(img.size) <= max_dimension:
+                entries = ImagePdfConverter._passthrough_entries(img)
+                if entries is not None:
+                    return PdfImage(img.size, entries, path, None)
+            return ImagePdfConverter._encode(img, max_dimension)
+    
+    @staticmethod
+    def _encode(img: "Image.Image", max_dimension: Optional[int]) -> PdfImage:
+        _, _, display_width, display_height = ImageConverter._page_layout(img.size)
+        min_size = None
+        if settings.image_pdf_dpi > 0:
+            min_size = (
+                math.ceil(display_width * settings.image_pdf_dpi / 72),
+                math.ceil(display_height * settings.image_pdf_dpi / 72)
+            )
+        img = ImageConverter._decode(img, max_dimension, min_size)
+        
+        # Flatten transparency onto white
+        if img.mode in ('RGBA', 'LA', 'P', 'PA'):
+            if img.mode in ('P', 'PA'):
+                img = img.convert('RGBA')
+            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+            rgb_img.paste(img, mask=img.split()[-1])
+            img = rgb_img
+        elif img.mode not in COLOR_SPACES:
+            img = img.convert('RGB')
+        
+        with stage("encode"):
+            data = zlib.compress(img.tobytes(), 6)
+        entries = f"/ColorSpace /{COLOR_SPACES[img.mode]} /BitsPerComponent 8 /Filter /FlateDecode"
+        return PdfImage(img.size, entries, None, data)
+    
+    @staticmethod
+    def write(input_paths: List[str], output_path: str, max_dimension: Optional[int] = None) -> str:
+        """Write a PDF with a page per image (blocking)"""
+        with open(output_path, "wb") as f:
+            writer = PdfWriter(f)
+            for path in input_paths:
+                writer.add_page(ImagePdfConverter.prepare(path, max_dimension))
+            writer.close()
+        return output_path
+    
+    @staticmethod
+    async def stream(items: List[BulkItem], work_dir: str, max_dimension: Optional[int] = None,
+                     release: Optional[AsyncExitStack] = None) -> AsyncIterator[bytes]:
+        """
+        Assemble ``items`` into one PDF, in order, and yield it as pages are written.
+        
+        Up to ``image_pdf_prefetch_pages`` pages are prepared ahead of the
+        writer on the codec thread pool, which bounds memory however many
+        pages there are. ``work_dir`` is removed, and ``release`` (the
+        request's admission) closed, at the end or when the client goes away.
+        """
+        loop = asyncio.get_running_loop()
+        pool = ConversionExecutor.get_codec_pool()
+        buffer = io.BytesIO()
+        writer = PdfWriter(buffer)
+        pending = deque()
+        next_index = 0
+        started = time.perf_counter()
+        status = "failed"
+        try:
+            while next_index < len(items) or pending:
+                while next_index < len(items) and len(pending) < max(1, settings.image_pdf_prefetch_pages):
+                    pending.append((items[next_index], loop.run_in_executor(
+                        pool, ImagePdfConverter.prepare, items[next_index].path, max_dimension
+                    )))
+                    next_index += 1
+                
+                item, future = pending.popleft()
+                try:
+                    image = await future
+                except Exception as e:
+                    # Headers are sent: all that can be done is to end the response early
+                    print(f"Error adding {item.name} to PDF: {str(e).replace(item.path, item.name)}")
+                    raise
+                await ConversionExecutor.run_in_thread(writer.add_page, image)
+                yield _take(buffer)
+            
+            writer.close()
+            yield _take(buffer)
+            status = "completed"
+        finally:
+            for _, future in pending:
+                future.cancel()
+            CONVERSIONS.inc(category="image", pair="images_to_pdf", status=status)
+            CONVERSION_SECONDS.observe(time.perf_counter() - started, category="image", pair="images_to_pdf")
+            await ConversionExecutor.run_in_thread(shutil.rmtree, work_dir, True)
+            if release is not None:
+                await release.aclose()
+    
+    @staticmethod
+    def check(items: List[BulkItem]) -> None:
+        """Raise ValueError naming the first item that is not a readable image (reads headers only)"""
+        for item in items:
+            try:
+                with Image.open(item.path):
+                    pass
+            except Exception:
+                raise ValueError(f"Not a readable image: {item.name}")
+
+def _number(value: float) -> str:
+    """A PDF number: at most 4 decimals, no trailing zeros"""
+    return f"{value:.4f}".rstrip("0").rstrip(".")
+
+def _take(buffer: io.BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
@@ -0,0 +1,210 @@
+import heapq
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from app.services.document_converter import DocumentConverter
+from app.services.image_converter import ImageConverter
+from app.services.audio_converter import AudioConverter
+from app.services.video_converter import VideoConverter
+from app.services.archive_converter import ArchiveConverter
+from app.services.code_converter import CodeConverter
+from app.services.design_converter import DesignConverter
+from app.services.database_converter import DatabaseConverter
+from app.services.ai_converter import AIConverter
+from app.utils.scratch import ScratchSpace
+
+# Relative cost of one conversion hop per category, used to rank plans
+CATEGORY_COSTS = {
+    "code": 1.0,
+    "database": 1.0,
+    "image": 1.0,
+    "document": 2.0,
+    "archive": 2.0,
+    "design": 2.0,
+    "audio": 4.0,
+    "ai": 10.0,
+    "video": 20.0,
+}
+
+# Plans longer than this are not considered
+MAX_PLAN_HOPS = 3
+
+class ConversionStep(NamedTuple):
+    """One hop of a conversion plan"""
+    source_format: str
+    target_format: str
+    category: str
+    converter: type
+    cost: float
+    
+    def describe(self) -> str:
+        return f"{self.source_format} -> {self.target_format} ({self.category})"
+
+class ConversionPlan(NamedTuple):
+    """Ordered list of hops that turns the source format into the target format"""
+    steps: Tuple[ConversionStep, ...]
+    
+    @property
+    def cost(self) -> float:
+        return sum(step.cost for step in self.steps)
+    
+    @property
+    def category(self) -> str:
+        """Category of the most expensive hop (selects the execution pool)"""
+        return max(self.steps, key=lambda step: step.cost).category
+    
+    @property
+    def version(self) -> str:
+        return "+".join(f"{step.converter.__name__}:{getattr(step.converter, 'VERSION', '1')}" for step in self.steps)
+    
+    def describe(self) -> List[str]:
+        return [step.describe() for step in self.steps]
+
+class ConversionRegistry:
+    """Global graph of direct conversions, with a shortest-cost path planner over it"""
+    
+    def __init__(self):
+        self._edges: Dict[str, Dict[str, ConversionStep]] = {}
+    
+    def register(self, category: str, converter: type,
+                 pairs: Iterable[Tuple[str, str]], cost: Optional[float] = None) -> None:
+        """Register direct conversions; the cheapest converter wins for duplicate pairs"""
+        cost = cost if cost is not None else CATEGORY_COSTS.get(category, 1.0)
+        for source, target in pairs:
+            source, target = normalize_format(source), normalize_format(target)
+            if source == target:
+                continue
+            step = ConversionStep(source, target, category, converter, cost)
+            existing = self._edges.setdefault(source, {}).get(target)
+            if existing is None or existing.cost > cost:
+                self._edges[source][target] = step
+    
+    def register_keys(self, category: str, converter: type, cost: Optional[float] = None) -> None:
+        """Register every "{source}_to_{target}" key of a converter's CONVERTERS table"""
+        self.register(
+            category,
+            converter,
+            (tuple(key.split("_to_", 1)) for key in converter.CONVERTERS),
+            cost
+        )
+    
+    def direct(self, source_format: str, target_format: str) -> Optional[ConversionStep]:
+        return self._edges.get(source_format, {}).get(target_format)
+    
+    def targets(self, source_format: str) -> List[str]:
+        """Every format reachable from source_format within MAX_PLAN_HOPS"""
+        reachable = set()
+        frontier = {source_format}
+        for _ in range(MAX_PLAN_HOPS):
+            frontier = {
+                target
+                for fmt in frontier
+                for target in self._edges.get(fmt, {})
+                if target not in reachable and target != source_format
+            }
+            reachable |= frontier
+        return sorted(reachable)
+    
+    def plan(self, source_format: str, target_format: str) -> Optional[ConversionPlan]:
+        """
+        Find the cheapest chain of converters from source to target (Dijkstra).
+        
+        A direct converter always wins over a chain, since chains can route
+        through lossy intermediates (e.g. image -> pdf -> txt skips OCR).
+        """
+        source_format = normalize_format(source_format)
+        target_format = normalize_format(target_format)
+        if source_format == target_format:
+            return None
+        
+        direct = self.direct(source_format, target_format)
+        if direct is not None:
+            return ConversionPlan((direct,))
+        
+        queue: List[Tuple[float, int, str, Tuple[ConversionStep, ...]]] = [(0.0, 0, source_format, ())]
+        settled = set()
+        counter = 0
+        
+        while queue:
+            cost, _, fmt, steps = heapq.heappop(queue)
+            if fmt == target_format:
+                return ConversionPlan(steps)
+            if fmt in settled or len(steps) >= MAX_PLAN_HOPS:
+                continue
+            settled.add(fmt)
+            
+            for target, step in self._edges.get(fmt, {}).items():
+                if target not in settled:
+                    counter += 1
+                    heapq.heappush(queue, (cost + step.cost, counter, target, steps + (step,)))
+        
+        return None
+
+def normalize_format(file_format: str) -> str:
+    """Collapse format aliases so they share one node in the graph"""
+    file_format = file_format.lower().strip().lstrip('.')
+    return {"jpeg": "jpg", "tif": "tiff", "yml": "yaml"}.get(file_format, file_format)
+
+async def execute_plan(steps: Tuple[ConversionStep, ...], input_path: str, output_path: str) -> str:
+    """
+    Run each hop of a plan in turn, passing intermediates through a scratch directory.
+    
+    Runs inside a single pool worker so intermediates never cross processes.
+    """
+    with ScratchSpace.directory("plan") as work_dir:
+        current_path = input_path
+        for index, step in enumerate(steps):
+            is_last = index == len(steps) - 1
+            step_output = output_path if is_last else os.path.join(
+                work_dir, f"step_{index}.{step.target_format}"
+            )
+            current_path = await step.converter.convert(
+                input_path=current_path,
+                output_path=step_output,
+                source_format=step.source_format,
+                target_format=step.target_format
+            )
+        return current_path
+
+def _build_registry() -> ConversionRegistry:
+    registry = ConversionRegistry()
+    
+    # Table-driven converters
+    registry.register_keys("image", ImageConverter)
+    registry.register_keys("code", CodeConverter)
+    registry.register_keys("database", DatabaseConverter)
+    registry.register_keys("design", DesignConverter)
+    
+    # Converters that route on format checks
+    registry.register("document", DocumentConverter, [
+        ("pdf", "docx"), ("pdf", "doc"), ("pdf", "txt"),
+        ("docx", "pdf"), ("docx", "txt"),
+        ("txt", "pdf"), ("txt", "docx"),
+        ("xlsx", "csv"), ("xls", "csv"), ("xlsx", "pdf"), ("xls", "pdf"),
+        ("csv", "xlsx"), ("csv", "pdf"),
+    ])
+    
+    audio_formats = ["mp3", "wav", "aac", "ogg", "flac", "m4a", "opus", "wma"]
+    audio_targets = ["mp3", "wav", "aac", "ogg", "flac"]
+    video_formats = ["mp4", "mkv", "avi", "mov", "flv", "wmv", "webm"]
+    
+    registry.register("audio", AudioConverter,
+                      [(src, dst) for src in audio_formats for dst in audio_targets])
+    registry.register("audio", AudioConverter, [("txt", "mp3"), ("txt", "wav")])
+    
+    registry.register("video", VideoConverter,
+                      [(src, dst) for src in video_formats for dst in video_formats])
+    registry.register("video", VideoConverter,
+                      [(src, dst) for src in video_formats for dst in ("gif", "mp3", "wav", "aac")])
+    
+    archive_formats = ["zip", "7z", "tar", "gz", "rar"]
+    registry.register("archive", ArchiveConverter,
+                      [(src, dst) for src in archive_formats for dst in ("zip", "7z", "tar", "gz")])
+    
+    registry.register("ai", AIConverter,
+                      [(src, "txt") for src in ("png", "jpg", "tiff", "bmp")])
+    registry.register("ai", AIConverter,
+                      [(src, "json") for src in ("png", "jpg")])
+    
+    return registry
+
+registry = _build_registry()
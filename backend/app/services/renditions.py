@@ -0,0 +1,194 @@
+import asyncio
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, ImageOps
+from app.config import settings
+from app.services.image_converter import ImageConverter
+from app.utils.executor import ConversionExecutor
+from app.utils.metrics import IMAGE_RENDITIONS
+from app.utils.result_cache import ResultCache
+from app.utils.scratch import ScratchSpace
+
+# Rendition formats: extension -> (Pillow format, media type)
+RENDITION_FORMATS = {
+    "jpg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+}
+# Part of every rendition key; bump when renditions of the same parameters would change
+RENDITION_VERSION = "1"
+# The chain stops halving at this size (longer side, pixels)
+MIPMAP_MIN_DIMENSION = 32
+
+class MipmapChain:
+    """
+    A decoded image and its successive halvings, largest first.
+    
+    Each level is a 2x2 box reduction of the one before, so a rendition of
+    any size is resized from the smallest level at least as large as it
+    (at most twice its size), which keeps small renditions cheap and sharp.
+    """
+    
+    def __init__(self, img: "Image.Image"):
+        self.levels: List["Image.Image"] = [img]
+        while max(self.levels[-1].size) // 2 >= MIPMAP_MIN_DIMENSION:
+            self.levels.append(self.levels[-1].reduce(2))
+    
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.levels[0].size
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(level.width * level.height * len(level.getbands()) for level in self.levels)
+    
+    def render(self, size: Tuple[int, int]) -> "Image.Image":
+        """The image at ``size`` (not larger than level 0)"""
+        level = self.levels[0]
+        for candidate in self.levels[1:]:
+            if candidate.width < size[0] or candidate.height < size[1]:
+                break
+            level = candidate
+        if level.size == size:
+            return level
+        return level.resize(size, Image.Resampling.LANCZOS)
+
+class ImageRenditions:
+    """
+    Resized and re-encoded variants of uploaded images, for display.
+    
+    An upload is decoded once into a ``MipmapChain`` (no larger than
+    ``image_rendition_max_dimension``, so huge sources are decoded at
+    reduced resolution), kept in memory in this process while it fits
+    ``image_mipmap_cache_mb``; concurrent requests for the same image share
+    one decode. Encoded renditions are stored in the result cache, keyed
+    on the upload's content hash and the rendition parameters, and evicted
+    with it (least recently used first). Decoding and encoding run on the
+    codec thread pool.
+    """
+    
+    _chains: "OrderedDict[str, MipmapChain]" = OrderedDict()
+    _chain_bytes = 0
+    _building: Dict[str, asyncio.Future] = {}
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(content_hash: str, width: Optional[int], height: Optional[int],
+                 image_format: str, quality: Optional[int]) -> str:
+        """Result cache key of a rendition, also used as its ETag"""
+        return ResultCache.make_key(
+            content_hash,
+            image_format,
+            {"rendition": {"w": width, "h": height, "q": quality}},
+            f"rendition:{RENDITION_VERSION}:{ImageConverter.VERSION}"
+        )
+    
+    @staticmethod
+    def get_size(source_size: Tuple[int, int], width: Optional[int], height: Optional[int]) -> Tuple[int, int]:
+        """Largest size with the source's aspect ratio fitting width x height (never enlarged)"""
+        source_width, source_height = source_size
+        scale = min(
+            1.0,
+            width / source_width if width else 1.0,
+            height / source_height if height else 1.0
+        )
+        return max(1, round(source_width * scale)), max(1, round(source_height * scale))
+    
+    @staticmethod
+    def build_chain(input_path: str) -> MipmapChain:
+        """Decode an image, upright and within image_rendition_max_dimension, into a chain (blocking)"""
+        img = ImageConverter._open(input_path, settings.image_rendition_max_dimension)
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = ImageConverter._to_mode(img, "RGBA" if img.has_transparency_data else "RGB")
+        return MipmapChain(img)
+    
+    @classmethod
+    def _cache_chain(cls, content_hash: str, chain: MipmapChain) -> None:
+        budget = settings.image_mipmap_cache_mb * 1024 * 1024
+        with cls._lock:
+            if content_hash in cls._chains or chain.nbytes > budget:
+                return
+            cls._chains[content_hash] = chain
+            cls._chain_bytes += chain.nbytes
+            while cls._chain_bytes > budget:
+                _, evicted = cls._chains.popitem(last=False)
+                cls._chain_bytes -= evicted.nbytes
+    
+    @classmethod
+    async def get_chain(cls, content_hash: str, input_path: str) -> MipmapChain:
+        """The mipmap chain of an upload, decoding it unless it is cached or being decoded"""
+        with cls._lock:
+            chain = cls._chains.get(content_hash)
+            if chain is not None:
+                cls._chains.move_to_end(content_hash)
+                return chain
+        
+        building = cls._building.get(content_hash)
+        if building is not None:
+            return await asyncio.shield(building)
+        
+        loop = asyncio.get_running_loop()
+        building = loop.run_in_executor(ConversionExecutor.get_codec_pool(), cls.build_chain, input_path)
+        cls._building[content_hash] = building
+        try:
+            chain = await asyncio.shield(building)
+        finally:
+            cls._building.pop(content_hash, None)
+        cls._cache_chain(content_hash, chain)
+        return chain
+    
+    @staticmethod
+    def encode(chain: MipmapChain, output_path: str, width: Optional[int], height: Optional[int],
+               image_format: str, quality: Optional[int]) -> str:
+        """Write a rendition from a chain (blocking)"""
+        save_format = RENDITION_FORMATS[image_format][0]
+        img = chain.render(ImageRenditions.get_size(chain.size, width, height))
+        if save_format == "JPEG":
+            img = ImageConverter._to_mode(img, "L" if img.mode in ("L", "LA") else "RGB")
+        
+        params = {}
+        if save_format in ImageConverter.DEFAULT_QUALITY:
+            params["quality"] = quality or settings.image_rendition_default_quality
+        img.save(output_path, save_format, **params)
+        return output_path
+    
+    @classmethod
+    async def render(cls, key: str, content_hash: str, input_path: str, width: Optional[int],
+                     height: Optional[int], image_format: str, quality: Optional[int]) -> Tuple[str, Optional[str]]:
+        """
+        Path of the rendition with ``key``, and a directory for the caller to remove after sending it.
+        
+        The rendition is taken from the result cache, or made and added to
+        it. With the result cache disabled (or a rendition too large for
+        it) it is made every time, in a scratch directory that is returned.
+        """
+        use_cache = settings.result_cache_enabled
+        if use_cache:
+            cached_path = await ConversionExecutor.run_in_thread(ResultCache.lookup, key)
+            if cached_path is not None:
+                IMAGE_RENDITIONS.inc(result="cached")
+                return cached_path, None
+        IMAGE_RENDITIONS.inc(result="rendered")
+        
+        chain = await cls.get_chain(content_hash, input_path)
+        _, work_dir = await ConversionExecutor.run_in_thread(ScratchSpace.create)
+        try:
+            output_path = os.path.join(work_dir, f"{key}.{image_format}")
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                ConversionExecutor.get_codec_pool(),
+                cls.encode, chain, output_path, width, height, image_format, quality
+            )
+            if use_cache:
+                cached_path = await ConversionExecutor.run_in_thread(ResultCache.store, key, output_path)
+                if cached_path is not None and os.path.exists(cached_path):
+                    await ConversionExecutor.run_in_thread(shutil.rmtree, work_dir, True)
+                    return cached_path, None
+        except BaseException:
+            await ConversionExecutor.run_in_thread(shutil.rmtree, work_dir, True)
+            raise
+        return output_path, work_dir
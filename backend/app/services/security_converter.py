@@ -5,12 +5,17 @@ from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
-import PyPDF2
 from typing import Optional
+from app.utils.lazy_import import lazy_import
+from app.utils.metrics import stage
+
+PyPDF2 = lazy_import("PyPDF2")
 
 class SecurityConverter:
     """Handles security, encoding, and encryption conversions"""
     
+    VERSION = "1"
+    
     @staticmethod
     async def convert(input_path: str, output_path: str, 
                      source_format: str, target_format: str, **kwargs) -> str:
@@ -45,51 +50,59 @@ class SecurityConverter:
     @staticmethod
     async def file_to_base64(input_path: str, output_path: str) -> str:
         """Encode file to Base64"""
-        with open(input_path, 'rb') as f:
-            file_data = f.read()
+        with stage("decode"):
+            with open(input_path, 'rb') as f:
+                file_data = f.read()
         
-        encoded = base64.b64encode(file_data).decode('utf-8')
+        with stage("encode"):
+            encoded = base64.b64encode(file_data).decode('utf-8')
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(encoded)
+        with stage("output_write"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(encoded)
         
         return output_path
     
     @staticmethod
     async def base64_to_file(input_path: str, output_path: str) -> str:
         """Decode Base64 to file"""
-        with open(input_path, 'r', encoding='utf-8') as f:
-            encoded = f.read()
-        
-        decoded = base64.b64decode(encoded)
+        with stage("decode"):
+            with open(input_path, 'r', encoding='utf-8') as f:
+                encoded = f.read()
+            
+            decoded = base64.b64decode(encoded)
         
-        with open(output_path, 'wb') as f:
-            f.write(decoded)
+        with stage("output_write"):
+            with open(output_path, 'wb') as f:
+                f.write(decoded)
         
         return output_path
     
     @staticmethod
     async def generate_hash(input_path: str, output_path: str, algorithm: str = 'sha256') -> str:
         """Generate hash of file"""
-        with open(input_path, 'rb') as f:
-            file_data = f.read()
-        
-        if algorithm.lower() == 'md5':
-            hash_obj = hashlib.md5(file_data)
-        elif algorithm.lower() == 'sha256':
-            hash_obj = hashlib.sha256(file_data)
-        elif algorithm.lower() == 'sha1':
-            hash_obj = hashlib.sha1(file_data)
-        elif algorithm.lower() == 'sha512':
-            hash_obj = hashlib.sha512(file_data)
-        else:
-            raise ValueError(f"Unsupported hash algorithm: {algorithm}")
-        
-        hash_value = hash_obj.hexdigest()
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(f"{algorithm.upper()}: {hash_value}\n")
-            f.write(f"File: {os.path.basename(input_path)}\n")
+        with stage("decode"):
+            with open(input_path, 'rb') as f:
+                file_data = f.read()
+        
+        with stage("hash"):
+            if algorithm.lower() == 'md5':
+                hash_obj = hashlib.md5(file_data)
+            elif algorithm.lower() == 'sha256':
+                hash_obj = hashlib.sha256(file_data)
+            elif algorithm.lower() == 'sha1':
+                hash_obj = hashlib.sha1(file_data)
+            elif algorithm.lower() == 'sha512':
+                hash_obj = hashlib.sha512(file_data)
+            else:
+                raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+            
+            hash_value = hash_obj.hexdigest()
+        
+        with stage("output_write"):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(f"{algorithm.upper()}: {hash_value}\n")
+                f.write(f"File: {os.path.basename(input_path)}\n")
         
         return output_path
     
@@ -108,13 +121,16 @@ class SecurityConverter:
         
         fernet = Fernet(key)
         
-        with open(input_path, 'rb') as f:
-            file_data = f.read()
+        with stage("decode"):
+            with open(input_path, 'rb') as f:
+                file_data = f.read()
         
-        encrypted = fernet.encrypt(file_data)
+        with stage("encrypt"):
+            encrypted = fernet.encrypt(file_data)
         
-        with open(output_path, 'wb') as f:
-            f.write(encrypted)
+        with stage("output_write"):
+            with open(output_path, 'wb') as f:
+                f.write(encrypted)
         
         return output_path
     
@@ -133,23 +149,27 @@ class SecurityConverter:
         
         fernet = Fernet(key)
         
-        with open(input_path, 'rb') as f:
-            encrypted_data = f.read()
+        with stage("decode"):
+            with open(input_path, 'rb') as f:
+                encrypted_data = f.read()
         
-        try:
-            decrypted = fernet.decrypt(encrypted_data)
-        except Exception:
-            raise ValueError("Decryption failed. Check password.")
+        with stage("decrypt"):
+            try:
+                decrypted = fernet.decrypt(encrypted_data)
+            except Exception:
+                raise ValueError("Decryption failed. Check password.")
         
-        with open(output_path, 'wb') as f:
-            f.write(decrypted)
+        with stage("output_write"):
+            with open(output_path, 'wb') as f:
+                f.write(decrypted)
         
         return output_path
     
     @staticmethod
     async def lock_pdf(input_path: str, output_path: str, password: str) -> str:
         """Password-protect a PDF"""
-        pdf_reader = PyPDF2.PdfReader(input_path)
+        with stage("decode"):
+            pdf_reader = PyPDF2.PdfReader(input_path)
         pdf_writer = PyPDF2.PdfWriter()
         
         for page in pdf_reader.pages:
@@ -157,15 +177,17 @@ class SecurityConverter:
         
         pdf_writer.encrypt(password)
         
-        with open(output_path, 'wb') as f:
-            pdf_writer.write(f)
+        with stage("encode"):
+            with open(output_path, 'wb') as f:
+                pdf_writer.write(f)
         
         return output_path
     
     @staticmethod
     async def unlock_pdf(input_path: str, output_path: str, password: str) -> str:
         """Remove password protection from PDF"""
-        pdf_reader = PyPDF2.PdfReader(input_path)
+        with stage("decode"):
+            pdf_reader = PyPDF2.PdfReader(input_path)
         
         if pdf_reader.is_encrypted:
             if not pdf_reader.decrypt(password):
@@ -176,7 +198,8 @@ class SecurityConverter:
         for page in pdf_reader.pages:
             pdf_writer.add_page(page)
         
-        with open(output_path, 'wb') as f:
-            pdf_writer.write(f)
+        with stage("encode"):
+            with open(output_path, 'wb') as f:
+                pdf_writer.write(f)
         
         return output_path
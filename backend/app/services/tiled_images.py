@@ -0,0 +1,298 @@
+import struct
+import zlib
+from itertools import islice
+from typing import Iterator, NamedTuple, Optional, Tuple
+from PIL import Image
+from app.config import settings
+from app.services.image_converter import ImageConverter
+from app.utils.lazy_import import LazyImporter, lazy_import
+from app.utils.metrics import stage
+
+np = lazy_import("numpy")
+tifffile = lazy_import("tifffile")
+png = lazy_import("png")  # pypng
+
+# Formats read and written in bands: extension -> optional module needed to read it
+TILED_SOURCES = {"tiff": "tifffile", "tif": "tifffile", "png": "png"}
+TILED_TARGETS = {"tiff", "tif", "png"}
+
+# Samples per pixel of the modes handled in bands
+MODE_SAMPLES = {"L": 1, "I;16": 1, "LA": 2, "RGB": 3, "RGBA": 4, "CMYK": 4}
+# PNG colour type and bit depth per mode
+PNG_MODES = {"L": (0, 8), "I;16": (0, 16), "LA": (4, 8), "RGB": (2, 8), "RGBA": (6, 8)}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# TIFF photometric interpretation per mode
+TIFF_PHOTOMETRIC = {"L": "minisblack", "I;16": "minisblack", "LA": "minisblack",
+                    "RGB": "rgb", "RGBA": "rgb", "CMYK": "separated"}
+
+# Room left in a classic TIFF for tags and offset tables; larger outputs are written as BigTIFF
+CLASSIC_TIFF_MAX_BYTES = 2 ** 32 - 2 ** 27
+
+class ImageBands(NamedTuple):
+    """A source image read as row bands, top to bottom"""
+    size: Tuple[int, int]
+    mode: str
+    bigtiff: bool
+    bands: Iterator["np.ndarray"]  # (rows, width, samples) arrays
+
+class TiledImageConverter:
+    """
+    Converts very large TIFF and PNG images a band of rows at a time.
+    
+    Decoding a 40k x 40k image with Pillow needs several GB and trips its
+    decompression bomb guard. Here the source is read in bands of
+    ``image_tile_size`` rows (TIFF strips and tiles through tifffile, or
+    memory-mapped when uncompressed; PNG rows through pypng), each band is
+    converted to the output colour mode, flattening transparency onto
+    white where the mode has none, and written out before the next is
+    read: tiled (BigTIFF when needed) TIFF, or PNG. Memory therefore
+    depends on the image width, not on its pixel count.
+    """
+    
+    @staticmethod
+    def get_size(input_path: str, source_format: str) -> Optional[Tuple[int, int]]:
+        """(width, height) from the file header, or None if it cannot be read in bands"""
+        if source_format == "png":
+            with open(input_path, "rb") as f:
+                header = f.read(29)
+            if len(header) < 29 or not header.startswith(PNG_SIGNATURE) or header[12:16] != b"IHDR":
+                return None
+            width, height = struct.unpack(">II", header[16:24])
+            return None if header[28] else (width, height)  # interlaced rows are not in order
+        
+        with tifffile.TiffFile(input_path) as tif:
+            page = tif.pages[0]
+            if TiledImageConverter._tiff_mode(page) is None:
+                return None
+            return page.shape[1], page.shape[0]
+    
+    @staticmethod
+    def should_tile(input_path: str, source_format: str, target_format: str,
+                    max_dimension: Optional[int] = None) -> bool:
+        """Whether a conversion is done in bands (large enough, supported formats, reader installed)"""
+        if settings.image_tiled_min_megapixels <= 0 or max_dimension:
+            return False
+        module = TILED_SOURCES.get(source_format)
+        if module is None or target_format not in TILED_TARGETS or not LazyImporter.is_available(module):
+            return False
+        try:
+            size = TiledImageConverter.get_size(input_path, source_format)
+        except Exception:
+            return False  # left to Pillow, which reports what is wrong with the file
+        return size is not None and size[0] * size[1] >= settings.image_tiled_min_megapixels * 1_000_000
+    
+    @staticmethod
+    def _tiff_mode(page) -> Optional[str]:
+        """Mode of the bands read from a TIFF page, or None if it is not handled in bands"""
+        samples = page.samplesperpixel
+        if len(page.shape) != (2 if samples == 1 else 3) or (samples > 1 and page.planarconfig != 1):
+            return None
+        if page.dtype.kind != "u" or page.dtype.itemsize not in (1, 2):
+            return None
+        photometric = int(page.photometric)
+        if photometric == 1 and samples in (1, 2):  # min-is-black
+            if samples == 1:
+                return "I;16" if page.dtype.itemsize == 2 else "L"
+            return "LA"
+        if photometric == 2 and samples in (3, 4):
+            return "RGB" if samples == 3 else "RGBA"
+        if photometric == 5 and samples == 4:
+            return "CMYK"
+        return None
+    
+    @staticmethod
+    def _read_tiff(input_path: str) -> ImageBands:
+        with tifffile.TiffFile(input_path) as tif:
+            page = tif.pages[0]
+            mode = TiledImageConverter._tiff_mode(page)
+            size = (page.shape[1], page.shape[0])
+            bigtiff = tif.is_bigtiff
+        return ImageBands(size, mode, bigtiff, TiledImageConverter._tiff_bands(input_path, mode))
+    
+    @staticmethod
+    def _tiff_bands(input_path: str, mode: str) -> Iterator["np.ndarray"]:
+        rows = settings.image_tile_size
+        with tifffile.TiffFile(input_path) as tif:
+            page = tif.pages[0]
+            height, width = page.shape[:2]
+            samples = page.samplesperpixel
+            
+            if page.is_memmappable:
+                # Uncompressed and contiguous: any band is a slice of the mapped file
+                data = page.asarray(out="memmap")
+                for y in range(0, height, rows):
+                    yield _reduce_depth(np.asarray(data[y:y + rows]).reshape(-1, width, samples), mode)
+                return
+            
+            # Strips are bands already; tiles are joined into bands one row of tiles at a time
+            band, band_y = None, 0
+            for segment, index, shape in page.segments():
+                y, x = index[2], index[3]
+                if band is not None and y != band_y:
+                    yield _reduce_depth(band, mode)
+                    band = None
+                if band is None:
+                    band_y = y
+                    band = np.zeros((min(shape[1], height - y), width, samples), page.dtype)
+                if segment is None:
+                    continue  # sparse file: missing tiles are blank
+                segment = segment.reshape(shape[1], shape[2], samples)
+                band[:, x:x + shape[2]] = segment[:band.shape[0], :width - x]
+            if band is not None:
+                yield _reduce_depth(band, mode)
+    
+    @staticmethod
+    def _read_png(input_path: str) -> ImageBands:
+        width, height, rows, info = png.Reader(filename=input_path).asDirect()
+        planes, bitdepth = info["planes"], info["bitdepth"]
+        mode = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}[planes]
+        if bitdepth == 16 and planes == 1:
+            mode = "I;16"
+        
+        def bands() -> Iterator["np.ndarray"]:
+            dtype = np.uint16 if bitdepth > 8 else np.uint8
+            while True:
+                chunk = list(islice(rows, settings.image_tile_size))
+                if not chunk:
+                    return
+                band = np.array(chunk, dtype).reshape(len(chunk), width, planes)
+                if bitdepth < 8:
+                    band = band * (255 // (2 ** bitdepth - 1))
+                yield _reduce_depth(band, mode)
+        
+        return ImageBands((width, height), mode, False, bands())
+    
+    @staticmethod
+    def _rechunk(bands: Iterator["np.ndarray"], rows: int) -> Iterator["np.ndarray"]:
+        """The same rows as ``bands``, regrouped into bands of exactly ``rows`` rows (the last may be shorter)"""
+        pending = []
+        pending_rows = 0
+        for band in bands:
+            pending.append(band)
+            pending_rows += len(band)
+            if pending_rows < rows:
+                continue
+            joined = np.concatenate(pending) if len(pending) > 1 else pending[0]
+            for y in range(0, len(joined) - rows + 1, rows):
+                yield joined[y:y + rows]
+            rest = len(joined) % rows
+            pending = [joined[len(joined) - rest:]] if rest else []
+            pending_rows = rest
+        if pending_rows:
+            yield np.concatenate(pending) if len(pending) > 1 else pending[0]
+    
+    @staticmethod
+    def _convert_bands(bands: Iterator["np.ndarray"], mode: str, target_mode: str) -> Iterator["np.ndarray"]:
+        """Bands in ``target_mode``; transparency is flattened onto white when it has no alpha"""
+        while True:
+            with stage("decode"):
+                band = next(bands, None)
+            if band is None:
+                return
+            if mode == target_mode:
+                yield band
+                continue
+            with stage("color"):
+                band_mode = mode
+                if mode == "I;16":
+                    band, band_mode = (band >> 8).astype(np.uint8), "L"
+                img = Image.fromarray(band[:, :, 0] if band.shape[2] == 1 else band, band_mode)
+                converted = np.asarray(ImageConverter._to_mode(img, target_mode))
+                band = converted.reshape(converted.shape[0], converted.shape[1], MODE_SAMPLES[target_mode])
+            yield band
+    
+    @staticmethod
+    def _write_tiff(bands: Iterator["np.ndarray"], output_path: str, size: Tuple[int, int],
+                    mode: str, bigtiff: bool) -> None:
+        tile = settings.image_tile_size
+        width, height = size
+        samples = MODE_SAMPLES[mode]
+        dtype = np.uint16 if mode == "I;16" else np.uint8
+        
+        def tiles() -> Iterator["np.ndarray"]:
+            # Tiles are written row by row and padded to full size at the right and bottom edges
+            for band in bands:
+                for x in range(0, width, tile):
+                    block = band[:, x:x + tile]
+                    if block.shape[:2] != (tile, tile):
+                        padded = np.zeros((tile, tile, samples), dtype)
+                        padded[:block.shape[0], :block.shape[1]] = block
+                        block = padded
+                    yield block if samples > 1 else block[:, :, 0]
+        
+        with tifffile.TiffWriter(output_path, bigtiff=bigtiff) as writer:
+            writer.write(
+                tiles(),
+                shape=(height, width, samples) if samples > 1 else (height, width),
+                dtype=dtype,
+                photometric=TIFF_PHOTOMETRIC[mode],
+                extrasamples=("unassalpha",) if mode in ("LA", "RGBA") else None,
+                tile=(tile, tile),
+                compression="zlib"
+            )
+    
+    @staticmethod
+    def _write_png(bands: Iterator["np.ndarray"], output_path: str, size: Tuple[int, int], mode: str) -> None:
+        color_type, bit_depth = PNG_MODES[mode]
+        compressor = zlib.compressobj(6)
+        previous = None
+        with open(output_path, "wb") as f:
+            f.write(PNG_SIGNATURE)
+            _write_png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", size[0], size[1], bit_depth, color_type, 0, 0, 0))
+            for band in bands:
+                if bit_depth == 16:
+                    band = band.astype(">u2")
+                rows = np.ascontiguousarray(band).view(np.uint8).reshape(len(band), -1)
+                # "Up" filter: each row as the difference from the row above (modulo 256)
+                above = np.empty_like(rows)
+                above[0] = previous if previous is not None else 0
+                above[1:] = rows[:-1]
+                filtered = np.empty((rows.shape[0], rows.shape[1] + 1), np.uint8)
+                filtered[:, 0] = 2
+                np.subtract(rows, above, out=filtered[:, 1:])
+                previous = rows[-1].copy()
+                data = compressor.compress(filtered.tobytes())
+                if data:
+                    _write_png_chunk(f, b"IDAT", data)
+            _write_png_chunk(f, b"IDAT", compressor.flush())
+            _write_png_chunk(f, b"IEND", b"")
+    
+    @staticmethod
+    async def convert(input_path: str, output_path: str, source_format: str, target_format: str,
+                      color_mode: Optional[str] = None) -> str:
+        """Convert a TIFF or PNG to TIFF or PNG in bands, optionally to another colour mode"""
+        if source_format == "png":
+            source = TiledImageConverter._read_png(input_path)
+        else:
+            source = TiledImageConverter._read_tiff(input_path)
+        
+        target_mode = color_mode or source.mode
+        if target_format == "png" and target_mode not in PNG_MODES:
+            target_mode = "RGB"  # CMYK
+        bands = TiledImageConverter._convert_bands(iter(source.bands), source.mode, target_mode)
+        
+        if target_format == "png":
+            TiledImageConverter._write_png(bands, output_path, source.size, target_mode)
+        else:
+            width, height = source.size
+            raw_bytes = width * height * MODE_SAMPLES[target_mode] * (2 if target_mode == "I;16" else 1)
+            TiledImageConverter._write_tiff(
+                TiledImageConverter._rechunk(bands, settings.image_tile_size),
+                output_path,
+                source.size,
+                target_mode,
+                source.bigtiff or raw_bytes > CLASSIC_TIFF_MAX_BYTES
+            )
+        return output_path
+
+def _reduce_depth(band: "np.ndarray", mode: str) -> "np.ndarray":
+    """16-bit samples scaled to 8 bits, except for 16-bit greyscale ("I;16"), which is kept (in native byte order)"""
+    if band.dtype.itemsize == 2:
+        return band.astype(np.uint16, copy=False) if mode == "I;16" else (band >> 8).astype(np.uint8)
+    return band
+
+def _write_png_chunk(f, chunk_type: bytes, data: bytes) -> None:
+    f.write(struct.pack(">I", len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
@@ -1,18 +1,21 @@
-import cv2
 import os
 from typing import List
-import numpy as np
+from app.utils.lazy_import import LazyImporter, lazy_import
+from app.utils.metrics import stage
+from app.utils.progress import moviepy_logger, report_progress
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
 
 # Optional dependency
-try:
-    from moviepy.editor import VideoFileClip, ImageSequenceClip
-    MOVIEPY_AVAILABLE = True
-except ImportError:
-    MOVIEPY_AVAILABLE = False
+moviepy_editor = lazy_import("moviepy.editor")
+MOVIEPY_AVAILABLE = LazyImporter.is_available("moviepy")
 
 class VideoConverter:
     """Handles all video format conversions"""
     
+    VERSION = "1"
+    
     @staticmethod
     async def convert(input_path: str, output_path: str, 
                      source_format: str, target_format: str) -> str:
@@ -37,7 +40,8 @@ class VideoConverter:
     async def convert_video_format(input_path: str, output_path: str, target_format: str) -> str:
         """Convert between video formats"""
         
-        video = VideoFileClip(input_path)
+        with stage("decode"):
+            video = moviepy_editor.VideoFileClip(input_path)
         
         # Set codec based on format
         codec_map = {
@@ -52,13 +56,14 @@ class VideoConverter:
         
         codec = codec_map.get(target_format, 'libx264')
         
-        # Write video file
-        video.write_videofile(
-            output_path,
-            codec=codec,
-            audio_codec='aac',
-            logger=None
-        )
+        # Write video file (frames are decoded as ffmpeg encodes them)
+        with stage("encode"):
+            video.write_videofile(
+                output_path,
+                codec=codec,
+                audio_codec='aac',
+                logger=moviepy_logger({"chunk": 0.1, "t": 0.9})
+            )
         
         video.close()
         return output_path
@@ -68,13 +73,15 @@ class VideoConverter:
                           fps: int = 10, scale: float = 0.5) -> str:
         """Convert video to GIF"""
         
-        video = VideoFileClip(input_path)
+        with stage("decode"):
+            video = moviepy_editor.VideoFileClip(input_path)
         
         # Reduce size and fps for reasonable GIF size
         if scale != 1.0:
             video = video.resize(scale)
         
-        video.write_gif(output_path, fps=fps, logger=None)
+        with stage("encode"):
+            video.write_gif(output_path, fps=fps, logger=moviepy_logger())
         video.close()
         
         return output_path
@@ -83,18 +90,20 @@ class VideoConverter:
     async def video_to_audio(input_path: str, output_path: str, audio_format: str = 'mp3') -> str:
         """Extract audio from video"""
         
-        video = VideoFileClip(input_path)
+        with stage("decode"):
+            video = moviepy_editor.VideoFileClip(input_path)
         audio = video.audio
         
         if audio is None:
             raise ValueError("Video file has no audio track")
         
-        if audio_format == 'mp3':
-            audio.write_audiofile(output_path, codec='libmp3lame', bitrate='320k', logger=None)
-        elif audio_format == 'wav':
-            audio.write_audiofile(output_path, codec='pcm_s16le', logger=None)
-        else:
-            audio.write_audiofile(output_path, logger=None)
+        with stage("encode"):
+            if audio_format == 'mp3':
+                audio.write_audiofile(output_path, codec='libmp3lame', bitrate='320k', logger=moviepy_logger())
+            elif audio_format == 'wav':
+                audio.write_audiofile(output_path, codec='pcm_s16le', logger=moviepy_logger())
+            else:
+                audio.write_audiofile(output_path, logger=moviepy_logger())
         
         video.close()
         return output_path
@@ -108,22 +117,30 @@ class VideoConverter:
         frames_dir = output_path.replace(f'.{image_format}', '_frames')
         os.makedirs(frames_dir, exist_ok=True)
         
-        video = VideoFileClip(input_path)
+        with stage("decode"):
+            video = moviepy_editor.VideoFileClip(input_path)
         frame_count = 0
+        timestamps = np.arange(0, video.duration, 1.0/fps)
         
         # Extract frames at specified fps
-        for t in np.arange(0, video.duration, 1.0/fps):
-            frame = video.get_frame(t)
+        for t in timestamps:
+            with stage("decode"):
+                frame = video.get_frame(t)
             frame_path = os.path.join(frames_dir, f'frame_{frame_count:04d}.{image_format}')
             
-            # Save frame using cv2
-            if image_format.lower() in ('jpg', 'jpeg'):
-                cv2.imwrite(frame_path, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR), 
-                          [cv2.IMWRITE_JPEG_QUALITY, 95])
-            else:
-                cv2.imwrite(frame_path, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            # Encode frame using cv2, then write, so encode and disk time are measured apart
+            with stage("encode"):
+                if image_format.lower() in ('jpg', 'jpeg'):
+                    _, encoded = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR), 
+                                              [cv2.IMWRITE_JPEG_QUALITY, 95])
+                else:
+                    _, encoded = cv2.imencode(f'.{image_format}', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            with stage("output_write"):
+                with open(frame_path, 'wb') as f:
+                    f.write(encoded.tobytes())
             
             frame_count += 1
+            report_progress(frame_count, len(timestamps), f"Frame {frame_count} of {len(timestamps)}")
         
         video.close()
         
@@ -0,0 +1,190 @@
+import asyncio
+import math
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import get_db, Conversion
+from app.utils.metrics import ADMISSION_REJECTIONS, ADMISSION_WAITING
+
+# Weight of the newest conversion in the running average used for Retry-After
+DURATION_SMOOTHING = 0.2
+
+class AdmissionRejected(Exception):
+    """A conversion could not be admitted within its wait limit"""
+    
+    def __init__(self, category: str, reason: str, retry_after: int):
+        super().__init__(f"{category} conversions are at capacity ({reason}), retry in {retry_after}s")
+        self.category = category
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Caps concurrent conversions per category and their combined memory.
+    
+    Every conversion holds a slot of its category and a share of the memory
+    budget, estimated from its input size, while it runs. Callers over
+    capacity wait in line for up to ``admission_queue_timeout_seconds``;
+    once a category already has ``admission_max_queue`` callers waiting,
+    new ones are turned away at once. Limits are per API process.
+    """
+    
+    _running: Dict[str, int] = {}
+    _waiting: Dict[str, int] = {}
+    _memory_in_use_mb: float = 0.0
+    _avg_seconds: Dict[str, float] = {}
+    _condition: Optional[asyncio.Condition] = None
+    _condition_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    @staticmethod
+    def get_limit(category: str) -> int:
+        return max(1, settings.category_concurrency.get(category, settings.category_concurrency_default))
+    
+    @staticmethod
+    def estimate_memory_mb(category: str, input_mb: float) -> float:
+        """Working memory a conversion is expected to need, capped at the whole budget"""
+        multiplier = settings.admission_memory_multipliers.get(
+            category, settings.admission_memory_multiplier_default
+        )
+        return min(float(settings.admission_memory_budget_mb), input_mb * multiplier)
+    
+    @classmethod
+    def _get_condition(cls) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if cls._condition is None or cls._condition_loop is not loop:
+            cls._condition = asyncio.Condition()
+            cls._condition_loop = loop
+        return cls._condition
+    
+    @classmethod
+    def _has_capacity(cls, category: str, memory_mb: float) -> bool:
+        if cls._running.get(category, 0) >= cls.get_limit(category):
+            return False
+        # A conversion may always run alone, however large its estimate
+        return cls._memory_in_use_mb == 0 or cls._memory_in_use_mb + memory_mb <= settings.admission_memory_budget_mb
+    
+    @classmethod
+    def retry_after(cls, category: str) -> int:
+        """Seconds until a slot is likely to free up, from recent conversion durations"""
+        average = cls._avg_seconds.get(category, 1.0)
+        ahead = cls._waiting.get(category, 0) + 1
+        return max(1, math.ceil(average * ahead / cls.get_limit(category)))
+    
+    @classmethod
+    @asynccontextmanager
+    async def admit(cls, category: str, input_mb: float = 0.0,
+                    wait_forever: bool = False) -> AsyncIterator[None]:
+        """
+        Hold a slot and a memory reservation for the duration of a conversion.
+        
+        Args:
+            category: Conversion category
+            input_mb: Input file size, used to estimate memory
+            wait_forever: Wait however long it takes instead of giving up
+                (background jobs, which have nobody to send a 503 to)
+        
+        Raises:
+            AdmissionRejected: The queue is full, or capacity did not free up in time
+        """
+        if not settings.admission_enabled:
+            yield
+            return
+        
+        timeout = None if wait_forever else settings.admission_queue_timeout_seconds
+        memory_mb = cls.estimate_memory_mb(category, input_mb)
+        condition = cls._get_condition()
+        
+        async with condition:
+            if not cls._has_capacity(category, memory_mb):
+                if timeout is not None and cls._waiting.get(category, 0) >= settings.admission_max_queue:
+                    ADMISSION_REJECTIONS.inc(category=category, reason="queue_full")
+                    raise AdmissionRejected(category, "queue full", cls.retry_after(category))
+                
+                cls._waiting[category] = cls._waiting.get(category, 0) + 1
+                ADMISSION_WAITING.inc(category=category)
+                try:
+                    await asyncio.wait_for(
+                        condition.wait_for(lambda: cls._has_capacity(category, memory_mb)),
+                        timeout
+                    )
+                except asyncio.TimeoutError:
+                    ADMISSION_REJECTIONS.inc(category=category, reason="timeout")
+                    raise AdmissionRejected(category, "wait timed out", cls.retry_after(category))
+                finally:
+                    cls._waiting[category] -= 1
+                    ADMISSION_WAITING.dec(category=category)
+            
+            cls._running[category] = cls._running.get(category, 0) + 1
+            cls._memory_in_use_mb += memory_mb
+        
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            previous = cls._avg_seconds.get(category, elapsed)
+            cls._avg_seconds[category] = previous + DURATION_SMOOTHING * (elapsed - previous)
+            
+            async with condition:
+                cls._running[category] -= 1
+                cls._memory_in_use_mb = max(0.0, cls._memory_in_use_mb - memory_mb)
+                condition.notify_all()
+    
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """Running and waiting conversions per category, plus memory reserved"""
+        categories = set(cls._running) | set(cls._waiting) | set(settings.category_concurrency)
+        return {
+            "memory_in_use_mb": round(cls._memory_in_use_mb, 1),
+            "memory_budget_mb": settings.admission_memory_budget_mb,
+            "max_queue": settings.admission_max_queue,
+            "categories": {
+                category: {
+                    "running": cls._running.get(category, 0),
+                    "waiting": cls._waiting.get(category, 0),
+                    "limit": cls.get_limit(category),
+                    "avg_seconds": round(cls._avg_seconds.get(category, 0.0), 2)
+                }
+                for category in sorted(categories)
+            }
+        }
+
+@asynccontextmanager
+async def admit_request(category: str, input_mb: float) -> AsyncIterator[None]:
+    """``AdmissionController.admit`` for request handlers: rejections become a 503 with Retry-After"""
+    try:
+        async with AdmissionController.admit(category, input_mb):
+            yield
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def admission(category: str):
+    """Route dependency that admits the conversion named by the ``conversion_id`` path parameter"""
+    async def dependency(conversion_id: int, db: Session = Depends(get_db)):
+        conversion = db.query(Conversion).filter(Conversion.id == conversion_id).first()
+        async with admit_request(category, (conversion.file_size or 0.0) if conversion else 0.0):
+            yield
+    
+    return dependency
+
+def body_admission(category: str):
+    """
+    Route dependency that admits a conversion of the request body itself (routes without a ``conversion_id``).
+    
+    Memory is estimated from Content-Length. The dependency yields an
+    ``AsyncExitStack`` holding the admission, released when the request is
+    done; FastAPI gets there before a ``StreamingResponse`` has run, so a
+    route that converts while streaming takes the admission over with
+    ``pop_all()`` and closes the returned stack when the stream ends.
+    """
+    async def dependency(request: Request):
+        content_length = request.headers.get("content-length", "")
+        input_mb = int(content_length) / (1024 * 1024) if content_length.isdigit() else 0.0
+        async with AsyncExitStack() as stack:
+            await stack.enter_async_context(admit_request(category, input_mb))
+            yield stack
+    
+    return dependency
@@ -1,34 +1,284 @@
 import asyncio
+import heapq
 import os
-from datetime import datetime, timedelta
+import shutil
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
 from app.utils.file_handler import FileHandler
+from app.utils.result_cache import ResultCache
+from app.utils.resumable_upload import ResumableUploads, PARTIAL_SUFFIX
+from app.utils.single_flight import SingleFlight
+from app.utils.storage import Storage
+from app.utils.scratch import ScratchSpace
 from app.config import settings
+from app.database import SessionLocal, CacheEntry, Conversion, ConversionJob, get_expiry
+
+class ExpiryScheduler:
+    """
+    Deletes conversion files and rows when their ``expires_at`` passes.
+    
+    Deadlines live in an in-memory min-heap so the task sleeps until exactly
+    the next expiry. The heap is only a hint: every popped entry is checked
+    against the row, so refreshed deadlines are re-queued and rows created by
+    other processes are picked up by a periodic indexed sweep.
+    """
+    
+    _heap: List[Tuple[datetime, int]] = []
+    _lock = threading.Lock()
+    _wakeup: Optional[asyncio.Event] = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    @classmethod
+    def schedule(cls, conversion_id: int, expires_at: Optional[datetime]) -> None:
+        """Track a conversion's deadline (call after the row is committed)"""
+        if expires_at is None:
+            return
+        with cls._lock:
+            heapq.heappush(cls._heap, (expires_at, conversion_id))
+            is_next = cls._heap[0][1] == conversion_id
+        if is_next and cls._wakeup is not None and cls._loop is not None:
+            cls._loop.call_soon_threadsafe(cls._wakeup.set)
+    
+    @classmethod
+    def load(cls, db: Session) -> int:
+        """Fill the heap from the conversions table, backfilling rows that predate expires_at"""
+        for conversion in db.query(Conversion).filter(Conversion.expires_at.is_(None)).all():
+            conversion.expires_at = get_expiry(conversion.completed_at or conversion.created_at)
+        db.commit()
+        
+        rows = db.query(Conversion.expires_at, Conversion.id).all()
+        with cls._lock:
+            cls._heap = [(expires_at, conversion_id) for expires_at, conversion_id in rows]
+            heapq.heapify(cls._heap)
+        return len(rows)
+    
+    @classmethod
+    def next_deadline(cls) -> Optional[datetime]:
+        with cls._lock:
+            return cls._heap[0][0] if cls._heap else None
+    
+    @staticmethod
+    def delete_conversion(db: Session, conversion: Conversion) -> None:
+        """Remove a conversion's upload, output and database rows"""
+        Storage.delete(Storage.upload_path(conversion.filename))
+        if conversion.output_path:
+            Storage.delete(conversion.output_path)
+        elif conversion.target_format:
+            Storage.delete(Storage.output_path(
+                FileHandler.get_output_filename(conversion.filename, conversion.target_format)
+            ))
+        
+        db.query(ConversionJob).filter(
+            ConversionJob.conversion_id == conversion.id
+        ).delete(synchronize_session=False)
+        db.delete(conversion)
+    
+    @classmethod
+    def expire_due(cls, db: Session, now: Optional[datetime] = None) -> int:
+        """Delete every conversion whose deadline has passed. Returns the number deleted."""
+        now = now or datetime.utcnow()
+        
+        due = []
+        with cls._lock:
+            while cls._heap and cls._heap[0][0] <= now:
+                due.append(heapq.heappop(cls._heap)[1])
+        
+        deleted = 0
+        for conversion_id in due:
+            conversion = db.query(Conversion).filter(Conversion.id == conversion_id).first()
+            if conversion is None:
+                continue
+            if conversion.expires_at is not None and conversion.expires_at > now:
+                # Deadline was pushed back since it was scheduled
+                cls.schedule(conversion.id, conversion.expires_at)
+                continue
+            if conversion.status in ("queued", "processing"):
+                cls.schedule(conversion.id, get_expiry(now))
+                continue
+            cls.delete_conversion(db, conversion)
+            deleted += 1
+        
+        db.commit()
+        return deleted
+    
+    @classmethod
+    def sweep(cls, db: Session, now: Optional[datetime] = None) -> int:
+        """Queue overdue rows the heap does not know about (e.g. created by another process)"""
+        now = now or datetime.utcnow()
+        overdue = db.query(Conversion.expires_at, Conversion.id).filter(
+            Conversion.expires_at <= now
+        ).all()
+        for expires_at, conversion_id in overdue:
+            cls.schedule(conversion_id, expires_at)
+        return len(overdue)
+    
+    @classmethod
+    def relieve_disk_pressure(cls, db: Session) -> Tuple[int, int]:
+        """
+        Free disk space while it is below ``disk_min_free_mb``.
+        
+        Result cache entries go first, least recently used first, then the
+        outputs of completed conversions, least recently downloaded first.
+        Rows and uploads are kept: with local storage the conversion is
+        marked "evicted" and can be converted again; with remote storage
+        only the local copy goes. Outputs whose data other hard links keep
+        (the cache, another conversion) are skipped, since deleting them
+        frees nothing, and a pass that frees nothing ends the loop (the
+        shortage is then not ours to fix). Returns (cache entries, outputs)
+        evicted.
+        """
+        min_free = settings.disk_min_free_mb * 1024 * 1024
+        cache_evicted = outputs_evicted = 0
+        while True:
+            shortfall = min_free - shutil.disk_usage(settings.output_dir).free
+            if shortfall <= 0:
+                break
+            
+            cache_bytes = db.query(func.coalesce(func.sum(CacheEntry.size_bytes), 0)).scalar()
+            entries, freed = ResultCache.evict(db, max(0, cache_bytes - shortfall))
+            cache_evicted += entries
+            if freed < shortfall:
+                outputs, outputs_freed = cls.evict_outputs(db, shortfall - freed)
+                outputs_evicted += outputs
+                freed += outputs_freed
+            if freed <= 0:
+                break
+        
+        return cache_evicted, outputs_evicted
+    
+    @staticmethod
+    def evict_outputs(db: Session, needed_bytes: int) -> Tuple[int, int]:
+        """Delete least-recently-downloaded outputs until ``needed_bytes`` are freed. Returns (outputs, bytes freed)."""
+        remote = Storage.is_remote()
+        candidates = db.query(Conversion).filter(
+            Conversion.status == "completed"
+        ).order_by(
+            func.coalesce(Conversion.last_downloaded_at, Conversion.completed_at, Conversion.created_at)
+        ).yield_per(100)
+        
+        evicted = freed = 0
+        for conversion in candidates:
+            output_path = conversion.output_path or Storage.output_path(
+                FileHandler.get_output_filename(conversion.filename, conversion.target_format or "")
+            )
+            try:
+                if os.stat(output_path).st_nlink > 1:
+                    continue
+            except OSError:
+                continue  # no local copy
+            
+            freed += FileHandler.delete_file_freeing(output_path)
+            if not remote:
+                conversion.status = "evicted"
+            evicted += 1
+            if freed >= needed_bytes:
+                break
+        
+        db.commit()
+        return evicted, freed
+    
+    @classmethod
+    def run_pass(cls, sweep: bool) -> Tuple[int, int, int, int]:
+        """
+        One pass of the expiry task, in its own session (blocking).
+        
+        Returns (expired conversions, evicted cache entries, evicted outputs,
+        removed resumable uploads).
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            abandoned = 0
+            if sweep:
+                cls.sweep(db, now)
+                abandoned = ResumableUploads.expire(db, now)
+                SingleFlight.purge(db, now)
+                ScratchSpace.sweep()
+            
+            expired = cls.expire_due(db, now)
+            cache_evicted, outputs_evicted = cls.relieve_disk_pressure(db)
+            return expired, cache_evicted, outputs_evicted, abandoned
+        finally:
+            db.close()
+
+async def expiry_task():
+    """Background task that deletes artifacts as they expire"""
+    ExpiryScheduler._wakeup = asyncio.Event()
+    ExpiryScheduler._loop = asyncio.get_running_loop()
+    last_sweep = datetime.utcnow()
 
-async def cleanup_old_files_task():
-    """Background task to cleanup old files periodically"""
     while True:
+        ExpiryScheduler._wakeup.clear()
         try:
-            # Cleanup uploads
-            deleted_uploads = FileHandler.cleanup_old_files(
-                settings.upload_dir,
-                settings.file_retention_hours
+            # Passes can touch thousands of rows and files: off the event loop
+            sweep = (datetime.utcnow() - last_sweep).total_seconds() >= settings.expiry_sweep_interval_seconds
+            expired, cache_evicted, outputs_evicted, abandoned = await asyncio.to_thread(
+                ExpiryScheduler.run_pass, sweep
             )
+            if sweep:
+                last_sweep = datetime.utcnow()
             
-            # Cleanup outputs
-            deleted_outputs = FileHandler.cleanup_old_files(
-                settings.output_dir,
-                settings.file_retention_hours
-            )
+            if abandoned:
+                print(f"Removed {abandoned} expired resumable uploads")
+            if expired or cache_evicted or outputs_evicted:
+                print(
+                    f"Expired {expired} conversions; evicted {cache_evicted} cache entries "
+                    f"and {outputs_evicted} outputs for disk space"
+                )
+        
+        except Exception as e:
+            print(f"Error in expiry task: {e}")
+        
+        # Sleep until the next deadline, but wake periodically for sweeps and disk checks
+        timeout = settings.expiry_sweep_interval_seconds
+        deadline = ExpiryScheduler.next_deadline()
+        if deadline is not None:
+            timeout = min(timeout, max(0.0, (deadline - datetime.utcnow()).total_seconds()))
+        try:
+            await asyncio.wait_for(ExpiryScheduler._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+def cleanup_orphan_files(max_age_hours: float) -> Tuple[int, int]:
+    """Delete upload and output files older than ``max_age_hours`` (blocking). Returns (uploads, outputs) deleted."""
+    # Unfinished resumable uploads exist only locally and expire on their own
+    deleted_uploads = FileHandler.cleanup_old_files(settings.upload_dir, max_age_hours, (PARTIAL_SUFFIX,))
+    deleted_outputs = FileHandler.cleanup_old_files(settings.output_dir, max_age_hours)
+    return deleted_uploads, deleted_outputs
+
+async def cleanup_orphan_files_task():
+    """Background task that removes files no conversion row points at (crashed uploads, batch zips)"""
+    while True:
+        # With remote storage the local directories are only a cache of the
+        # bucket, trimmed of copies unused for storage_local_cache_hours
+        remote = Storage.is_remote()
+        interval_hours = settings.orphan_sweep_hours
+        if remote:
+            interval_hours = min(interval_hours, settings.storage_local_cache_hours)
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            # Anything older than the retention period has outlived its row
+            max_age_hours = max(settings.orphan_sweep_hours, settings.file_retention_hours + 1)
+            if remote:
+                max_age_hours = min(max_age_hours, settings.storage_local_cache_hours)
+            deleted_uploads, deleted_outputs = await asyncio.to_thread(cleanup_orphan_files, max_age_hours)
             
             if deleted_uploads > 0 or deleted_outputs > 0:
-                print(f"Cleaned up {deleted_uploads} upload files and {deleted_outputs} output files")
-            
-        except Exception as e:
-            print(f"Error in cleanup task: {e}")
+                print(f"Cleaned up {deleted_uploads} orphaned upload files and {deleted_outputs} output files")
         
-        # Run cleanup every hour
-        await asyncio.sleep(3600)
+        except Exception as e:
+            print(f"Error in orphan cleanup task: {e}")
 
 def schedule_cleanup():
-    """Schedule the cleanup task"""
-    asyncio.create_task(cleanup_old_files_task())
+    """Load expiry deadlines and start the cleanup tasks"""
+    db = SessionLocal()
+    try:
+        ExpiryScheduler.load(db)
+    finally:
+        db.close()
+    
+    asyncio.create_task(expiry_task())
+    asyncio.create_task(cleanup_orphan_files_task())
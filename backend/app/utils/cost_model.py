@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from app.config import settings
+from app.database import SessionLocal, ConversionTiming
+
+# Samples a pair (or category) needs before it gets its own fit
+MIN_SAMPLES = 3
+
+# Prune the timings table on every Nth recorded conversion
+PRUNE_EVERY = 1000
+
+def fit_line(samples: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """
+    Least-squares fit of ``seconds = base + per_mb * input_mb``.
+    
+    Both coefficients are kept non-negative; when the sizes barely vary (or
+    bigger inputs were not slower) the fit falls back to the mean duration.
+    """
+    n = len(samples)
+    mean_x = sum(x for x, _ in samples) / n
+    mean_y = sum(y for _, y in samples) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in samples)
+    if var_x < 1e-9:
+        return mean_y, 0.0
+    
+    per_mb = sum((x - mean_x) * (y - mean_y) for x, y in samples) / var_x
+    if per_mb <= 0:
+        return mean_y, 0.0
+    return max(0.0, mean_y - per_mb * mean_x), per_mb
+
+class CostModel:
+    """
+    Predicts how long a conversion will take from its format pair and input size.
+    
+    Fitted per format pair from recorded conversion timings, with per-category
+    and configured defaults for pairs that have not been seen often enough.
+    The fit is cached and redone every ``cost_model_refit_seconds``.
+    """
+    
+    _pair_fits: Dict[str, Tuple[float, float]] = {}
+    _category_fits: Dict[str, Tuple[float, float]] = {}
+    _fitted_at: float = 0.0
+    _recorded = 0
+    _lock = threading.Lock()
+    
+    @classmethod
+    def record(cls, category: str, pair: str, input_mb: float, seconds: float) -> None:
+        """Store the timing of a finished conversion (not cache hits)"""
+        db = SessionLocal()
+        try:
+            db.add(ConversionTiming(category=category, pair=pair, input_mb=input_mb, seconds=seconds))
+            db.commit()
+            
+            cls._recorded += 1
+            if cls._recorded % PRUNE_EVERY == 0:
+                newest = db.query(ConversionTiming.id).order_by(ConversionTiming.id.desc()).first()
+                if newest is not None:
+                    db.query(ConversionTiming).filter(
+                        ConversionTiming.id <= newest.id - settings.cost_model_max_samples
+                    ).delete(synchronize_session=False)
+                    db.commit()
+        finally:
+            db.close()
+    
+    @classmethod
+    def refit(cls) -> None:
+        """Fit every pair and category from the most recent timings"""
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                ConversionTiming.category, ConversionTiming.pair,
+                ConversionTiming.input_mb, ConversionTiming.seconds
+            ).order_by(ConversionTiming.id.desc()).limit(settings.cost_model_max_samples).all()
+        finally:
+            db.close()
+        
+        by_pair: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+        by_category: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+        for category, pair, input_mb, seconds in rows:
+            by_pair[pair].append((input_mb or 0.0, seconds))
+            by_category[category].append((input_mb or 0.0, seconds))
+        
+        cls._pair_fits = {pair: fit_line(s) for pair, s in by_pair.items() if len(s) >= MIN_SAMPLES}
+        cls._category_fits = {cat: fit_line(s) for cat, s in by_category.items() if len(s) >= MIN_SAMPLES}
+        cls._fitted_at = time.monotonic()
+    
+    @classmethod
+    def estimate(cls, category: str, pair: str, input_mb: float) -> float:
+        """Expected conversion time in seconds"""
+        with cls._lock:
+            if time.monotonic() - cls._fitted_at > settings.cost_model_refit_seconds:
+                cls.refit()
+        
+        base, per_mb = cls._pair_fits.get(pair) or cls._category_fits.get(category) or (
+            settings.cost_model_default_seconds,
+            settings.cost_model_default_seconds_per_mb
+        )
+        return base + per_mb * (input_mb or 0.0)
+    
+    @classmethod
+    def describe(cls) -> Dict[str, Dict[str, float]]:
+        """Current fits (seconds = base + per_mb * size), for inspection"""
+        fits = {f"pair:{p}": fit for p, fit in cls._pair_fits.items()}
+        fits.update({f"category:{c}": fit for c, fit in cls._category_fits.items()})
+        return {
+            name: {"base_seconds": round(base, 3), "seconds_per_mb": round(per_mb, 3)}
+            for name, (base, per_mb) in sorted(fits.items())
+        }
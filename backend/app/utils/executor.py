@@ -0,0 +1,580 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import shutil
+import signal
+import time
+import uuid
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal, Conversion
+from app.services.registry import ConversionPlan, execute_plan, normalize_format
+from app.utils.cost_model import CostModel
+from app.utils.lazy_import import LazyImporter
+from app.utils.progress import ProgressHub, reporting, set_worker_queue
+from app.utils.metrics import (
+    CONVERSIONS, CONVERSION_SECONDS, CONVERSION_STAGE_SECONDS, CONVERSION_BYTES_IN,
+    CONVERSION_BYTES_OUT, CONVERSIONS_ACTIVE, POOL_WORKERS_KILLED, SCRATCH_JOBS, SCRATCH_BYTES,
+    start_stages, collect_stages
+)
+from app.utils.result_cache import ResultCache
+from app.utils.scratch import ScratchSpace
+from app.utils.single_flight import SingleFlight
+from app.utils.storage import Storage
+
+
+class ConversionTimeout(Exception):
+    """A conversion ran past its category's wall-clock limit"""
+
+
+class ConversionCancelled(Exception):
+    """A conversion was stopped by a cancel request"""
+
+
+def conversion_stopped(db: Session, conversion: Conversion,
+                       error: Union[ConversionTimeout, ConversionCancelled]) -> HTTPException:
+    """
+    Record a timed out or cancelled conversion as failed and build the
+    error to raise for it: 504 for a timeout, 409 for a cancellation.
+    """
+    conversion.status = "failed"
+    conversion.error_message = str(error)
+    db.commit()
+    status_code = 409 if isinstance(error, ConversionCancelled) else 504
+    return HTTPException(status_code=status_code, detail=str(error))
+
+
+def _run_in_worker(func: Callable, args: tuple, kwargs: dict) -> Any:
+    """Run a converter callable to completion inside a pool worker.
+    
+    Converter methods are declared ``async`` but do blocking work, so each
+    call gets its own short-lived event loop in the worker.
+    """
+    result = func(*args, **kwargs)
+    if asyncio.iscoroutine(result):
+        result = asyncio.run(result)
+    return result
+
+
+def _run_with_stages(func: Callable, args: tuple, kwargs: dict, progress_key: Optional[int] = None,
+                     scratch_bytes: int = 0, token: Optional[str] = None
+                     ) -> Tuple[Any, Dict[str, float], Optional[Tuple[str, int]]]:
+    """
+    Run a converter in a pool worker inside its own scratch directory.
+    
+    The directory is named after ``token``, which is how the API process
+    finds the worker to kill if the conversion times out or is cancelled.
+    Returns its result, the stage timings it recorded and the scratch
+    directory's (location, bytes) at cleanup.
+    """
+    start_stages()
+    started = time.perf_counter()
+    try:
+        with reporting(progress_key), ScratchSpace.job(scratch_bytes, token):
+            result = _run_in_worker(func, args, kwargs)
+    finally:
+        stages = collect_stages()
+    stages["convert"] = time.perf_counter() - started
+    return result, stages, ScratchSpace.take_usage()
+
+
+def _limit_memory(category: str) -> None:
+    """Cap the worker's address space, so a runaway conversion fails with MemoryError instead of exhausting the host"""
+    limit_mb = settings.worker_memory_limits_mb.get(category, settings.worker_memory_limit_default_mb)
+    if limit_mb <= 0:
+        return
+    try:
+        import resource
+    except ImportError:
+        return  # Windows
+    
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = limit_mb * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ValueError, OSError) as e:
+        print(f"[{category} worker {os.getpid()}] could not limit memory: {e}")
+
+
+def _init_worker(category: str, progress_queue=None) -> None:
+    """Pool worker initializer: apply the memory limit and import the category's warm-up modules"""
+    set_worker_queue(progress_queue)
+    _limit_memory(category)
+    modules = settings.warmup_modules.get(category, [])
+    if modules:
+        spent = LazyImporter.warmup(modules)
+        print(f"[{category} worker {os.getpid()}] warmed up in {sum(spent.values()) * 1000:.0f} ms")
+
+
+def _get_cancel_requests(conversion_ids: List[int]) -> List[Tuple[int, datetime]]:
+    """(id, cancel_requested_at) of the given conversions that have a cancel request"""
+    db = SessionLocal()
+    try:
+        return db.query(Conversion.id, Conversion.cancel_requested_at).filter(
+            Conversion.id.in_(conversion_ids),
+            Conversion.cancel_requested_at.isnot(None)
+        ).all()
+    finally:
+        db.close()
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ConversionExecutor:
+    """
+    Runs CPU-bound conversions off the event loop in per-category pools.
+    
+    Conversions run under a wall-clock timeout per category and can be
+    cancelled by conversion id. Either way the pool worker running the
+    conversion is killed, which breaks its pool: the pool is retired and
+    replaced, and conversions that were running in its other workers are
+    submitted again to the new one.
+    """
+    
+    _process_pools: Dict[str, ProcessPoolExecutor] = {}
+    _thread_pool: Optional[ThreadPoolExecutor] = None
+    _codec_pool: Optional[ThreadPoolExecutor] = None
+    _progress_queue = None
+    # Pools broken on purpose by killing a worker
+    _retired: "weakref.WeakSet[ProcessPoolExecutor]" = weakref.WeakSet()
+    # Conversions running in this process, by conversion id
+    _tasks: Dict[int, asyncio.Task] = {}
+    _run_started: Dict[int, datetime] = {}
+    _cancel_requested: Set[int] = set()
+    _cancel_watcher: Optional[asyncio.Task] = None
+    _terminations: Set[asyncio.Task] = set()
+    
+    @classmethod
+    def get_pool(cls, category: str) -> Executor:
+        """Get (or lazily create) the pool that serves a conversion category"""
+        if category in settings.thread_pool_categories:
+            return cls.get_thread_pool()
+        
+        pool = cls._process_pools.get(category)
+        if pool is None:
+            size = settings.process_pool_sizes.get(category, settings.process_pool_default_size)
+            context = multiprocessing.get_context(settings.process_pool_start_method)
+            pool = ProcessPoolExecutor(
+                max_workers=max(1, size),
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(category, cls.get_progress_queue(context))
+            )
+            cls._process_pools[category] = pool
+        return pool
+    
+    @classmethod
+    def get_progress_queue(cls, context):
+        """Queue that pool workers report conversion progress on (relayed to the ProgressHub)"""
+        if cls._progress_queue is None:
+            cls._progress_queue = context.Queue()
+            ProgressHub.attach_worker_queue(cls._progress_queue)
+        return cls._progress_queue
+    
+    @classmethod
+    def get_thread_pool(cls) -> ThreadPoolExecutor:
+        """Get the shared thread pool for GIL-releasing work"""
+        if cls._thread_pool is None:
+            cls._thread_pool = ThreadPoolExecutor(
+                max_workers=max(1, settings.thread_pool_size),
+                thread_name_prefix="conversion"
+            )
+        return cls._thread_pool
+    
+    @classmethod
+    def get_codec_pool(cls) -> ThreadPoolExecutor:
+        """Get the thread pool for bulk image decoding and encoding (Pillow's codecs release the GIL)"""
+        if cls._codec_pool is None:
+            cls._codec_pool = ThreadPoolExecutor(
+                max_workers=max(1, settings.image_codec_threads or os.cpu_count() or 1),
+                thread_name_prefix="codec"
+            )
+        return cls._codec_pool
+    
+    @classmethod
+    async def run(cls, category: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a converter function in the pool for its category and await the result.
+        
+        Args:
+            category: Conversion category (image, document, video, ...)
+            func: Module-level function or converter static method (must be picklable)
+            *args, **kwargs: Arguments passed through to ``func``
+        
+        Returns:
+            Whatever ``func`` returns (awaited if it is a coroutine function)
+        """
+        return await cls._submit(category, _run_in_worker, func, args, kwargs, timeout=cls.get_timeout(category))
+    
+    @staticmethod
+    def get_timeout(category: str) -> Optional[float]:
+        """Wall-clock limit for a conversion in ``category`` (None = no limit)"""
+        timeout = settings.conversion_timeout_seconds.get(category, settings.conversion_timeout_default_seconds)
+        return timeout if timeout and timeout > 0 else None
+    
+    @staticmethod
+    async def _wait(awaitable, timeout: Optional[float]) -> Any:
+        if timeout is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise ConversionTimeout(f"Conversion timed out after {timeout:g} seconds") from None
+    
+    @classmethod
+    async def _submit(cls, category: str, target: Callable, *args,
+                      timeout: Optional[float] = None, token: Optional[str] = None) -> Any:
+        """
+        Run ``target(*args)`` in the category's pool.
+        
+        ``timeout`` counts from when a worker picks the call up (see
+        ``_wait_running``), so time spent queued behind other conversions
+        or waiting for a replacement pool to start does not count; when the
+        call is submitted again after its pool broke, it keeps the deadline
+        of its first start. Past ``timeout``, or when the awaiting task is
+        cancelled, the worker running the call is killed as soon as it has
+        picked the call up (found through the scratch directory named after
+        ``token``). Threads cannot be killed: there the call is abandoned
+        and runs to its end.
+        """
+        call = functools.partial(target, *args)
+        if not settings.executor_enabled:
+            return await cls._wait(asyncio.to_thread(call), timeout)
+        
+        pool = cls.get_pool(category)
+        started_at: List[Optional[float]] = [None]
+        if not isinstance(pool, ProcessPoolExecutor):
+            future = pool.submit(call)
+            try:
+                return await cls._wait_running(future, timeout, None, started_at)
+            except (asyncio.CancelledError, ConversionTimeout):
+                future.cancel()
+                raise
+        
+        while True:
+            future = pool.submit(call)
+            try:
+                return await cls._wait_running(future, timeout, token, started_at)
+            except BrokenProcessPool:
+                if pool not in cls._retired:
+                    raise
+                # Another conversion's worker was killed, taking this pool down with it
+                pool = cls.get_pool(category)
+            except (asyncio.CancelledError, ConversionTimeout):
+                if not (future.cancel() or future.done()) and token is not None:
+                    # In the background: a call handed to the pool may take a while to reach a worker
+                    termination = asyncio.get_running_loop().create_task(
+                        cls._terminate(category, pool, future, token)
+                    )
+                    cls._terminations.add(termination)
+                    termination.add_done_callback(cls._terminations.discard)
+                raise
+    
+    @classmethod
+    async def _wait_running(cls, future, timeout: Optional[float], token: Optional[str],
+                            started_at: List[Optional[float]]) -> Any:
+        """
+        Await a pool future, allowing ``timeout`` seconds from when a worker picked the call up.
+        
+        A process worker has picked the call up once the scratch directory
+        named after ``token`` exists; without a token, once the pool marks
+        the future running. ``started_at`` holds the (monotonic) time it was
+        first seen started, shared by resubmissions of the same call.
+        """
+        waiter = asyncio.wrap_future(future)
+        if timeout is None:
+            return await waiter
+        poll = 0.05
+        try:
+            while True:
+                if started_at[0] is None:
+                    if token is not None:
+                        picked_up = await cls.run_in_thread(ScratchSpace.find_job, token) is not None
+                    else:
+                        picked_up = future.running()
+                    if picked_up:
+                        started_at[0] = time.monotonic()
+                
+                if started_at[0] is None:
+                    wait = poll
+                    poll = min(poll * 2, 1.0)
+                else:
+                    wait = started_at[0] + timeout - time.monotonic()
+                    if wait <= 0:
+                        raise ConversionTimeout(f"Conversion timed out after {timeout:g} seconds")
+                done, _ = await asyncio.wait({waiter}, timeout=wait)
+                if done:
+                    return waiter.result()
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+    
+    @classmethod
+    async def _terminate(cls, category: str, pool: ProcessPoolExecutor, future, token: str) -> None:
+        """Kill the worker that runs ``future`` once it has picked it up, and free its scratch space"""
+        # The worker creates the directory named after the token as it starts the call
+        found, delay = None, 0.05
+        while True:
+            if future.done():
+                return
+            found = await cls.run_in_thread(ScratchSpace.find_job, token)
+            if found is not None:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        
+        pid, scratch_path = found
+        if cls._process_pools.get(category) is pool:
+            del cls._process_pools[category]
+        cls._retired.add(pool)
+        try:
+            os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        except ProcessLookupError:
+            pass
+        pool.shutdown(wait=False)
+        POOL_WORKERS_KILLED.inc(category=category)
+        print(f"Killed {category} worker {pid}")
+        await cls.run_in_thread(shutil.rmtree, scratch_path, True)
+    
+    @classmethod
+    def cancel(cls, conversion_id: int) -> bool:
+        """
+        Stop a conversion running in this process.
+        
+        Its caller gets ``ConversionCancelled``. Returns False if the
+        conversion is not running here.
+        """
+        task = cls._tasks.get(conversion_id)
+        if task is None or task.done():
+            return False
+        cls._cancel_requested.add(conversion_id)
+        task.cancel()
+        return True
+    
+    @classmethod
+    def _watch_cancellations(cls) -> None:
+        if cls._cancel_watcher is None or cls._cancel_watcher.done():
+            cls._cancel_watcher = asyncio.get_running_loop().create_task(cls._poll_cancellations())
+    
+    @classmethod
+    async def _poll_cancellations(cls) -> None:
+        """Carry out cancel requests that other processes recorded for conversions running here"""
+        while cls._tasks:
+            await asyncio.sleep(settings.conversion_cancel_poll_seconds)
+            running = dict(cls._run_started)
+            if not running:
+                continue
+            try:
+                requests = await cls.run_in_thread(_get_cancel_requests, list(running))
+            except Exception as e:
+                print(f"Error checking for cancel requests: {e}")
+                continue
+            for conversion_id, requested_at in requests:
+                # Requests older than this run were meant for an earlier one
+                if conversion_id in running and requested_at >= running[conversion_id]:
+                    cls.cancel(conversion_id)
+    
+    @classmethod
+    async def convert(cls, category: str, converter: type, input_path: str, output_path: str,
+                      source_format: str, target_format: str,
+                      content_hash: Optional[str] = None, progress_key: Optional[int] = None,
+                      **params) -> str:
+        """
+        Run ``converter.convert`` for a file, serving repeat inputs from the result cache.
+        
+        Args:
+            category: Conversion category, selects the pool
+            converter: Converter class exposing ``convert`` and ``VERSION``
+            input_path, output_path, source_format, target_format: As for ``convert``
+            content_hash: SHA-256 of the input if already known (computed otherwise)
+            progress_key: Conversion id that progress reported by the converter is published under
+            **params: Extra conversion parameters (also part of the cache key)
+        
+        Returns:
+            Path to the converted file
+        """
+        return await cls._run_cached(
+            category,
+            f"{normalize_format(source_format)}_to_{normalize_format(target_format)}",
+            input_path,
+            output_path,
+            target_format,
+            content_hash,
+            dict(params, source_format=source_format.lower(), converter=converter.__name__),
+            getattr(converter, "VERSION", "1"),
+            converter.convert,
+            dict(
+                params,
+                input_path=input_path,
+                output_path=output_path,
+                source_format=source_format,
+                target_format=target_format
+            ),
+            progress_key=progress_key
+        )
+    
+    @classmethod
+    async def convert_plan(cls, plan: ConversionPlan, input_path: str, output_path: str,
+                           content_hash: Optional[str] = None, progress_key: Optional[int] = None) -> str:
+        """Run a multi-hop conversion plan as one unit in the pool of its costliest hop"""
+        return await cls._run_cached(
+            plan.category,
+            f"{plan.steps[0].source_format}_to_{plan.steps[-1].target_format}",
+            input_path,
+            output_path,
+            plan.steps[-1].target_format,
+            content_hash,
+            {"plan": plan.describe()},
+            plan.version,
+            execute_plan,
+            dict(steps=plan.steps, input_path=input_path, output_path=output_path),
+            progress_key=progress_key
+        )
+    
+    @classmethod
+    async def _run_cached(cls, category: str, pair: str, input_path: str, output_path: str,
+                          target_format: str, content_hash: Optional[str],
+                          key_params: Dict[str, Any], version: str,
+                          func: Callable, kwargs: Dict[str, Any],
+                          progress_key: Optional[int] = None) -> str:
+        """Serve a conversion from the result cache, or run it and cache the output"""
+        started = time.perf_counter()
+        result_path, status = output_path, "failed"
+        task = asyncio.current_task()
+        if progress_key is not None:
+            cls._tasks[progress_key] = task
+            cls._run_started[progress_key] = datetime.utcnow()
+            cls._watch_cancellations()
+        try:
+            with CONVERSIONS_ACTIVE.track(category=category):
+                result_path, status = await cls._convert_or_fetch(
+                    category, pair, input_path, output_path, target_format,
+                    content_hash, key_params, version, func, kwargs, progress_key
+                )
+                if isinstance(result_path, str):
+                    await Storage.persist(result_path)
+            return result_path
+        except asyncio.CancelledError:
+            if progress_key not in cls._cancel_requested:
+                raise
+            # Cancelled through cancel(): the caller sees an ordinary failure
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+            status = "cancelled"
+            raise ConversionCancelled("Conversion cancelled") from None
+        except ConversionTimeout:
+            status = "timeout"
+            raise
+        finally:
+            if progress_key is not None and cls._tasks.get(progress_key) is task:
+                del cls._tasks[progress_key]
+                cls._run_started.pop(progress_key, None)
+                cls._cancel_requested.discard(progress_key)
+            CONVERSIONS.inc(category=category, pair=pair, status=status)
+            CONVERSION_SECONDS.observe(time.perf_counter() - started, category=category, pair=pair)
+            if status in ("completed", "cached", "joined"):
+                CONVERSION_BYTES_IN.inc(_file_size(input_path), category=category)
+                CONVERSION_BYTES_OUT.inc(_file_size(result_path), category=category)
+    
+    @classmethod
+    async def _convert_or_fetch(cls, category: str, pair: str, input_path: str, output_path: str,
+                                target_format: str, content_hash: Optional[str],
+                                key_params: Dict[str, Any], version: str,
+                                func: Callable, kwargs: Dict[str, Any],
+                                progress_key: Optional[int]) -> Tuple[str, str]:
+        """Returns (result path, "cached", "joined" or "completed")"""
+        use_cache = (
+            settings.result_cache_enabled
+            and category not in settings.result_cache_exclude_categories
+        )
+        single_flight = (
+            settings.single_flight_enabled
+            and category not in settings.single_flight_exclude_categories
+        )
+        
+        cache_key = None
+        if use_cache or single_flight:
+            if content_hash is None:
+                content_hash = await cls.run_in_thread(ResultCache.hash_file, input_path)
+            cache_key = ResultCache.make_key(content_hash, target_format, key_params, version)
+        if use_cache and await cls.run_in_thread(ResultCache.fetch, cache_key, output_path):
+            return output_path, "cached"
+        
+        async def convert() -> str:
+            scratch_bytes = int(_file_size(input_path) * settings.scratch_size_multipliers.get(
+                category, settings.scratch_size_multiplier_default
+            ))
+            token = uuid.uuid4().hex[:12]
+            submitted = time.perf_counter()
+            result_path, stages, scratch_usage = await cls._submit(
+                category, _run_with_stages, func, (), kwargs, progress_key, scratch_bytes, token,
+                timeout=cls.get_timeout(category), token=token
+            )
+            stages["pool_wait"] = max(0.0, time.perf_counter() - submitted - stages["convert"])
+            for stage_name, seconds in stages.items():
+                CONVERSION_STAGE_SECONDS.observe(seconds, category=category, pair=pair, stage=stage_name)
+            if scratch_usage is not None:
+                location, used_bytes = scratch_usage
+                SCRATCH_JOBS.inc(location=location)
+                SCRATCH_BYTES.inc(used_bytes, location=location)
+            
+            try:
+                input_mb = _file_size(input_path) / (1024 * 1024)
+                await cls.run_in_thread(CostModel.record, category, pair, input_mb, stages["convert"])
+            except Exception as e:
+                print(f"Error recording conversion timing: {e}")
+            
+            if use_cache and isinstance(result_path, str) and os.path.isfile(result_path):
+                try:
+                    await cls.run_in_thread(ResultCache.store, cache_key, result_path)
+                except Exception as e:
+                    print(f"Error storing conversion result in cache: {e}")
+            
+            return result_path
+        
+        # Identical requests arriving while this one runs wait for it instead of converting again
+        if single_flight:
+            return await SingleFlight.run(cache_key, output_path, convert)
+        return await convert(), "completed"
+    
+    @classmethod
+    async def run_in_thread(cls, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking function on the shared thread pool (e.g. hashing, file copies)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            cls.get_thread_pool(),
+            functools.partial(_run_in_worker, func, args, kwargs)
+        )
+    
+    @classmethod
+    def shutdown(cls) -> None:
+        """Shut down all pools (called on application shutdown)"""
+        for pool in cls._process_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        cls._process_pools.clear()
+        
+        if cls._progress_queue is not None:
+            ProgressHub.stop()
+            cls._progress_queue = None
+        
+        if cls._thread_pool is not None:
+            cls._thread_pool.shutdown(wait=False, cancel_futures=True)
+            cls._thread_pool = None
+        
+        if cls._codec_pool is not None:
+            cls._codec_pool.shutdown(wait=False, cancel_futures=True)
+            cls._codec_pool = None
@@ -1,10 +1,23 @@
 import os
 import uuid
 import shutil
+import hashlib
+import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import NamedTuple, Optional, Tuple
+import aiofiles
 from fastapi import UploadFile, HTTPException
 from app.config import settings
+from app.utils.metrics import UPLOAD_BYTES, UPLOAD_WRITE_SECONDS
+from app.utils.sniffer import SNIFF_BYTES, sniff
+from app.utils.storage import Storage
+
+class SavedUpload(NamedTuple):
+    """Result of streaming an upload to disk"""
+    path: str
+    size_bytes: int
+    content_hash: str
+    detected_format: Optional[str]
 
 class FileHandler:
     """Handles file upload, storage, and cleanup operations"""
@@ -17,23 +30,100 @@ class FileHandler:
         return f"{name}_{unique_id}{ext}"
     
     @staticmethod
-    async def save_upload_file(upload_file: UploadFile, directory: str = None) -> str:
-        """Save uploaded file to disk and return the file path"""
-        if directory is None:
-            directory = settings.upload_dir
+    async def save_upload_file(upload_file: UploadFile, directory: str = None,
+                               max_bytes: Optional[int] = None,
+                               limit_description: Optional[str] = None) -> SavedUpload:
+        """
+        Stream an uploaded file to disk in chunks.
+        
+        The size limit is enforced as bytes arrive, so oversized uploads are
+        rejected with a 413 without being written out in full. The SHA-256
+        and the leading bytes used for format sniffing are computed on the way.
+        ``limit_description`` is how the 413 states the limit (by default,
+        ``max_bytes`` in MB).
+        """
+        if max_bytes is None:
+            max_bytes = settings.max_file_size_bytes
+        if limit_description is None:
+            limit_description = f"{max_bytes / (1024 * 1024):g}MB"
         
-        # Generate unique filename
+        # Generate unique filename (in its shard of the upload directory by default)
         filename = FileHandler.generate_unique_filename(upload_file.filename)
-        file_path = os.path.join(directory, filename)
+        if directory is None:
+            file_path = Storage.upload_path(filename)
+        else:
+            file_path = os.path.join(directory, filename)
+            os.makedirs(directory, exist_ok=True)
         
-        # Ensure directory exists
-        os.makedirs(directory, exist_ok=True)
+        chunk_size = settings.upload_chunk_size_kb * 1024
+        sha256 = hashlib.sha256()
+        header = b""
+        size_bytes = 0
+        started = time.perf_counter()
         
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(upload_file.file, buffer)
+        try:
+            async with aiofiles.open(file_path, "wb") as buffer:
+                while True:
+                    chunk = await upload_file.read(chunk_size)
+                    if not chunk:
+                        break
+                    
+                    size_bytes += len(chunk)
+                    if size_bytes > max_bytes:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File size exceeds maximum allowed size ({limit_description})"
+                        )
+                    
+                    if len(header) < SNIFF_BYTES:
+                        header += chunk[:SNIFF_BYTES - len(header)]
+                    sha256.update(chunk)
+                    await buffer.write(chunk)
+        except BaseException:
+            FileHandler.delete_file(file_path)
+            raise
         
-        return file_path
+        extension = FileHandler.get_file_extension(upload_file.filename) or "unknown"
+        UPLOAD_WRITE_SECONDS.observe(time.perf_counter() - started, format=extension)
+        UPLOAD_BYTES.inc(size_bytes, format=extension)
+        
+        return SavedUpload(
+            path=file_path,
+            size_bytes=size_bytes,
+            content_hash=sha256.hexdigest(),
+            detected_format=FileHandler.detect_format(header)
+        )
+    
+    @staticmethod
+    def digest_file(file_path: str) -> Tuple[str, Optional[str]]:
+        """SHA-256 and sniffed format of a file already on disk (blocking; run in a thread)"""
+        chunk_size = settings.upload_chunk_size_kb * 1024
+        sha256 = hashlib.sha256()
+        header = b""
+        with open(file_path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                if len(header) < SNIFF_BYTES:
+                    header += chunk[:SNIFF_BYTES - len(header)]
+                sha256.update(chunk)
+        return sha256.hexdigest(), FileHandler.detect_format(header)
+    
+    @staticmethod
+    def detect_format(header: bytes) -> Optional[str]:
+        """Identify a file format from its leading bytes (see ``sniffer.sniff``)"""
+        return sniff(header)
+    
+    @staticmethod
+    def match_extension(file_path: str, file_format: str) -> str:
+        """Rename a stored upload whose extension disagrees with its sniffed format; returns the new path"""
+        name, ext = os.path.splitext(file_path)
+        if ext.lstrip('.').lower() == file_format:
+            return file_path
+        new_path = f"{name}.{file_format}"
+        os.replace(file_path, new_path)
+        return new_path
     
     @staticmethod
     def get_file_size_mb(file_path: str) -> float:
@@ -66,8 +156,21 @@ class FileHandler:
             print(f"Error deleting file {file_path}: {e}")
     
     @staticmethod
-    def cleanup_old_files(directory: str, hours: int) -> int:
-        """Delete files older than specified hours. Returns count of deleted files."""
+    def delete_file_freeing(file_path: str) -> int:
+        """Delete a file if it exists. Returns the bytes this frees: 0 while other hard links keep its data."""
+        try:
+            st = os.stat(file_path)
+            os.remove(file_path)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            print(f"Error deleting file {file_path}: {e}")
+            return 0
+        return st.st_size if st.st_nlink == 1 else 0
+    
+    @staticmethod
+    def cleanup_old_files(directory: str, hours: float, keep_suffixes: Tuple[str, ...] = ()) -> int:
+        """Delete files older than specified hours, shard directories included. Returns count of deleted files."""
         import time
         
         deleted_count = 0
@@ -77,9 +180,13 @@ class FileHandler:
         if not os.path.exists(directory):
             return 0
         
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
-            if os.path.isfile(file_path):
+        for root, dirnames, filenames in os.walk(directory):
+            # Private directories (e.g. the result cache) manage their own files
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for filename in filenames:
+                if keep_suffixes and filename.endswith(keep_suffixes):
+                    continue
+                file_path = os.path.join(root, filename)
                 file_modified_time = os.path.getmtime(file_path)
                 if file_modified_time < cutoff_time:
                     try:
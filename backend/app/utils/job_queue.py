@@ -0,0 +1,470 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal, Conversion, ConversionJob, get_expiry
+from app.services.registry import registry, normalize_format
+from app.utils.admission import AdmissionController
+from app.utils.cost_model import CostModel
+from app.utils.executor import ConversionExecutor
+from app.utils.file_handler import FileHandler
+from app.utils.storage import Storage
+from app.utils.metrics import JOB_LEASES_EXPIRED
+
+class JobQueue:
+    """
+    Persistent conversion job queue backed by the conversion_jobs table.
+    
+    Any number of processes, on any number of machines sharing the database
+    and the upload/output directories, can run workers against the same
+    queue. A claimed job carries a lease that its worker keeps renewing;
+    jobs whose lease runs out are re-queued by whichever process notices.
+    """
+    
+    _wakeup: Optional[asyncio.Event] = None
+    _tasks: List[asyncio.Task] = []
+    
+    # Identifies this process's workers in worker_id, e.g. "web-1-4242-1a2b3c-0"
+    worker_prefix = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    
+    @classmethod
+    def get_wakeup_event(cls) -> asyncio.Event:
+        if cls._wakeup is None:
+            cls._wakeup = asyncio.Event()
+        return cls._wakeup
+    
+    @classmethod
+    def notify(cls) -> None:
+        """Wake idle workers in this process after new jobs were queued"""
+        if cls._wakeup is not None:
+            cls._wakeup.set()
+    
+    @staticmethod
+    def get_priority(api_key: Optional[str]) -> int:
+        """Priority of jobs submitted with an API key (lower runs first)"""
+        priority_class = settings.api_key_priority_classes.get(api_key or "", settings.job_default_priority_class)
+        return settings.job_priority_classes.get(
+            priority_class,
+            settings.job_priority_classes.get(settings.job_default_priority_class, 1)
+        )
+    
+    @staticmethod
+    def enqueue(db: Session, conversion: Conversion, category: str, target_format: str,
+                priority: Optional[int] = None) -> ConversionJob:
+        """Queue a conversion for background processing, in the lane its estimated cost puts it in"""
+        estimated_seconds = CostModel.estimate(
+            category,
+            f"{normalize_format(conversion.source_format)}_to_{normalize_format(target_format)}",
+            conversion.file_size or 0.0
+        )
+        job = ConversionJob(
+            conversion_id=conversion.id,
+            category=category,
+            target_format=target_format,
+            status="queued",
+            priority=JobQueue.get_priority(None) if priority is None else priority,
+            lane="long" if estimated_seconds > settings.job_short_lane_max_seconds else "short",
+            estimated_seconds=estimated_seconds
+        )
+        conversion.target_format = target_format
+        conversion.status = "queued"
+        conversion.error_message = None
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+    
+    @staticmethod
+    def _lane_filter(lane: str):
+        # Jobs queued before lanes existed have no lane and count as short
+        if lane == "short":
+            return or_(ConversionJob.lane == "short", ConversionJob.lane.is_(None))
+        return ConversionJob.lane == lane
+    
+    @staticmethod
+    def get_lease_expiry() -> datetime:
+        return datetime.utcnow() + timedelta(seconds=settings.job_lease_seconds)
+    
+    @staticmethod
+    def claim(db: Session, worker_id: str, lanes: Sequence[str] = ("short", "long")) -> Optional[ConversionJob]:
+        """
+        Atomically claim the next queued job from the first lane that has one.
+        
+        Within a lane, jobs run by priority, then in arrival order. On
+        PostgreSQL the candidate row is locked with FOR UPDATE SKIP LOCKED,
+        so concurrent workers pick different jobs without waiting on each
+        other. On SQLite, which has no row locks, the conditional UPDATE
+        only succeeds for one worker and the losers try the next candidate.
+        """
+        skip_locked = db.get_bind().dialect.name == "postgresql"
+        
+        while True:
+            candidate = None
+            for lane in lanes:
+                query = db.query(ConversionJob.id).filter(
+                    ConversionJob.status == "queued",
+                    JobQueue._lane_filter(lane)
+                ).order_by(func.coalesce(ConversionJob.priority, 1), ConversionJob.id)
+                if skip_locked:
+                    query = query.with_for_update(skip_locked=True)
+                candidate = query.first()
+                if candidate is not None:
+                    break
+            
+            if candidate is None:
+                db.rollback()
+                return None
+            
+            now = datetime.utcnow()
+            claimed = db.query(ConversionJob).filter(
+                ConversionJob.id == candidate.id,
+                ConversionJob.status == "queued"
+            ).update({
+                ConversionJob.status: "running",
+                ConversionJob.worker_id: worker_id,
+                ConversionJob.started_at: now,
+                ConversionJob.heartbeat_at: now,
+                ConversionJob.lease_expires_at: JobQueue.get_lease_expiry(),
+                ConversionJob.attempts: func.coalesce(ConversionJob.attempts, 0) + 1
+            }, synchronize_session=False)
+            db.commit()
+            
+            if claimed == 1:
+                return db.query(ConversionJob).filter(ConversionJob.id == candidate.id).first()
+    
+    @staticmethod
+    def renew_lease(db: Session, job_id: int, worker_id: str) -> bool:
+        """Extend a running job's lease; False if the worker no longer owns the job"""
+        now = datetime.utcnow()
+        renewed = db.query(ConversionJob).filter(
+            ConversionJob.id == job_id,
+            ConversionJob.worker_id == worker_id,
+            ConversionJob.status == "running"
+        ).update({
+            ConversionJob.heartbeat_at: now,
+            ConversionJob.lease_expires_at: JobQueue.get_lease_expiry()
+        }, synchronize_session=False)
+        db.commit()
+        return renewed == 1
+    
+    @staticmethod
+    async def keep_lease(job_id: int, worker_id: str) -> None:
+        """Renew a job's lease every job_heartbeat_seconds until cancelled or the lease is lost"""
+        while True:
+            await asyncio.sleep(settings.job_heartbeat_seconds)
+            db = SessionLocal()
+            try:
+                if not JobQueue.renew_lease(db, job_id, worker_id):
+                    print(f"Worker {worker_id} lost the lease on job {job_id}")
+                    return
+            except Exception as e:
+                print(f"Error renewing lease on job {job_id}: {e}")
+            finally:
+                db.close()
+    
+    @staticmethod
+    def requeue_expired(db: Session) -> Tuple[int, int]:
+        """
+        Re-queue running jobs whose worker stopped renewing its lease.
+        
+        Jobs that already used up job_max_attempts fail instead, so an input
+        that keeps crashing workers cannot take them all down in turn.
+        
+        Returns:
+            Number of jobs re-queued and number failed
+        """
+        now = datetime.utcnow()
+        expired = db.query(ConversionJob).filter(
+            ConversionJob.status == "running",
+            or_(
+                ConversionJob.lease_expires_at < now,
+                # Claimed before leases existed
+                ConversionJob.lease_expires_at.is_(None) & (
+                    ConversionJob.started_at < now - timedelta(seconds=settings.job_lease_seconds)
+                )
+            )
+        ).all()
+        
+        requeued = failed = 0
+        for job in expired:
+            give_up = (job.attempts or 0) >= settings.job_max_attempts
+            # Compare-and-set on the lease, in case the worker renewed it meanwhile
+            changed = db.query(ConversionJob).filter(
+                ConversionJob.id == job.id,
+                ConversionJob.status == "running",
+                ConversionJob.worker_id == job.worker_id,
+                ConversionJob.lease_expires_at.is_(None) if job.lease_expires_at is None
+                else ConversionJob.lease_expires_at == job.lease_expires_at
+            ).update({
+                ConversionJob.status: "failed" if give_up else "queued",
+                ConversionJob.worker_id: None,
+                ConversionJob.lease_expires_at: None,
+                ConversionJob.finished_at: now if give_up else None,
+                ConversionJob.error_message: f"Worker stopped after {job.attempts} attempts" if give_up else None
+            }, synchronize_session=False)
+            if changed != 1:
+                continue
+            
+            conversion = db.query(Conversion).filter(Conversion.id == job.conversion_id).first()
+            if conversion is not None:
+                conversion.status = "failed" if give_up else "queued"
+                conversion.error_message = "Conversion worker stopped responding" if give_up else None
+            
+            if give_up:
+                failed += 1
+            else:
+                requeued += 1
+        
+        db.commit()
+        if requeued:
+            JOB_LEASES_EXPIRED.inc(requeued, outcome="requeued")
+        if failed:
+            JOB_LEASES_EXPIRED.inc(failed, outcome="failed")
+        return requeued, failed
+    
+    @staticmethod
+    def release_worker_jobs(db: Session, worker_prefix: str) -> int:
+        """Hand back jobs still running in this process's workers (graceful shutdown)"""
+        jobs = db.query(ConversionJob).filter(
+            ConversionJob.status == "running",
+            ConversionJob.worker_id.like(f"{worker_prefix}-%")
+        ).all()
+        for job in jobs:
+            job.status = "queued"
+            job.worker_id = None
+            job.lease_expires_at = None
+            # An interrupted run does not count against the job's attempts
+            job.attempts = max(0, (job.attempts or 1) - 1)
+            conversion = db.query(Conversion).filter(Conversion.id == job.conversion_id).first()
+            if conversion is not None:
+                conversion.status = "queued"
+        db.commit()
+        return len(jobs)
+    
+    @staticmethod
+    def cancel_queued(db: Session, conversion_id: int) -> bool:
+        """Take a conversion's job off the queue before a worker claims it; False if none is queued"""
+        now = datetime.utcnow()
+        cancelled = db.query(ConversionJob).filter(
+            ConversionJob.conversion_id == conversion_id,
+            ConversionJob.status == "queued"
+        ).update({
+            ConversionJob.status: "failed",
+            ConversionJob.error_message: "Conversion cancelled",
+            ConversionJob.finished_at: now
+        }, synchronize_session=False)
+        if cancelled:
+            conversion = db.query(Conversion).filter(Conversion.id == conversion_id).first()
+            if conversion is not None:
+                conversion.status = "failed"
+                conversion.error_message = "Conversion cancelled"
+        db.commit()
+        return cancelled > 0
+    
+    @staticmethod
+    def estimate_eta(db: Session, job: ConversionJob) -> Optional[float]:
+        """
+        Seconds until a queued or running job is expected to finish.
+        
+        Adds up the estimates of everything ahead of it in its lane (running
+        jobs count for their remaining time) spread over the lane's workers.
+        """
+        if job.status not in ("queued", "running") or job.estimated_seconds is None:
+            return None
+        
+        now = datetime.utcnow()
+        if job.status == "running":
+            elapsed = (now - job.started_at).total_seconds() if job.started_at else 0.0
+            return max(0.0, job.estimated_seconds - elapsed)
+        
+        lane = job.lane or "short"
+        priority = job.priority if job.priority is not None else 1
+        ahead = db.query(ConversionJob).filter(
+            JobQueue._lane_filter(lane),
+            or_(
+                ConversionJob.status == "running",
+                (ConversionJob.status == "queued") & or_(
+                    func.coalesce(ConversionJob.priority, 1) < priority,
+                    (func.coalesce(ConversionJob.priority, 1) == priority) & (ConversionJob.id < job.id)
+                )
+            )
+        ).all()
+        
+        backlog = 0.0
+        for other in ahead:
+            estimate = other.estimated_seconds or settings.cost_model_default_seconds
+            if other.status == "running" and other.started_at:
+                estimate = max(0.0, estimate - (now - other.started_at).total_seconds())
+            backlog += estimate
+        
+        long_workers = min(settings.job_long_lane_workers, settings.job_workers)
+        lane_workers = long_workers if lane == "long" else settings.job_workers - long_workers
+        return backlog / max(1, lane_workers) + job.estimated_seconds
+    
+    @staticmethod
+    def count_by_status(db: Session) -> Dict[str, int]:
+        """Number of jobs per status (queue depth for monitoring)"""
+        rows = db.query(ConversionJob.status, func.count(ConversionJob.id)).group_by(ConversionJob.status).all()
+        return {status: count for status, count in rows}
+    
+    @staticmethod
+    async def run_job(db: Session, job: ConversionJob) -> None:
+        """
+        Run a claimed job and record its outcome on both the job and conversion rows.
+        
+        The job's lease is renewed while it runs. If the lease was lost anyway
+        (the job was re-queued and may be running elsewhere) the outcome is
+        discarded rather than overwriting the new owner's.
+        """
+        conversion = db.query(Conversion).filter(Conversion.id == job.conversion_id).first()
+        worker_id = job.worker_id
+        started = time.perf_counter()
+        heartbeat = asyncio.create_task(JobQueue.keep_lease(job.id, worker_id))
+        output_filename = output_path = None
+        error: Optional[str] = None
+        
+        try:
+            if conversion is None:
+                raise ValueError("Conversion not found")
+            
+            plan = registry.plan(conversion.source_format, job.target_format)
+            if plan is None:
+                raise NotImplementedError(
+                    f"Conversion from {conversion.source_format} to {job.target_format} not supported"
+                )
+            
+            conversion.status = "processing"
+            db.commit()
+            
+            input_path = await Storage.fetch_upload(conversion.filename)
+            if not os.path.exists(input_path):
+                raise FileNotFoundError("Input file not found")
+            
+            output_filename = FileHandler.get_output_filename(conversion.filename, job.target_format)
+            output_path = Storage.output_path(output_filename)
+            
+            # Jobs share the per-category limits with direct requests, but wait instead of failing
+            async with AdmissionController.admit(plan.category, conversion.file_size or 0.0, wait_forever=True):
+                await ConversionExecutor.convert_plan(
+                    plan,
+                    input_path=input_path,
+                    output_path=output_path,
+                    content_hash=conversion.content_hash,
+                    progress_key=conversion.id
+                )
+        
+        except Exception as e:
+            error = str(e)
+        
+        finally:
+            heartbeat.cancel()
+        
+        owned = db.query(ConversionJob).filter(
+            ConversionJob.id == job.id,
+            ConversionJob.worker_id == worker_id,
+            ConversionJob.status == "running"
+        ).update({
+            ConversionJob.status: "failed" if error else "completed",
+            ConversionJob.output_filename: None if error else output_filename,
+            ConversionJob.error_message: error,
+            ConversionJob.finished_at: datetime.utcnow(),
+            ConversionJob.duration_seconds: time.perf_counter() - started,
+            ConversionJob.lease_expires_at: None
+        }, synchronize_session=False)
+        
+        if owned != 1:
+            db.rollback()
+            print(f"Worker {worker_id} lost the lease on job {job.id}; discarding its outcome")
+            return
+        
+        if conversion is not None:
+            if error:
+                conversion.status = "failed"
+                conversion.error_message = error
+            else:
+                conversion.output_path = output_path
+                conversion.status = "completed"
+                conversion.completed_at = datetime.utcnow()
+                conversion.expires_at = get_expiry(conversion.completed_at)
+                conversion.error_message = None
+        db.commit()
+
+async def job_worker(worker_id: str, lanes: Sequence[str] = ("short",)):
+    """Background worker that claims and runs queued jobs from its lanes until cancelled"""
+    wakeup = JobQueue.get_wakeup_event()
+    
+    while True:
+        wakeup.clear()
+        db = SessionLocal()
+        try:
+            job = JobQueue.claim(db, worker_id, lanes)
+            if job is not None:
+                await JobQueue.run_job(db, job)
+                continue
+        except Exception as e:
+            print(f"Error in job worker {worker_id}: {e}")
+        finally:
+            db.close()
+        
+        # Idle: sleep until notified or the poll interval passes
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=settings.job_poll_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+async def lease_reaper():
+    """Re-queue jobs of crashed workers (in any process) until cancelled"""
+    while True:
+        db = SessionLocal()
+        try:
+            requeued, failed = JobQueue.requeue_expired(db)
+            if requeued:
+                print(f"Re-queued {requeued} jobs with expired leases")
+                JobQueue.notify()
+            if failed:
+                print(f"Failed {failed} jobs that ran out of attempts")
+        except Exception as e:
+            print(f"Error re-queuing expired jobs: {e}")
+        finally:
+            db.close()
+        
+        await asyncio.sleep(settings.job_heartbeat_seconds)
+
+def schedule_job_workers(workers: Optional[int] = None, long_lane_workers: Optional[int] = None) -> List[asyncio.Task]:
+    """Start background job workers (the configured number by default) and the lease reaper"""
+    workers = settings.job_workers if workers is None else workers
+    long_lane_workers = settings.job_long_lane_workers if long_lane_workers is None else long_lane_workers
+    
+    # The first workers serve the long lane (falling back to short jobs); the
+    # rest only take short jobs, so big transcodes can never occupy them all
+    long_workers = min(long_lane_workers, workers)
+    JobQueue._tasks = [
+        asyncio.create_task(job_worker(
+            f"{JobQueue.worker_prefix}-{i}",
+            ("long", "short") if i < long_workers else ("short",)
+        ))
+        for i in range(workers)
+    ]
+    JobQueue._tasks.append(asyncio.create_task(lease_reaper()))
+    return JobQueue._tasks
+
+async def stop_job_workers() -> None:
+    """Cancel this process's workers and put the jobs they were running back in the queue"""
+    tasks, JobQueue._tasks = JobQueue._tasks, []
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    
+    db = SessionLocal()
+    try:
+        released = JobQueue.release_worker_jobs(db, JobQueue.worker_prefix)
+        if released:
+            print(f"Released {released} running jobs back to the queue")
+    finally:
+        db.close()
@@ -0,0 +1,80 @@
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List
+
+class LazyImporter:
+    """
+    Loads heavy third-party modules on first use and records what each cost.
+    
+    Converter modules bind their dependencies with ``lazy_import`` so that
+    importing a converter (and therefore the API and every pool worker) only
+    pays for the libraries a conversion actually touches.
+    """
+    
+    _timings: Dict[str, float] = {}
+    _lock = threading.RLock()
+    
+    @classmethod
+    def load(cls, name: str):
+        """Import a module (once) and record how long the first import took"""
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        
+        with cls._lock:
+            module = sys.modules.get(name)
+            if module is not None:
+                return module
+            started = time.perf_counter()
+            module = importlib.import_module(name)
+            cls._timings[name] = time.perf_counter() - started
+        return module
+    
+    @staticmethod
+    def is_available(name: str) -> bool:
+        """Check that a module is installed without importing it"""
+        try:
+            return importlib.util.find_spec(name.split(".")[0]) is not None
+        except (ImportError, ValueError):
+            return False
+    
+    @classmethod
+    def warmup(cls, names: Iterable[str]) -> Dict[str, float]:
+        """Import modules ahead of first use. Returns seconds spent per module."""
+        spent = {}
+        for name in names:
+            started = time.perf_counter()
+            try:
+                cls.load(name)
+            except Exception as e:
+                print(f"Warm-up import of {name} failed: {e}")
+                continue
+            spent[name] = time.perf_counter() - started
+        return spent
+    
+    @classmethod
+    def get_report(cls) -> List[Dict[str, Any]]:
+        """Modules loaded through this importer in this process, most expensive first"""
+        return [
+            {"module": name, "import_ms": round(seconds * 1000, 1)}
+            for name, seconds in sorted(cls._timings.items(), key=lambda item: -item[1])
+        ]
+
+class LazyModule:
+    """Stand-in for a module that imports it on first attribute access"""
+    
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+    
+    def __getattr__(self, attr: str):
+        return getattr(LazyImporter.load(self._name), attr)
+    
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}>"
+
+def lazy_import(name: str) -> LazyModule:
+    """Bind a module name now and import it when first used"""
+    return LazyModule(name)
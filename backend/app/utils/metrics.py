@@ -0,0 +1,247 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets (seconds) shared by request and conversion histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """Base class: a named family of samples keyed by label values"""
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def set_function(self, callback: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        """Compute samples at scrape time instead of tracking them (e.g. queue depth from the DB)"""
+        self._callback = callback
+    
+    def samples(self) -> List[str]:
+        if self._callback is not None:
+            values = self._callback()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+    
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+    
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+    
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+    
+    @contextmanager
+    def track(self, **labels) -> Iterator[None]:
+        """Increment for the duration of a block (in-flight work)"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._observations: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts + [sum, count]
+    
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._observations.get(key)
+            if state is None:
+                state = self._observations[key] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+    
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            observations = {key: list(state) for key, state in self._observations.items()}
+        
+        lines = []
+        for key, state in sorted(observations.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(state[-1])}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Process-wide collection of metrics rendered in the Prometheus text format.
+    
+    Every API process keeps its own registry, so with several uvicorn
+    workers each one must be scraped (or the values summed) separately.
+    """
+    
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+    
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def render(self) -> str:
+        blocks = []
+        for metric in self._metrics.values():
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {e}")
+        return "\n".join(blocks) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+# HTTP
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]))
+RATE_LIMIT_REJECTIONS = REGISTRY.register(Counter(
+    "rate_limit_rejections_total", "Requests rejected by the rate limiter", ["prefix"]))
+
+# Uploads
+UPLOAD_BYTES = REGISTRY.register(Counter(
+    "upload_bytes_total", "Bytes received in uploaded files", ["format"]))
+UPLOAD_WRITE_SECONDS = REGISTRY.register(Histogram(
+    "upload_write_seconds", "Time to stream an upload to disk", ["format"]))
+UPLOAD_FORMAT_CHECKS = REGISTRY.register(Counter(
+    "upload_format_checks_total", "Uploads by how their sniffed content compared to the extension", ["result"]))
+
+# Conversions
+CONVERSIONS = REGISTRY.register(Counter(
+    "conversions_total", "Conversions run, by outcome", ["category", "pair", "status"]))
+CONVERSION_SECONDS = REGISTRY.register(Histogram(
+    "conversion_duration_seconds", "End-to-end conversion latency (including cache hits)", ["category", "pair"]))
+CONVERSION_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "conversion_stage_seconds", "Time per conversion stage", ["category", "pair", "stage"]))
+CONVERSION_BYTES_IN = REGISTRY.register(Counter(
+    "conversion_bytes_in_total", "Input bytes converted", ["category"]))
+CONVERSION_BYTES_OUT = REGISTRY.register(Counter(
+    "conversion_bytes_out_total", "Output bytes produced", ["category"]))
+CONVERSIONS_ACTIVE = REGISTRY.register(Gauge(
+    "conversions_active", "Conversions currently running", ["category"]))
+POOL_WORKERS_KILLED = REGISTRY.register(Counter(
+    "pool_workers_killed_total", "Pool workers killed to stop a timed out or cancelled conversion", ["category"]))
+IMAGE_RENDITIONS = REGISTRY.register(Counter(
+    "image_renditions_total", "Image renditions served, by how (not_modified, cached, rendered)", ["result"]))
+
+# Admission control
+ADMISSION_WAITING = REGISTRY.register(Gauge(
+    "admission_waiting", "Conversions waiting for a concurrency slot", ["category"]))
+ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    "admission_rejections_total", "Conversions turned away with 503", ["category", "reason"]))
+
+# Background jobs
+JOB_LEASES_EXPIRED = REGISTRY.register(Counter(
+    "job_leases_expired_total", "Running jobs whose worker stopped renewing its lease", ["outcome"]))
+
+# Scratch space
+SCRATCH_JOBS = REGISTRY.register(Counter(
+    "scratch_jobs_total", "Conversions by where their scratch directory was placed", ["location"]))
+SCRATCH_BYTES = REGISTRY.register(Counter(
+    "scratch_bytes_total", "Bytes left in conversion scratch directories when they were removed", ["location"]))
+SCRATCH_RESERVED = REGISTRY.register(Gauge(
+    "scratch_reserved_bytes", "Scratch space reserved by running conversions (computed at scrape time)", ["location"]))
+
+# Queue and cache (computed at scrape time)
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "job_queue_depth", "Background jobs by status", ["status"]))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "result_cache_lookups_total", "Result cache lookups by outcome", ["result"]))
+
+# Stage timings collected inside the current worker (process or thread)
+_stages = threading.local()
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a stage of the running conversion (decode, encode, output_write, ...).
+    
+    Timings accumulate in the executing worker and are sent back with the
+    result, so converters do not need to know about the metrics registry.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = getattr(_stages, "timings", None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+def start_stages() -> None:
+    _stages.timings = {}
+
+def collect_stages() -> Dict[str, float]:
+    timings = getattr(_stages, "timings", None) or {}
+    _stages.timings = None
+    return timings
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+# Minimum time between two progress messages for the same conversion
+REPORT_INTERVAL_SECONDS = 0.25
+
+# Statuses after which a conversion produces no more events
+TERMINAL_STATUSES = {"completed", "failed"}
+
+# Events buffered per subscriber before the oldest are dropped
+SUBSCRIBER_BUFFER = 256
+
+class ProgressHub:
+    """
+    Fans conversion progress out to Server-Sent Events subscribers.
+    
+    Events come from two places: converters calling ``report_progress``
+    (relayed from pool workers through a multiprocessing queue) and status
+    changes committed on ``Conversion`` rows. The hub is per API process;
+    subscribers fall back to re-reading the database between heartbeats for
+    conversions that another process is running.
+    """
+    
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _subscribers: Dict[int, Set[asyncio.Queue]] = {}
+    _latest: Dict[int, Dict[str, Any]] = {}
+    _relay_queue = None
+    _relay_thread: Optional[threading.Thread] = None
+    
+    @classmethod
+    def start(cls) -> None:
+        """Bind the hub to the running event loop (call from app startup)"""
+        cls._loop = asyncio.get_running_loop()
+    
+    @classmethod
+    def attach_worker_queue(cls, queue) -> None:
+        """Relay events that pool worker processes put on ``queue``"""
+        if cls._relay_thread is not None:
+            return
+        cls._relay_queue = queue
+        cls._relay_thread = threading.Thread(target=cls._relay, args=(queue,), name="progress-relay", daemon=True)
+        cls._relay_thread.start()
+    
+    @classmethod
+    def stop(cls) -> None:
+        if cls._relay_queue is not None:
+            cls._relay_queue.put(None)
+        cls._relay_queue = None
+        cls._relay_thread = None
+    
+    @classmethod
+    def _relay(cls, queue) -> None:
+        while True:
+            try:
+                item = queue.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+            cls.publish_threadsafe(*item)
+    
+    @classmethod
+    def publish_threadsafe(cls, conversion_id: int, update: Dict[str, Any]) -> None:
+        """Publish from any thread; dropped if the API loop is not running"""
+        loop = cls._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(cls.publish, conversion_id, update)
+        except RuntimeError:
+            pass  # loop closed between the check and the call
+    
+    @classmethod
+    def publish(cls, conversion_id: int, update: Dict[str, Any]) -> None:
+        """Merge an update into the conversion's state and push it to subscribers (loop thread only)"""
+        state = dict(cls._latest.get(conversion_id, {"id": conversion_id}))
+        state.update(update)
+        
+        if state.get("status") in TERMINAL_STATUSES:
+            cls._latest.pop(conversion_id, None)
+        else:
+            cls._latest[conversion_id] = state
+        
+        for queue in cls._subscribers.get(conversion_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(state)
+    
+    @classmethod
+    def subscribe(cls, conversion_ids: Iterable[int]) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        for conversion_id in conversion_ids:
+            cls._subscribers.setdefault(conversion_id, set()).add(queue)
+        return queue
+    
+    @classmethod
+    def unsubscribe(cls, conversion_ids: Iterable[int], queue: asyncio.Queue) -> None:
+        for conversion_id in conversion_ids:
+            subscribers = cls._subscribers.get(conversion_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del cls._subscribers[conversion_id]
+    
+    @classmethod
+    def get_latest(cls, conversion_id: int) -> Optional[Dict[str, Any]]:
+        """Last known in-flight state of a conversion in this process"""
+        return cls._latest.get(conversion_id)
+
+def conversion_state(conversion) -> Dict[str, Any]:
+    """Status payload for a conversion row (the ConversionStatus shape)"""
+    state = {"id": conversion.id, "status": conversion.status, "message": conversion.error_message}
+    if conversion.status == "completed":
+        state.update(progress=100, download_url=f"/api/download/{conversion.id}")
+    elif conversion.status in ("queued", "processing"):
+        state["progress"] = 0
+    return state
+
+def format_event(state: Dict[str, Any]) -> str:
+    """Serialize a state as one Server-Sent Events message"""
+    return f"event: {state.get('status') or 'progress'}\ndata: {json.dumps(state, default=str)}\n\n"
+
+# Progress reporting from converters
+
+_local = threading.local()
+_worker_queue = None  # set in pool worker processes
+
+def set_worker_queue(queue) -> None:
+    """Route ``report_progress`` in this process through ``queue`` (pool worker initializer)"""
+    global _worker_queue
+    _worker_queue = queue
+
+@contextmanager
+def reporting(conversion_id: Optional[int]) -> Iterator[None]:
+    """Attribute ``report_progress`` calls in this thread to a conversion"""
+    _local.conversion_id = conversion_id
+    _local.last_sent = (0.0, -1)
+    try:
+        yield
+    finally:
+        _local.conversion_id = None
+
+def report_progress(done: float, total: Optional[float] = None, message: Optional[str] = None) -> None:
+    """
+    Report how far the running conversion has got.
+    
+    A no-op outside a tracked conversion. Updates are throttled to one per
+    percent and per ``REPORT_INTERVAL_SECONDS``; the percentage stops at 99
+    until the conversion's completion is committed.
+    """
+    conversion_id = getattr(_local, "conversion_id", None)
+    if conversion_id is None:
+        return
+    
+    progress = min(99, max(0, int(done * 100 / total))) if total else None
+    now = time.monotonic()
+    last_time, last_progress = _local.last_sent
+    if progress == last_progress or now - last_time < REPORT_INTERVAL_SECONDS:
+        return
+    _local.last_sent = (now, progress)
+    
+    update = {"status": "processing", "progress": progress, "message": message}
+    if _worker_queue is not None:
+        _worker_queue.put((conversion_id, update))
+    else:
+        ProgressHub.publish_threadsafe(conversion_id, update)
+
+def moviepy_logger(weights: Optional[Dict[str, float]] = None):
+    """
+    A proglog logger that turns moviepy's progress bars into ``report_progress`` calls.
+    
+    ``weights`` splits the overall percentage between bars, e.g. the audio
+    ("chunk") and video ("t") passes of ``write_videofile``.
+    """
+    import proglog
+    
+    weights = weights or {}
+    
+    class ProgressReporter(proglog.ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            total = self.bars[bar].get("total")
+            if attr != "index" or not total:
+                return
+            offset = 0.0
+            for name, weight in weights.items():
+                if name == bar:
+                    break
+                offset += weight
+            weight = weights.get(bar, 1.0)
+            report_progress(offset + weight * min(value + 1, total) / total, 1.0, f"Encoding ({bar})")
+    
+    return ProgressReporter()
+
+# Status changes committed on Conversion rows
+
+def watch_conversion_status(session_factory, model) -> None:
+    """Publish status changes committed through ``session_factory`` on ``model`` rows to the hub"""
+    from sqlalchemy import event, inspect
+    
+    def collect(session, flush_context) -> None:
+        changes: List[Dict[str, Any]] = session.info.setdefault("progress_events", [])
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, model) and inspect(obj).attrs.status.history.has_changes():
+                changes.append(conversion_state(obj))
+    
+    def publish(session) -> None:
+        for state in session.info.pop("progress_events", []):
+            ProgressHub.publish_threadsafe(state["id"], state)
+    
+    def discard(session, previous_transaction) -> None:
+        session.info.pop("progress_events", None)
+    
+    event.listen(session_factory, "after_flush", collect)
+    event.listen(session_factory, "after_commit", publish)
+    event.listen(session_factory, "after_soft_rollback", discard)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import func
+from app.config import settings
+from app.database import SessionLocal, CacheEntry
+from app.utils.file_handler import FileHandler
+
+class ResultCache:
+    """
+    Content-addressed cache of conversion outputs.
+    
+    Entries are keyed on the SHA-256 of the input bytes plus the target
+    format, conversion parameters and converter version, and stored under
+    ``outputs/.cache`` with least-recently-used eviction once the cache
+    grows past ``result_cache_max_mb``.
+    """
+    
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+    
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        """SHA-256 of a file, memoized on (path, size, mtime) so repeat lookups are free"""
+        stat = os.stat(file_path)
+        return _hash_file(file_path, stat.st_size, stat.st_mtime_ns)
+    
+    @staticmethod
+    def make_key(content_hash: str, target_format: str,
+                 params: Optional[Dict[str, Any]] = None, version: str = "1") -> str:
+        """Build the cache key for a conversion"""
+        payload = json.dumps({
+            "input": content_hash,
+            "target": target_format.lower(),
+            "params": params or {},
+            "version": version
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _cache_path(key: str, ext: str) -> str:
+        return os.path.join(settings.result_cache_dir, key[:2], f"{key}{ext}")
+    
+    @staticmethod
+    def link_or_copy(src: str, dst: str) -> None:
+        """Hardlink src to dst, falling back to a copy across filesystems"""
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        if os.path.exists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+    
+    @classmethod
+    def lookup(cls, key: str) -> Optional[str]:
+        """Path of a cached result, marked as just used, or None on a miss"""
+        db = SessionLocal()
+        try:
+            entry = db.query(CacheEntry).filter(CacheEntry.key == key).first()
+            
+            if entry is None or not os.path.exists(entry.path):
+                if entry is not None:
+                    db.delete(entry)
+                    db.commit()
+                with cls._lock:
+                    cls.misses += 1
+                return None
+            
+            entry.hits = (entry.hits or 0) + 1
+            entry.last_accessed_at = datetime.utcnow()
+            db.commit()
+            
+            with cls._lock:
+                cls.hits += 1
+            return entry.path
+        finally:
+            db.close()
+    
+    @classmethod
+    def fetch(cls, key: str, output_path: str) -> bool:
+        """Materialize a cached result at output_path. Returns True on a hit."""
+        cached_path = cls.lookup(key)
+        if cached_path is None:
+            return False
+        cls.link_or_copy(cached_path, output_path)
+        return True
+    
+    @classmethod
+    def store(cls, key: str, result_path: str) -> Optional[str]:
+        """Add a freshly converted file to the cache and evict old entries if needed. Returns its cache path."""
+        if not os.path.isfile(result_path):
+            return None
+        
+        cache_path = cls._cache_path(key, os.path.splitext(result_path)[1])
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        
+        # Write under a temporary name first so readers never see a partial file
+        temp_path = f"{cache_path}.{uuid.uuid4().hex[:8]}.tmp"
+        cls.link_or_copy(result_path, temp_path)
+        os.replace(temp_path, cache_path)
+        
+        db = SessionLocal()
+        try:
+            db.merge(CacheEntry(
+                key=key,
+                path=cache_path,
+                size_bytes=os.path.getsize(cache_path),
+                hits=0,
+                created_at=datetime.utcnow(),
+                last_accessed_at=datetime.utcnow()
+            ))
+            db.commit()
+            cls.evict(db)
+        finally:
+            db.close()
+        return cache_path
+    
+    @staticmethod
+    def evict(db, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Delete least-recently-used entries until the cache fits ``max_bytes`` (default: its size budget).
+        
+        Returns (entries evicted, bytes freed on disk); files still hard
+        linked elsewhere (an output fetched from the cache) free nothing.
+        """
+        if max_bytes is None:
+            max_bytes = settings.result_cache_max_mb * 1024 * 1024
+        total = db.query(func.coalesce(func.sum(CacheEntry.size_bytes), 0)).scalar()
+        if total <= max_bytes:
+            return 0, 0
+        
+        evicted = freed = 0
+        while total > max_bytes:
+            oldest = db.query(CacheEntry).order_by(CacheEntry.last_accessed_at).limit(100).all()
+            if not oldest:
+                break
+            
+            for entry in oldest:
+                if total <= max_bytes:
+                    break
+                freed += FileHandler.delete_file_freeing(entry.path)
+                total -= entry.size_bytes or 0
+                db.delete(entry)
+                evicted += 1
+            
+            db.commit()
+        
+        return evicted, freed
+    
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus overall cache size"""
+        db = SessionLocal()
+        try:
+            entries, size_bytes = db.query(
+                func.count(CacheEntry.key),
+                func.coalesce(func.sum(CacheEntry.size_bytes), 0)
+            ).one()
+        finally:
+            db.close()
+        
+        lookups = cls.hits + cls.misses
+        return {
+            "enabled": settings.result_cache_enabled,
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "hit_rate": cls.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_mb": size_bytes / (1024 * 1024),
+            "max_size_mb": settings.result_cache_max_mb
+        }
+
+@lru_cache(maxsize=4096)
+def _hash_file(file_path: str, size: int, mtime_ns: int) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
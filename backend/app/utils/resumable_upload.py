@@ -0,0 +1,364 @@
+import base64
+import binascii
+import hashlib
+import os
+import secrets
+import shutil
+import time
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+import aiofiles
+from fastapi import HTTPException
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from starlette.requests import ClientDisconnect
+from app.config import settings
+from app.database import Conversion, UploadSession, get_expiry
+from app.utils.executor import ConversionExecutor
+from app.utils.file_handler import FileHandler
+from app.utils.validators import FileValidator
+from app.utils.sniffer import SNIFF_BYTES, resolve_format, sniff_file
+from app.utils.storage import Storage
+from app.utils.metrics import UPLOAD_BYTES
+
+# Suffix of upload files that are still receiving chunks
+PARTIAL_SUFFIX = ".part"
+
+# Algorithms accepted in the Upload-Checksum header
+CHECKSUM_ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "sha1": hashlib.sha1,
+    "md5": hashlib.md5,
+}
+
+def get_upload_expiry(start: datetime = None) -> datetime:
+    """Deadline for the next chunk of an unfinished upload"""
+    return (start or datetime.utcnow()) + timedelta(hours=settings.resumable_upload_expiry_hours)
+
+class ResumableUploads:
+    """
+    Resumable uploads following the tus 1.0 protocol.
+    
+    An upload is created with its total size, then filled by PATCH requests
+    that each append bytes at the current offset, so a dropped connection
+    only loses the chunk in flight. Bytes go straight into a ``.part`` file
+    in the upload directory, which is renamed and turned into a
+    ``Conversion`` row once complete. Large files can also be sent as several
+    partial uploads in parallel and concatenated at the end.
+    
+    A PATCH first claims the upload in the database (a lease at the
+    expected offset), then writes. Two requests for the same offset, in
+    any process, can therefore never write the same bytes.
+    """
+    
+    @staticmethod
+    def parse_metadata(header: Optional[str]) -> Dict[str, str]:
+        """Decode an Upload-Metadata header ("key base64value,key base64value")"""
+        metadata = {}
+        for pair in (header or "").split(","):
+            key, _, value = pair.strip().partition(" ")
+            if not key:
+                continue
+            try:
+                metadata[key] = base64.b64decode(value, validate=True).decode("utf-8") if value else ""
+            except (binascii.Error, UnicodeDecodeError):
+                raise HTTPException(status_code=400, detail=f"Invalid Upload-Metadata value for {key}")
+        return metadata
+    
+    @staticmethod
+    def get_path(upload: UploadSession) -> str:
+        """Where the upload's bytes are while it is incomplete"""
+        legacy_path = os.path.join(settings.upload_dir, upload.filename + PARTIAL_SUFFIX)
+        if os.path.exists(legacy_path):
+            return legacy_path  # started before uploads were sharded
+        return Storage.upload_path(upload.filename) + PARTIAL_SUFFIX
+    
+    @staticmethod
+    def get(db: Session, upload_id: str) -> UploadSession:
+        upload = db.query(UploadSession).filter(UploadSession.id == upload_id).first()
+        if upload is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        return upload
+    
+    @staticmethod
+    def create(db: Session, upload_length: int, filename: Optional[str], target_format: Optional[str] = None,
+               is_partial: bool = False, ip_address: Optional[str] = None) -> UploadSession:
+        """Register a new upload and create its empty file"""
+        if upload_length < 0:
+            raise HTTPException(status_code=400, detail="Upload-Length must not be negative")
+        if upload_length > settings.max_file_size_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File size exceeds maximum allowed size ({settings.max_file_size_mb}MB)"
+            )
+        
+        # Partial uploads are only named when they are concatenated
+        if not is_partial:
+            if not filename:
+                raise HTTPException(status_code=400, detail="Upload-Metadata must include a filename")
+            source_format = FileHandler.get_file_extension(filename)
+            if not FileValidator.is_format_supported(source_format):
+                raise HTTPException(status_code=400, detail=f"Unsupported source format: {source_format}")
+        
+        upload = UploadSession(
+            id=secrets.token_urlsafe(16),
+            original_filename=filename,
+            filename=FileHandler.generate_unique_filename(os.path.basename(filename or "part")),
+            upload_length=upload_length,
+            offset=0,
+            target_format=target_format,
+            is_partial=is_partial,
+            status="uploading",
+            ip_address=ip_address,
+            expires_at=get_upload_expiry()
+        )
+        open(ResumableUploads.get_path(upload), "wb").close()
+        
+        db.add(upload)
+        db.commit()
+        db.refresh(upload)
+        return upload
+    
+    @staticmethod
+    def parse_checksum(header: Optional[str]):
+        """Hash object and expected digest for an Upload-Checksum header ("algorithm base64digest")"""
+        if not header:
+            return None, None
+        algorithm, _, encoded = header.strip().partition(" ")
+        if algorithm.lower() not in CHECKSUM_ALGORITHMS:
+            raise HTTPException(status_code=400, detail=f"Unsupported checksum algorithm: {algorithm}")
+        try:
+            expected = base64.b64decode(encoded, validate=True)
+        except binascii.Error:
+            raise HTTPException(status_code=400, detail="Invalid Upload-Checksum digest")
+        return CHECKSUM_ALGORITHMS[algorithm.lower()](), expected
+    
+    @staticmethod
+    def claim(db: Session, upload: UploadSession, offset: int) -> str:
+        """
+        Take the write lease on an upload at ``offset`` and return its token.
+        
+        Fails with 409 if the offset has moved on and 423 if another PATCH
+        holds an unexpired lease.
+        """
+        token = secrets.token_urlsafe(8)
+        now = datetime.utcnow()
+        claimed = db.query(UploadSession).filter(
+            UploadSession.id == upload.id,
+            UploadSession.status == "uploading",
+            UploadSession.offset == offset,
+            or_(UploadSession.lease_owner.is_(None), UploadSession.lease_expires_at <= now)
+        ).update({
+            UploadSession.lease_owner: token,
+            UploadSession.lease_expires_at: now + timedelta(seconds=settings.resumable_upload_lease_seconds)
+        }, synchronize_session=False)
+        db.commit()
+        db.refresh(upload)
+        if claimed == 1:
+            return token
+        if upload.status != "uploading":
+            raise HTTPException(status_code=409, detail="Upload is already complete")
+        if upload.offset != offset:
+            raise HTTPException(status_code=409, detail=f"Upload-Offset {offset} does not match current offset {upload.offset}")
+        raise HTTPException(status_code=423, detail="Another chunk of this upload is being written")
+    
+    @staticmethod
+    def renew(db: Session, upload: UploadSession, token: str) -> None:
+        """Extend a held lease; 409 if it ran out and another PATCH took the upload"""
+        renewed = db.query(UploadSession).filter(
+            UploadSession.id == upload.id,
+            UploadSession.lease_owner == token
+        ).update({
+            UploadSession.lease_expires_at: datetime.utcnow() + timedelta(seconds=settings.resumable_upload_lease_seconds)
+        }, synchronize_session=False)
+        db.commit()
+        if renewed != 1:
+            raise HTTPException(status_code=409, detail="Upload was modified concurrently")
+    
+    @staticmethod
+    def release(db: Session, upload: UploadSession, token: str, received: int = 0) -> bool:
+        """
+        Give up the lease, moving the offset past ``received`` kept bytes.
+        
+        Returns False if the lease had already been lost.
+        """
+        now = datetime.utcnow()
+        values = {UploadSession.lease_owner: None, UploadSession.lease_expires_at: None}
+        if received:
+            values.update({
+                UploadSession.offset: UploadSession.offset + received,
+                UploadSession.updated_at: now,
+                UploadSession.expires_at: get_upload_expiry(now)
+            })
+        released = db.query(UploadSession).filter(
+            UploadSession.id == upload.id,
+            UploadSession.lease_owner == token
+        ).update(values, synchronize_session=False)
+        db.commit()
+        db.refresh(upload)
+        return released == 1
+    
+    @classmethod
+    async def append(cls, db: Session, upload: UploadSession, offset: int,
+                     body: AsyncIterator[bytes], checksum: Optional[str] = None) -> int:
+        """
+        Write a chunk at ``offset`` and return the new offset.
+        
+        With an Upload-Checksum the chunk is kept only if it matches (tus
+        status 460 otherwise). Without one, the bytes that arrived before a
+        dropped connection are kept so the client can resume after them.
+        """
+        hasher, expected = cls.parse_checksum(checksum)
+        token = cls.claim(db, upload, offset)
+        path = cls.get_path(upload)
+        extension = FileHandler.get_file_extension(upload.original_filename or "") or "unknown"
+        renew_every = settings.resumable_upload_lease_seconds / 3
+        renewed_at = time.monotonic()
+        received = 0
+        disconnected = False
+        kept = False
+        
+        try:
+            async with aiofiles.open(path, "r+b") as f:
+                await f.seek(offset)
+                try:
+                    async for chunk in body:
+                        if not chunk:
+                            continue
+                        received += len(chunk)
+                        if offset + received > upload.upload_length:
+                            await f.truncate(offset)
+                            raise HTTPException(status_code=413, detail="Chunk runs past Upload-Length")
+                        if hasher is not None:
+                            hasher.update(chunk)
+                        await f.write(chunk)
+                        if time.monotonic() - renewed_at >= renew_every:
+                            cls.renew(db, upload, token)
+                            renewed_at = time.monotonic()
+                except ClientDisconnect:
+                    disconnected = True
+                
+                if hasher is not None and (disconnected or hasher.digest() != expected):
+                    await f.truncate(offset)
+                    if disconnected:
+                        raise HTTPException(status_code=400, detail="Client disconnected")
+                    raise HTTPException(status_code=460, detail="Checksum Mismatch")
+            
+            kept = True
+            if not cls.release(db, upload, token, received):
+                raise HTTPException(status_code=409, detail="Upload was modified concurrently")
+            
+            UPLOAD_BYTES.inc(received, format=extension)
+            
+            # Check the content as soon as its head is in, so junk is
+            # turned away before the rest of it is uploaded
+            if not upload.is_partial and offset < min(SNIFF_BYTES, upload.upload_length) <= upload.offset:
+                try:
+                    resolve_format(extension, sniff_file(path), record=False)
+                except HTTPException:
+                    cls.delete(db, upload)
+                    raise
+            
+            if disconnected:
+                raise HTTPException(status_code=400, detail="Client disconnected")
+            return upload.offset
+        finally:
+            if not kept:
+                cls.release(db, upload, token)
+    
+    @staticmethod
+    async def finish(db: Session, upload: UploadSession) -> Optional[Conversion]:
+        """Turn a fully received upload into a Conversion (partial uploads just stay complete)"""
+        if upload.status != "uploading" or upload.offset < upload.upload_length:
+            return None
+        
+        if upload.is_partial:
+            upload.status = "completed"
+            db.commit()
+            return None
+        
+        partial_path = ResumableUploads.get_path(upload)
+        content_hash, detected_format = await ConversionExecutor.run_in_thread(FileHandler.digest_file, partial_path)
+        try:
+            source_format = resolve_format(FileHandler.get_file_extension(upload.original_filename), detected_format)
+        except HTTPException:
+            ResumableUploads.delete(db, upload)
+            raise
+        
+        # Stored under the format it is converted as
+        final_path = os.path.join(os.path.dirname(partial_path), os.path.splitext(upload.filename)[0] + "." + source_format)
+        os.replace(partial_path, final_path)
+        upload.filename = os.path.basename(final_path)
+        await Storage.persist(final_path)
+        
+        conversion = Conversion(
+            filename=upload.filename,
+            source_format=source_format,
+            target_format=upload.target_format or "",
+            file_size=upload.upload_length / (1024 * 1024),
+            status="uploaded",
+            ip_address=upload.ip_address,
+            content_hash=content_hash,
+            detected_format=detected_format,
+            expires_at=get_expiry()
+        )
+        db.add(conversion)
+        db.flush()
+        
+        upload.status = "completed"
+        upload.conversion_id = conversion.id
+        upload.expires_at = conversion.expires_at
+        db.commit()
+        db.refresh(conversion)
+        return conversion
+    
+    @classmethod
+    async def concatenate(cls, db: Session, part_ids: List[str], filename: Optional[str],
+                          target_format: Optional[str] = None, ip_address: Optional[str] = None) -> UploadSession:
+        """Create a complete upload from finished partial uploads, in the order given"""
+        parts = [cls.get(db, part_id) for part_id in part_ids]
+        if not parts:
+            raise HTTPException(status_code=400, detail="Upload-Concat final needs at least one partial upload")
+        for part in parts:
+            if not part.is_partial or part.status != "completed":
+                raise HTTPException(status_code=400, detail=f"Upload {part.id} is not a completed partial upload")
+        
+        upload = cls.create(db, sum(part.upload_length for part in parts), filename, target_format,
+                            ip_address=ip_address)
+        
+        def join() -> None:
+            with open(cls.get_path(upload), "wb") as out:
+                for part in parts:
+                    with open(cls.get_path(part), "rb") as f:
+                        shutil.copyfileobj(f, out, settings.upload_chunk_size_kb * 1024)
+        
+        try:
+            await ConversionExecutor.run_in_thread(join)
+        except BaseException:
+            cls.delete(db, upload)
+            raise
+        
+        upload.offset = upload.upload_length
+        for part in parts:
+            cls.delete(db, part, commit=False)
+        db.commit()
+        return upload
+    
+    @staticmethod
+    def delete(db: Session, upload: UploadSession, commit: bool = True) -> None:
+        """Discard an upload and whatever it has received (its Conversion, if any, is kept)"""
+        if upload.status == "uploading" or upload.is_partial:
+            FileHandler.delete_file(ResumableUploads.get_path(upload))
+        db.delete(upload)
+        if commit:
+            db.commit()
+    
+    @staticmethod
+    def expire(db: Session, now: Optional[datetime] = None) -> int:
+        """Delete abandoned uploads and the bookkeeping of finished ones. Returns the number removed."""
+        now = now or datetime.utcnow()
+        expired = db.query(UploadSession).filter(UploadSession.expires_at <= now).all()
+        for upload in expired:
+            ResumableUploads.delete(db, upload, commit=False)
+        db.commit()
+        return len(expired)
@@ -0,0 +1,194 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+from app.config import settings
+
+# Directory (under each scratch location) that holds per-job scratch directories
+SCRATCH_ROOT = "fileconv-scratch"
+
+_local = threading.local()
+
+class ScratchSpace:
+    """
+    Per-conversion scratch directories for intermediate files.
+    
+    Each conversion running in a pool worker gets its own directory, placed
+    on tmpfs (``/dev/shm``) while the space reserved there stays within
+    ``scratch_tmpfs_budget_mb`` and on disk otherwise. A directory's name
+    carries its owner's pid and its reservation
+    (``{pid}-{nonce}-{bytes}``), so every process can total the
+    reservations with one ``listdir`` and directories left behind by killed
+    workers can be recognized and removed. Converters ask for
+    subdirectories with ``ScratchSpace.directory()``; everything is deleted
+    when the conversion ends, whether it succeeded or not.
+    """
+    
+    @staticmethod
+    def get_locations() -> Dict[str, str]:
+        """Scratch root per location ("tmpfs" only when a writable tmpfs exists)"""
+        locations = {}
+        tmpfs_dir = settings.scratch_tmpfs_dir
+        if tmpfs_dir and settings.scratch_tmpfs_budget_mb > 0 and os.path.isdir(tmpfs_dir) and os.access(tmpfs_dir, os.W_OK):
+            locations["tmpfs"] = os.path.join(tmpfs_dir, SCRATCH_ROOT)
+        locations["disk"] = os.path.join(settings.scratch_disk_dir or tempfile.gettempdir(), SCRATCH_ROOT)
+        return locations
+    
+    @staticmethod
+    def _parse(name: str) -> Optional[Tuple[int, int]]:
+        """(pid, reserved bytes) from a job directory name"""
+        parts = name.split("-")
+        if len(parts) != 3 or not parts[0].isdigit() or not parts[2].isdigit():
+            return None
+        return int(parts[0]), int(parts[2])
+    
+    @classmethod
+    def get_reserved(cls, root: str) -> int:
+        """Bytes reserved by the job directories under a scratch root"""
+        try:
+            names = os.listdir(root)
+        except FileNotFoundError:
+            return 0
+        return sum(parsed[1] for parsed in map(cls._parse, names) if parsed is not None)
+    
+    @classmethod
+    def choose_location(cls, expected_bytes: int) -> Tuple[str, str]:
+        """(location, root) for a new job: tmpfs if the reservation fits its budget and free space"""
+        locations = cls.get_locations()
+        tmpfs_root = locations.get("tmpfs")
+        if tmpfs_root is not None:
+            budget = settings.scratch_tmpfs_budget_mb * 1024 * 1024
+            if cls.get_reserved(tmpfs_root) + expected_bytes <= budget:
+                try:
+                    free = shutil.disk_usage(settings.scratch_tmpfs_dir).free
+                except OSError:
+                    free = 0
+                if expected_bytes < free:
+                    return "tmpfs", tmpfs_root
+        return "disk", locations["disk"]
+    
+    @classmethod
+    def create(cls, expected_bytes: int = 0, token: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Make a job directory and return (location, path).
+        
+        For work that outlives a ``with`` block (e.g. a streamed response);
+        the caller removes it. Conversions use ``job()`` instead.
+        """
+        location, root = cls.choose_location(expected_bytes)
+        path = os.path.join(root, f"{os.getpid()}-{token or uuid.uuid4().hex[:8]}-{max(0, int(expected_bytes))}")
+        os.makedirs(path)
+        return location, path
+    
+    @classmethod
+    @contextmanager
+    def job(cls, expected_bytes: int = 0, token: Optional[str] = None) -> Iterator[str]:
+        """
+        Scratch directory for the conversion running in this thread.
+        
+        ``token`` (letters and digits) replaces the random nonce in the
+        directory name so the caller can find the process running the job
+        with ``find_job``. Removed on exit. The bytes its subdirectories held when they were
+        removed, plus what is left at the end, are left in ``take_usage()``
+        for the caller to report.
+        """
+        location, path = cls.create(expected_bytes, token)
+        
+        previous = getattr(_local, "job", None), getattr(_local, "released", 0)
+        _local.job, _local.released = path, 0
+        try:
+            yield path
+        finally:
+            _local.usage = (location, _local.released + _tree_size(path))
+            _local.job, _local.released = previous
+            shutil.rmtree(path, ignore_errors=True)
+    
+    @staticmethod
+    def take_usage() -> Optional[Tuple[str, int]]:
+        """(location, bytes) of the last job scratch directory closed in this thread"""
+        usage = getattr(_local, "usage", None)
+        _local.usage = None
+        return usage
+    
+    @classmethod
+    @contextmanager
+    def directory(cls, prefix: str = "work") -> Iterator[str]:
+        """
+        A fresh directory for intermediates, removed on exit.
+        
+        Inside a conversion it is created in the conversion's scratch
+        directory; elsewhere it gets a scratch directory of its own.
+        """
+        parent = getattr(_local, "job", None)
+        if parent is None:
+            with cls.job() as path:
+                yield path
+            cls.take_usage()  # not part of any conversion's report
+            return
+        
+        path = tempfile.mkdtemp(prefix=f"{prefix}_", dir=parent)
+        try:
+            yield path
+        finally:
+            _local.released += _tree_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+    
+    @classmethod
+    def find_job(cls, token: str) -> Optional[Tuple[int, str]]:
+        """(pid, path) of the job directory created with ``token``, or None if there is none (yet)"""
+        for root in cls.get_locations().values():
+            try:
+                names = os.listdir(root)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                parsed = cls._parse(name)
+                if parsed is not None and name.split("-")[1] == token:
+                    return parsed[0], os.path.join(root, name)
+        return None
+    
+    @classmethod
+    def sweep(cls) -> int:
+        """Remove job directories whose process is gone (killed or crashed workers). Returns the number removed."""
+        removed = 0
+        for root in cls.get_locations().values():
+            try:
+                names = os.listdir(root)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                parsed = cls._parse(name)
+                if parsed is None or _pid_alive(parsed[0]):
+                    continue
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+                removed += 1
+        return removed
+    
+    @classmethod
+    def get_stats(cls) -> Dict[Tuple[str], int]:
+        """Bytes reserved per location, for the scratch_reserved_bytes gauge"""
+        return {(location,): cls.get_reserved(root) for location, root in cls.get_locations().items()}
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        return True  # os.kill would terminate it; leave Windows leftovers to the temp dir cleanup
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
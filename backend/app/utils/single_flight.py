@@ -0,0 +1,221 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.database import SessionLocal, InflightConversion
+from app.utils.result_cache import ResultCache
+
+class SingleFlight:
+    """
+    Collapses concurrent identical conversions into one run.
+    
+    Requests are keyed like the result cache (input hash, target, params,
+    converter version). Within a process, later requests for a key await the
+    running conversion's future. Across processes, the first to insert the
+    key's ``inflight_conversions`` row runs the conversion while holding a
+    lease; the others poll the row and copy its output once it is done. A
+    leader that dies stops renewing its lease and a waiter takes over.
+    
+    Only a successful result outlives its run (for ``single_flight_linger_seconds``).
+    A failure is passed to the requests of this process that were already
+    waiting, and the key is released at once. Later requests, and
+    waiters in other processes, never see the failure; one of them runs the
+    conversion again.
+    """
+    
+    _flights: Dict[str, asyncio.Future] = {}
+    
+    @staticmethod
+    def _claim(key: str, owner: str) -> bool:
+        """Insert the key's row (replacing a stale one). True if this caller now leads the conversion."""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            db.query(InflightConversion).filter(
+                InflightConversion.key == key,
+                or_(
+                    and_(InflightConversion.status == "running", InflightConversion.lease_expires_at <= now),
+                    InflightConversion.status == "failed",
+                    and_(
+                        InflightConversion.status == "completed",
+                        InflightConversion.finished_at <= now - timedelta(seconds=settings.single_flight_linger_seconds)
+                    )
+                )
+            ).delete(synchronize_session=False)
+            db.add(InflightConversion(
+                key=key,
+                owner=owner,
+                status="running",
+                started_at=now,
+                lease_expires_at=now + timedelta(seconds=settings.single_flight_lease_seconds)
+            ))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+    
+    @staticmethod
+    def _peek(key: str) -> Optional[Tuple[str, Optional[str]]]:
+        """(status, result_path) of the key's row, or None if there is none"""
+        db = SessionLocal()
+        try:
+            row = db.query(InflightConversion).filter(InflightConversion.key == key).first()
+            return None if row is None else (row.status, row.result_path)
+        finally:
+            db.close()
+    
+    @staticmethod
+    def _release(key: str, owner: str) -> None:
+        """Delete the key's row if ``owner`` still holds it"""
+        db = SessionLocal()
+        try:
+            db.query(InflightConversion).filter(
+                InflightConversion.key == key,
+                InflightConversion.owner == owner
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+    
+    @staticmethod
+    def _update(key: str, owner: str, **values) -> bool:
+        """Update the key's row if ``owner`` still holds it"""
+        db = SessionLocal()
+        try:
+            updated = db.query(InflightConversion).filter(
+                InflightConversion.key == key,
+                InflightConversion.owner == owner
+            ).update(values, synchronize_session=False)
+            db.commit()
+            return updated == 1
+        finally:
+            db.close()
+    
+    @classmethod
+    async def _keep_lease(cls, key: str, owner: str) -> None:
+        """Renew the leader's lease until cancelled"""
+        from app.utils.executor import ConversionExecutor
+        
+        while True:
+            await asyncio.sleep(settings.single_flight_heartbeat_seconds)
+            try:
+                expires = datetime.utcnow() + timedelta(seconds=settings.single_flight_lease_seconds)
+                await ConversionExecutor.run_in_thread(
+                    cls._update, key, owner, lease_expires_at=expires
+                )
+            except Exception as e:
+                print(f"Error renewing single-flight lease: {e}")
+    
+    @classmethod
+    async def run(cls, key: str, output_path: str,
+                  produce: Callable[[], Awaitable[str]]) -> Tuple[str, str]:
+        """
+        Produce the result for ``key`` at most once at a time.
+        
+        Args:
+            key: Deduplication key (see ``ResultCache.make_key``)
+            output_path: Where this caller wants the result
+            produce: Runs the conversion and returns the result path
+        
+        Returns:
+            (result path, "completed" if this call converted or "joined" if it
+            received another request's output)
+        """
+        while True:
+            flight = cls._flights.get(key)
+            if flight is None:
+                break
+            try:
+                result_path = await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if flight.cancelled():
+                    continue  # the leading request went away; try to lead
+                raise
+            if not (isinstance(result_path, str) and os.path.isfile(result_path)):
+                return await produce(), "completed"  # nothing on disk to share
+            return await cls._join(result_path, output_path), "joined"
+        
+        flight = asyncio.get_running_loop().create_future()
+        cls._flights[key] = flight
+        try:
+            result_path, status = await cls._lead(key, output_path, produce)
+            flight.set_result(result_path)
+            return result_path, status
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            flight.exception()  # retrieved, even if nobody was waiting
+            raise
+        finally:
+            cls._flights.pop(key, None)
+    
+    @classmethod
+    async def _lead(cls, key: str, output_path: str,
+                    produce: Callable[[], Awaitable[str]]) -> Tuple[str, str]:
+        """Run the conversion, or wait for another process that is already running it"""
+        from app.utils.executor import ConversionExecutor
+        
+        owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        while not await ConversionExecutor.run_in_thread(cls._claim, key, owner):
+            state = await ConversionExecutor.run_in_thread(cls._peek, key)
+            if state is not None:
+                status, result_path = state
+                if status == "completed" and result_path and os.path.isfile(result_path):
+                    return await cls._join(result_path, output_path), "joined"
+            await asyncio.sleep(settings.single_flight_poll_seconds)
+        
+        heartbeat = asyncio.create_task(cls._keep_lease(key, owner))
+        try:
+            result_path = await produce()
+        except BaseException:
+            heartbeat.cancel()
+            # Failed or cancelled: free the key now, so nobody arriving later is
+            # handed this error and a waiting process can take over
+            try:
+                await asyncio.shield(ConversionExecutor.run_in_thread(cls._release, key, owner))
+            except Exception as release_error:
+                print(f"Error releasing single-flight key: {release_error}")
+            raise
+        
+        heartbeat.cancel()
+        try:
+            await ConversionExecutor.run_in_thread(
+                cls._update, key, owner,
+                status="completed", result_path=result_path if isinstance(result_path, str) else None,
+                finished_at=datetime.utcnow()
+            )
+        except Exception as e:
+            print(f"Error recording single-flight result: {e}")
+        return result_path, "completed"
+    
+    @staticmethod
+    async def _join(result_path: str, output_path: str) -> str:
+        """Give a waiting request its own copy (hardlink) of the shared output"""
+        from app.utils.executor import ConversionExecutor
+        
+        if os.path.abspath(result_path) != os.path.abspath(output_path):
+            await ConversionExecutor.run_in_thread(ResultCache.link_or_copy, result_path, output_path)
+        return output_path
+    
+    @staticmethod
+    def purge(db, now: Optional[datetime] = None) -> int:
+        """Delete rows of finished or abandoned flights. Returns the number removed."""
+        now = now or datetime.utcnow()
+        linger = now - timedelta(seconds=settings.single_flight_linger_seconds)
+        removed = db.query(InflightConversion).filter(or_(
+            and_(InflightConversion.status == "running", InflightConversion.lease_expires_at <= now),
+            InflightConversion.status == "failed",
+            and_(InflightConversion.status == "completed", InflightConversion.finished_at <= linger)
+        )).delete(synchronize_session=False)
+        db.commit()
+        return removed
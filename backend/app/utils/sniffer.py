@@ -0,0 +1,277 @@
+import struct
+from typing import Callable, Dict, Optional, Set
+from fastapi import HTTPException
+from app.utils.validators import FileValidator
+from app.utils.metrics import UPLOAD_FORMAT_CHECKS
+
+# Bytes read from the start of a file to identify it
+SNIFF_BYTES = 8192
+
+# (offset, signature, format) - checked in order, first match wins. Formats
+# with a refiner below are narrowed down (or dismissed) by looking further.
+MAGIC_SIGNATURES = [
+    (0, b"\x89PNG\r\n\x1a\n", "png"),
+    (0, b"\xff\xd8\xff", "jpg"),
+    (0, b"GIF87a", "gif"),
+    (0, b"GIF89a", "gif"),
+    (0, b"%PDF", "pdf"),
+    (0, b"%!PS", "ps"),
+    (0, b"{\\rtf", "rtf"),
+    (0, b"BM", "bmp"),
+    (0, b"II*\x00", "tiff"),
+    (0, b"MM\x00*", "tiff"),
+    (0, b"\x00\x00\x01\x00", "ico"),
+    (0, b"\x00\x00\x00\x0cjP  \r\n\x87\n", "jp2"),
+    (0, b"\xff\x4f\xff\x51", "j2k"),
+    (0, b"8BPS", "psd"),
+    (0, b"AC10", "dwg"),
+    (0, b"PK\x03\x04", "zip"),
+    (0, b"PK\x05\x06", "zip"),  # empty archive
+    (0, b"Rar!\x1a\x07", "rar"),
+    (0, b"7z\xbc\xaf\x27\x1c", "7z"),
+    (0, b"\x1f\x8b\x08", "gz"),
+    (0, b"BZh", "bz2"),
+    (0, b"\xfd7zXZ\x00", "xz"),
+    (0, b"\x28\xb5\x2f\xfd", "zst"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "ole"),
+    (0, b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", "asf"),
+    (0, b"SQLite format 3\x00", "sqlite"),
+    (0, b"fLaC", "flac"),
+    (0, b"OggS", "ogg"),
+    (0, b"ID3", "mp3"),
+    (0, b"\x1a\x45\xdf\xa3", "mkv"),
+    (0, b"FLV\x01", "flv"),
+    (0, b"\x00\x00\x01\xba", "mpeg"),
+    (0, b"\x00\x00\x01\xb3", "mpeg"),
+    (0, b"PAR1", "parquet"),
+    (0, b"Obj\x01", "avro"),
+    (0, b"MZ", "exe"),
+    (0, b"\x7fELF", "elf"),
+    (4, b"ftyp", "mp4"),
+    (8, b"WEBP", "webp"),
+    (8, b"WAVE", "wav"),
+    (8, b"AVI ", "avi"),
+    (60, b"BOOKMOBI", "mobi"),
+    (257, b"ustar", "tar"),
+]
+
+# Extensions trusted as-is for a sniffed format: aliases, and formats the
+# first few KB cannot tell apart (generic results such as "zip" or "ole")
+COMPATIBLE_EXTENSIONS: Dict[str, Set[str]] = {
+    "jpg": {"jpeg"},
+    "tiff": {"tif", "cr2", "nef", "arw", "dng", "raw"},
+    "cr2": {"tiff", "tif", "raw"},
+    "pdf": {"ai"},
+    "ps": {"eps", "ai"},
+    "gz": {"gzip", "tgz"},
+    "mp4": {"m4v", "mov", "m4a", "3gp"},
+    "mov": {"mp4", "m4v"},
+    "m4v": {"mp4"},
+    "3gp": {"mp4"},
+    "heic": {"heif"},
+    "jp2": {"jpf", "jpx"},
+    "j2k": {"j2c", "jpc"},
+    "cr3": {"raw"},
+    "mkv": {"webm", "mka"},
+    "webm": {"mkv"},
+    "ogg": {"opus", "oga", "ogv"},
+    "opus": {"ogg"},
+    "mobi": {"azw", "azw3"},
+    "zip": {"docx", "xlsx", "pptx", "odt", "ods", "odp", "epub", "jar"},
+    "ooxml": {"docx", "xlsx", "pptx", "zip"},
+    "ole": {"doc", "xls", "ppt", "msg"},
+    "asf": {"wma", "wmv"},
+}
+
+# Heuristic results for plain text; a text-based extension is trusted over them
+TEXT_SNIFFS = {"text", "json", "xml", "html", "svg"}
+TEXT_EXTENSIONS = {
+    "txt", "csv", "tsv", "json", "xml", "yaml", "yml", "md", "markdown", "html", "htm",
+    "sql", "ipynb", "svg", "dxf", "log"
+}
+
+# Binary formats recognized reliably enough that an unrecognized file claiming
+# to be one of them is rejected as corrupt or mislabelled
+SIGNED_FORMATS = {
+    "png", "jpg", "jpeg", "gif", "pdf", "rtf", "bmp", "tiff", "tif", "ico", "psd", "dwg",
+    "zip", "docx", "xlsx", "pptx", "odt", "ods", "odp", "epub", "rar", "7z", "gz", "gzip",
+    "bz2", "doc", "xls", "ppt", "wma", "wmv", "flac", "ogg", "opus", "wav", "mkv", "webm",
+    "flv", "mp4", "m4v", "m4a", "mov", "heic", "webp", "avi", "parquet", "avro", "mobi",
+    "jp2", "j2k"
+}
+
+# Never accepted, whatever the file is called
+BLOCKED_FORMATS = {"exe", "elf"}
+
+# ISO base media "ftyp" major brands
+FTYP_BRANDS = {
+    b"M4A ": "m4a", b"M4B ": "m4a", b"M4V ": "m4v", b"qt  ": "mov",
+    b"heic": "heic", b"heix": "heic", b"hevc": "heic", b"heim": "heic", b"heis": "heic",
+    b"mif1": "heic", b"msf1": "heic", b"avif": "avif", b"crx ": "cr3",
+    b"3gp4": "3gp", b"3gp5": "3gp", b"3gp6": "3gp", b"3g2a": "3gp",
+}
+
+# OpenDocument/EPUB containers start with an uncompressed "mimetype" entry
+ZIP_MIMETYPES = {
+    b"application/epub+zip": "epub",
+    b"application/vnd.oasis.opendocument.text": "odt",
+    b"application/vnd.oasis.opendocument.spreadsheet": "ods",
+    b"application/vnd.oasis.opendocument.presentation": "odp",
+}
+
+def _refine_zip(header: bytes) -> Optional[str]:
+    if header[30:38] == b"mimetype":
+        for mimetype, file_format in ZIP_MIMETYPES.items():
+            if header[38:38 + len(mimetype)] == mimetype:
+                return file_format
+    # OOXML parts are usually named in the first local file headers
+    if b"[Content_Types].xml" in header or b"_rels/.rels" in header:
+        for marker, file_format in ((b"word/", "docx"), (b"xl/", "xlsx"), (b"ppt/", "pptx")):
+            if marker in header:
+                return file_format
+        return "ooxml"
+    return "zip"
+
+def _refine_ftyp(header: bytes) -> Optional[str]:
+    return FTYP_BRANDS.get(header[8:12], "mp4")
+
+def _refine_matroska(header: bytes) -> Optional[str]:
+    return "webm" if b"\x42\x82\x84webm" in header[:64] else "mkv"
+
+def _refine_tiff(header: bytes) -> Optional[str]:
+    return "cr2" if header[8:10] == b"CR" else "tiff"
+
+def _refine_bmp(header: bytes) -> Optional[str]:
+    # "BM" alone is too weak; the DIB header that follows has a known size
+    if len(header) < 18:
+        return None
+    return "bmp" if struct.unpack("<I", header[14:18])[0] in (12, 40, 52, 56, 64, 108, 124) else None
+
+def _refine_exe(header: bytes) -> Optional[str]:
+    # Portable Executable: the DOS stub points at a "PE" signature
+    if len(header) < 64:
+        return None
+    pe_offset = struct.unpack("<I", header[60:64])[0]
+    return "exe" if header[pe_offset:pe_offset + 4] == b"PE\x00\x00" else None
+
+def _refine_ogg(header: bytes) -> Optional[str]:
+    return "opus" if b"OpusHead" in header[:128] else "ogg"
+
+def _refine_bz2(header: bytes) -> Optional[str]:
+    return "bz2" if header[3:4].isdigit() else None
+
+REFINERS: Dict[str, Callable[[bytes], Optional[str]]] = {
+    "zip": _refine_zip,
+    "mp4": _refine_ftyp,
+    "mkv": _refine_matroska,
+    "tiff": _refine_tiff,
+    "bmp": _refine_bmp,
+    "ogg": _refine_ogg,
+    "bz2": _refine_bz2,
+    "exe": _refine_exe,
+}
+
+def _sniff_audio_frames(header: bytes) -> Optional[str]:
+    """MPEG audio without an ID3 tag: an ADTS (AAC) or MP3 frame sync"""
+    if len(header) < 4 or header[0] != 0xFF:
+        return None
+    if header[1] & 0xF6 == 0xF0:
+        return "aac"
+    if header[1] & 0xE0 == 0xE0 and header[1] & 0x06 and header[2] & 0xF0 != 0xF0:
+        return "mp3"
+    return None
+
+def _sniff_text(header: bytes) -> Optional[str]:
+    """Classify plain text; None for binary content"""
+    if header.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "text"  # UTF-16
+    if b"\x00" in header:
+        return None
+    control = sum(1 for byte in header if byte < 0x20 and byte not in b"\t\n\r\f\x1b")
+    if control > len(header) // 100:
+        return None
+    
+    text = header.decode("utf-8", errors="replace").lstrip("\ufeff").lstrip()
+    start = text[:1024].lower()
+    if start.startswith("<"):
+        if "<svg" in start:
+            return "svg"
+        if start.startswith("<!doctype html") or "<html" in start:
+            return "html"
+        return "xml"
+    if start.startswith(("{", "[")):
+        return "json"
+    return "text"
+
+def sniff(header: bytes) -> Optional[str]:
+    """
+    Identify a file's real format from its first bytes.
+    
+    Returns a format name, a generic container ("zip", "ooxml", "ole",
+    "asf") when the head is not enough to say more, one of ``TEXT_SNIFFS``
+    for text, or None for empty or unrecognized binary content.
+    """
+    if not header:
+        return None
+    for offset, signature, file_format in MAGIC_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            refine = REFINERS.get(file_format)
+            refined = refine(header) if refine else file_format
+            if refined is not None:
+                return refined
+    return _sniff_audio_frames(header) or _sniff_text(header)
+
+def sniff_file(file_path: str) -> Optional[str]:
+    with open(file_path, "rb") as f:
+        return sniff(f.read(SNIFF_BYTES))
+
+def resolve_format(claimed: str, sniffed: Optional[str], record: bool = True) -> str:
+    """
+    Decide which format an upload is converted as.
+    
+    The extension is kept when the content agrees with it (or cannot
+    contradict it). Content that is clearly another supported format is
+    routed as that format, so a PNG named .jpg converts as a PNG.
+    Executables, empty files, binary junk and content of an unsupported
+    format are rejected with a 400 before any conversion work starts.
+    
+    Args:
+        claimed: Extension from the filename
+        sniffed: Result of ``sniff`` on the file's first bytes
+        record: Count the outcome in the upload_format_checks_total metric
+    """
+    claimed = claimed.lower().strip()
+    
+    def outcome(result: str) -> None:
+        if record:
+            UPLOAD_FORMAT_CHECKS.inc(result=result)
+    
+    def reject(detail: str):
+        outcome("rejected")
+        raise HTTPException(status_code=400, detail=detail)
+    
+    if sniffed in BLOCKED_FORMATS:
+        reject("Executable files are not accepted")
+    
+    if sniffed is None:
+        if claimed in SIGNED_FORMATS or claimed in TEXT_EXTENSIONS:
+            reject(f"File content is not valid {claimed} (empty or unrecognized data)")
+        # Nothing to check the extension against (raw camera files, headerless audio, ...)
+        if not FileValidator.is_format_supported(claimed):
+            reject(f"Unsupported source format: {claimed}")
+        outcome("unverified")
+        return claimed
+    
+    if sniffed == claimed or claimed in COMPATIBLE_EXTENSIONS.get(sniffed, ()) or (
+        sniffed in TEXT_SNIFFS and claimed in TEXT_EXTENSIONS
+    ):
+        if not FileValidator.is_format_supported(claimed):
+            reject(f"Unsupported source format: {claimed}")
+        outcome("matched")
+        return claimed
+    
+    if FileValidator.is_format_supported(sniffed):
+        outcome("corrected")
+        return sniffed
+    
+    reject(f"File content is {sniffed}, not {claimed or 'a supported format'}")
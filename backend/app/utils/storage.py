@@ -0,0 +1,212 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+from app.config import settings
+from app.utils.lazy_import import lazy_import
+
+boto3 = lazy_import("boto3")
+
+def shard(name: str) -> str:
+    """
+    Two-level directory for a file name ("ab/cd"), spreading files over 65536
+    directories. Only the part before the extension counts, so renaming a file
+    to another extension keeps it in place.
+    """
+    stem = os.path.splitext(name)[0]
+    digest = hashlib.sha1(stem.encode("utf-8")).hexdigest()
+    return os.path.join(digest[:2], digest[2:4])
+
+class LocalBackend:
+    """Files stay in the local upload and output directories (nothing to copy)"""
+    
+    remote = False
+    
+    def put(self, key: str, local_path: str) -> None:
+        pass
+    
+    def get(self, key: str, local_path: str) -> bool:
+        return False
+    
+    def delete(self, key: str) -> None:
+        pass
+
+class S3Backend:
+    """
+    Files are kept in an S3-compatible bucket (AWS, MinIO, Ceph, ...).
+    
+    Objects are named ``{prefix}uploads/ab/cd/name`` and ``{prefix}outputs/ab/cd/name``,
+    mirroring the local layout.
+    """
+    
+    remote = True
+    
+    def __init__(self):
+        if not settings.storage_s3_bucket:
+            raise ValueError("STORAGE_S3_BUCKET must be set for the s3 storage backend")
+        self.bucket = settings.storage_s3_bucket
+        self.prefix = settings.storage_s3_prefix
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.storage_s3_endpoint_url,
+            region_name=settings.storage_s3_region,
+            aws_access_key_id=settings.storage_s3_access_key,
+            aws_secret_access_key=settings.storage_s3_secret_key
+        )
+    
+    def put(self, key: str, local_path: str) -> None:
+        self.client.upload_file(local_path, self.bucket, self.prefix + key)
+    
+    def get(self, key: str, local_path: str) -> bool:
+        """Download an object to local_path. Returns False if it does not exist."""
+        from botocore.exceptions import ClientError
+        
+        # Download under a temporary name so readers never see a partial file
+        temp_path = f"{local_path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            self.client.download_file(self.bucket, self.prefix + key, temp_path)
+        except ClientError as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise
+        os.replace(temp_path, local_path)
+        return True
+    
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+BACKENDS = {
+    "local": LocalBackend,
+    "s3": S3Backend,
+}
+
+class Storage:
+    """
+    Where uploads and outputs live.
+    
+    Files sit in hash-sharded directories (``uploads/ab/cd/name``) so that
+    directories stay small with millions of files stored. Converters
+    always work on local paths: with a remote backend, finished files are
+    copied to it with ``persist`` and brought back on demand with ``fetch``,
+    so the local directories act as a read-through cache.
+    """
+    
+    _backend = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def get_backend(cls):
+        if cls._backend is None:
+            with cls._lock:
+                if cls._backend is None:
+                    backend = BACKENDS.get(settings.storage_backend)
+                    if backend is None:
+                        raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+                    cls._backend = backend()
+        return cls._backend
+    
+    @classmethod
+    def is_remote(cls) -> bool:
+        return cls.get_backend().remote
+    
+    @staticmethod
+    def _path(root: str, filename: str) -> str:
+        path = os.path.join(root, shard(filename), filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+    
+    @staticmethod
+    def upload_path(filename: str) -> str:
+        """Local path of an upload, by its unique file name"""
+        path = Storage._path(settings.upload_dir, filename)
+        legacy_path = os.path.join(settings.upload_dir, filename)
+        # Files stored before sharding stay where they are
+        if not os.path.exists(path) and os.path.exists(legacy_path):
+            return legacy_path
+        return path
+    
+    @staticmethod
+    def output_path(filename: str) -> str:
+        """Local path for a conversion output, by file name"""
+        path = Storage._path(settings.output_dir, filename)
+        legacy_path = os.path.join(settings.output_dir, filename)
+        if not os.path.exists(path) and os.path.exists(legacy_path):
+            return legacy_path
+        return path
+    
+    @staticmethod
+    def get_key(path: str) -> Optional[str]:
+        """Backend key of a local path ("uploads/ab/cd/name"), or None outside the storage directories"""
+        path = os.path.abspath(path)
+        for prefix, root in (("uploads", settings.upload_dir), ("outputs", settings.output_dir)):
+            relative = os.path.relpath(path, os.path.abspath(root))
+            # Outside the root (".."), or in a private directory such as outputs/.cache
+            if not relative.startswith("."):
+                return f"{prefix}/{relative.replace(os.sep, '/')}"
+        return None
+    
+    @classmethod
+    def persist_sync(cls, path: str) -> None:
+        """Copy a finished local file to the backend (blocking)"""
+        backend = cls.get_backend()
+        key = cls.get_key(path)
+        if backend.remote and key is not None and os.path.isfile(path):
+            backend.put(key, path)
+    
+    @classmethod
+    def fetch_sync(cls, path: str) -> str:
+        """Make sure a file is on local disk, downloading it from the backend if needed (blocking)"""
+        if os.path.exists(path):
+            # Recently used copies survive the local cache sweep
+            try:
+                now = time.time()
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+            return path
+        
+        backend = cls.get_backend()
+        key = cls.get_key(path)
+        if backend.remote and key is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            backend.get(key, path)
+        return path
+    
+    @classmethod
+    async def persist(cls, path: str) -> None:
+        from app.utils.executor import ConversionExecutor
+        
+        if cls.is_remote():
+            await ConversionExecutor.run_in_thread(cls.persist_sync, path)
+    
+    @classmethod
+    async def fetch(cls, path: str) -> str:
+        """Local path of a stored file, staged from the backend when it is not on disk"""
+        from app.utils.executor import ConversionExecutor
+        
+        if os.path.exists(path) and not cls.is_remote():
+            return path
+        return await ConversionExecutor.run_in_thread(cls.fetch_sync, path)
+    
+    @classmethod
+    async def fetch_upload(cls, filename: str) -> str:
+        """Local path of an upload, ready to be converted"""
+        return await cls.fetch(cls.upload_path(filename))
+    
+    @classmethod
+    def delete(cls, path: str) -> None:
+        """Delete a file locally and from the backend"""
+        from app.utils.file_handler import FileHandler
+        
+        FileHandler.delete_file(path)
+        backend = cls.get_backend()
+        key = cls.get_key(path)
+        if backend.remote and key is not None:
+            try:
+                backend.delete(key)
+            except Exception as e:
+                print(f"Error deleting {key} from storage: {e}")
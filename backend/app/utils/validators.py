@@ -9,7 +9,7 @@ SUPPORTED_FORMATS: Dict[str, Set[str]] = {
     },
     "image": {
         "jpg", "jpeg", "png", "webp", "tiff", "tif", "bmp", "heic", 
-        "svg", "ico", "raw", "cr2", "nef", "arw", "gif"
+        "svg", "ico", "raw", "cr2", "nef", "arw", "gif", "jp2", "j2k"
     },
     "audio": {
         "mp3", "wav", "aac", "ogg", "flac", "m4a", "opus", "wma"
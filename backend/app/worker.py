@@ -0,0 +1,47 @@
+"""
+Standalone background job worker.
+
+Runs job workers without the API, so conversions can scale out to more
+processes or machines. Every worker must share the API's database and its
+upload/output directories; point DATABASE_URL at PostgreSQL when workers run
+on more than one machine. Start the API with JOB_WORKERS_IN_API=false to
+leave all queued jobs to these workers.
+
+Usage:
+    python -m app.worker [--workers N] [--long-lane-workers N]
+"""
+import argparse
+import asyncio
+import signal
+from app.config import settings
+from app.utils.executor import ConversionExecutor
+from app.utils.job_queue import JobQueue, schedule_job_workers, stop_job_workers
+from app.utils.scratch import ScratchSpace
+
+async def run(workers: int, long_lane_workers: int) -> None:
+    """Run job workers until SIGINT or SIGTERM, then hand back unfinished jobs"""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    
+    ScratchSpace.sweep()
+    schedule_job_workers(workers, long_lane_workers)
+    print(f"[STARTED] {workers} job workers as {JobQueue.worker_prefix} on {settings.database_url.split('://')[0]}")
+    
+    await stopping.wait()
+    print("Stopping job workers")
+    await stop_job_workers()
+    ConversionExecutor.shutdown()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run background conversion job workers")
+    parser.add_argument("--workers", type=int, default=settings.job_workers,
+                        help="Concurrent jobs in this process (default: JOB_WORKERS)")
+    parser.add_argument("--long-lane-workers", type=int, default=settings.job_long_lane_workers,
+                        help="Workers that also take long-lane jobs (default: JOB_LONG_LANE_WORKERS)")
+    args = parser.parse_args()
+    asyncio.run(run(args.workers, args.long_lane_workers))
+
+if __name__ == "__main__":
+    main()
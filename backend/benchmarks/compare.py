@@ -0,0 +1,87 @@
+"""
+Compare two benchmark reports and flag regressions.
+
+Usage (from backend/):
+    python -m benchmarks.compare benchmarks/reports/base.json benchmarks/reports/latest.json
+
+Exits with status 1 when any case got slower (wall or CPU time) or used more
+memory by more than ``--threshold``, so it can gate CI.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+# Metrics compared between reports; higher is worse for all of them
+METRICS = ["wall_seconds", "cpu_seconds", "peak_rss_mb", "output_bytes"]
+
+# Cases faster than this are too noisy to flag on time alone
+MIN_SECONDS = 0.5
+
+def load_results(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    return {record["case"]: record for record in report["results"]}
+
+def compare(base: Dict[str, Dict[str, Any]], head: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[Dict[str, Any]]:
+    """Per-case, per-metric relative changes between two reports"""
+    rows = []
+    for case in sorted(set(base) | set(head)):
+        old, new = base.get(case), head.get(case)
+        if old is None or new is None:
+            rows.append({"case": case, "metric": "status", "change": "added" if old is None else "removed"})
+            continue
+        if old.get("status") != new.get("status"):
+            rows.append({
+                "case": case,
+                "metric": "status",
+                "change": f"{old.get('status')} -> {new.get('status')}",
+                "regression": new.get("status") != "ok"
+            })
+            continue
+        if new.get("status") != "ok":
+            continue
+        
+        for metric in METRICS:
+            before, after = old.get(metric), new.get(metric)
+            if not before or after is None:
+                continue
+            ratio = (after - before) / before
+            noisy = metric.endswith("_seconds") and max(before, after) < MIN_SECONDS
+            rows.append({
+                "case": case,
+                "metric": metric,
+                "before": before,
+                "after": after,
+                "change": ratio,
+                "regression": ratio > threshold and not noisy
+            })
+    return rows
+
+def format_change(row: Dict[str, Any]) -> str:
+    if isinstance(row["change"], str):
+        return row["change"]
+    return f"{row['before']:>12} -> {row['after']:<12} {row['change']:+8.1%}"
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("base", help="Report from the baseline commit")
+    parser.add_argument("head", help="Report from the commit under test")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    parser.add_argument("--all", action="store_true", help="Show unchanged metrics too")
+    args = parser.parse_args(argv)
+    
+    rows = compare(load_results(args.base), load_results(args.head), args.threshold)
+    regressions = [row for row in rows if row.get("regression")]
+    
+    for row in rows:
+        if args.all or row.get("regression") or isinstance(row["change"], str) or abs(row["change"]) > args.threshold:
+            marker = "REGRESSION" if row.get("regression") else ""
+            print(f"{row['case']:40} {row['metric']:14} {format_change(row)} {marker}")
+    
+    print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
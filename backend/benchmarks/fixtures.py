@@ -0,0 +1,176 @@
+"""
+Synthetic benchmark inputs.
+
+Every fixture is generated deterministically from its kind and size, and
+cached under ``benchmarks/.fixtures`` so repeat runs (and runs on other
+commits) convert byte-identical inputs.
+"""
+import csv
+import json
+import os
+import random
+import wave
+import zipfile
+from typing import Dict
+
+import numpy as np
+from PIL import Image
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".fixtures")
+
+# Size of each fixture kind per tier
+SIZES = {
+    "small": {"image": 256, "rows": 1_000, "pages": 1, "seconds": 2, "archive_mb": 1},
+    "medium": {"image": 2048, "rows": 100_000, "pages": 100, "seconds": 10, "archive_mb": 50},
+    "large": {"image": 12_000, "rows": 10_000_000, "pages": 1000, "seconds": 60, "archive_mb": 500},
+}
+
+def _image_array(size: int) -> np.ndarray:
+    """Gradient with a tiled noise texture: compresses like a photo, not like a flat fill"""
+    rng = np.random.default_rng(size)
+    ramp = np.linspace(0, 255, size, dtype=np.float32)
+    tile = rng.integers(0, 48, (256, 256, 3), dtype=np.uint8)
+    noise = np.tile(tile, (size // 256 + 1, size // 256 + 1, 1))[:size, :size]
+    pixels = np.empty((size, size, 3), dtype=np.uint8)
+    pixels[..., 0] = ramp[None, :]
+    pixels[..., 1] = ramp[:, None]
+    pixels[..., 2] = 128
+    np.add(pixels, noise, out=pixels, casting="unsafe")
+    return pixels
+
+def make_png(path: str, size: int) -> None:
+    Image.fromarray(_image_array(size)).save(path, "PNG", compress_level=1)
+
+def make_jpg(path: str, size: int) -> None:
+    Image.fromarray(_image_array(size)).save(path, "JPEG", quality=90)
+
+def _rows(count: int):
+    rng = random.Random(count)
+    words = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel"]
+    for i in range(count):
+        yield {
+            "id": i,
+            "name": f"{rng.choice(words)}-{rng.choice(words)}",
+            "quantity": rng.randint(0, 10_000),
+            "price": round(rng.uniform(0, 1000), 2),
+            "created": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        }
+
+def make_csv(path: str, rows: int) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["id", "name", "quantity", "price", "created"])
+        writer.writeheader()
+        writer.writerows(_rows(rows))
+
+def make_json(path: str, rows: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i, row in enumerate(_rows(rows)):
+            f.write(("," if i else "") + json.dumps(row) + "\n")
+        f.write("]\n")
+
+def make_txt(path: str, pages: int) -> None:
+    rng = random.Random(pages)
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(pages * 40):
+            f.write(" ".join(rng.choice(words) for _ in range(12)) + "\n")
+
+def make_pdf(path: str, pages: int) -> None:
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    
+    rng = random.Random(pages)
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+    c = canvas.Canvas(path, pagesize=letter)
+    _, height = letter
+    for page in range(pages):
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(72, height - 72, f"Page {page + 1}")
+        c.setFont("Helvetica", 10)
+        for line in range(40):
+            c.drawString(72, height - 100 - line * 14, " ".join(rng.choice(words) for _ in range(12)))
+        c.showPage()
+    c.save()
+
+def make_wav(path: str, seconds: int) -> None:
+    rate = 44_100
+    t = np.arange(seconds * rate) / rate
+    tone = 0.4 * np.sin(2 * np.pi * 440 * t) + 0.2 * np.sin(2 * np.pi * 660 * t)
+    samples = (tone * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.repeat(samples, 2).tobytes())
+
+def make_mp4(path: str, seconds: int) -> None:
+    import cv2
+    
+    fps = 24
+    width, height = (320, 240) if seconds <= 2 else (640, 480) if seconds <= 10 else (1280, 720)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    base = _image_array(max(width, height))[:height, :width]
+    try:
+        for frame in range(seconds * fps):
+            writer.write(np.roll(base, frame * 4, axis=1))
+    finally:
+        writer.release()
+
+def make_zip(path: str, megabytes: int) -> None:
+    rng = np.random.default_rng(megabytes)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(max(1, megabytes)):
+            # Half random, half repetitive: a realistic mix of compressible data
+            chunk = rng.integers(0, 256, 512 * 1024, dtype=np.uint8).tobytes() + b"benchmark " * 52_429
+            zf.writestr(f"data/file_{i:04d}.bin", chunk)
+
+# fixture kind -> (file extension, size key in SIZES, generator)
+GENERATORS: Dict[str, tuple] = {
+    "png": ("png", "image", make_png),
+    "jpg": ("jpg", "image", make_jpg),
+    "csv": ("csv", "rows", make_csv),
+    "json": ("json", "rows", make_json),
+    "txt": ("txt", "pages", make_txt),
+    "pdf": ("pdf", "pages", make_pdf),
+    "wav": ("wav", "seconds", make_wav),
+    "mp4": ("mp4", "seconds", make_mp4),
+    "zip": ("zip", "archive_mb", make_zip),
+}
+
+def get_fixture(kind: str, tier: str) -> str:
+    """Path to the fixture for a kind and size tier, generating it on first use"""
+    ext, size_key, generator = GENERATORS[kind]
+    size = SIZES[tier][size_key]
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    
+    path = os.path.join(FIXTURES_DIR, f"{kind}_{size_key}{size}.{ext}")
+    if not os.path.exists(path):
+        temp_path = f"{path}.partial.{ext}"
+        generator(temp_path, size)
+        os.replace(temp_path, path)
+    return path
+
+def describe_size(kind: str, tier: str) -> str:
+    _, size_key, _ = GENERATORS[kind]
+    size = SIZES[tier][size_key]
+    return {
+        "image": f"{size}x{size}px",
+        "rows": f"{size} rows",
+        "pages": f"{size} pages",
+        "seconds": f"{size}s",
+        "archive_mb": f"{size}MB",
+    }[size_key]
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Generate benchmark fixtures")
+    parser.add_argument("--tiers", default="small,medium", help="Comma-separated size tiers")
+    parser.add_argument("--kinds", default=",".join(GENERATORS), help="Comma-separated fixture kinds")
+    args = parser.parse_args()
+    
+    for tier in args.tiers.split(","):
+        for kind in args.kinds.split(","):
+            path = get_fixture(kind, tier)
+            print(f"{tier:7} {kind:5} {os.path.getsize(path) / (1024 * 1024):10.2f} MB  {path}")
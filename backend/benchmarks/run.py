@@ -0,0 +1,204 @@
+"""
+Converter benchmark harness.
+
+Runs each service converter directly (no HTTP, no pools, no result cache)
+on synthetic fixtures and writes a JSON report that can be diffed against
+a report from another commit with ``python -m benchmarks.compare``.
+
+Usage (from backend/):
+    python -m benchmarks.run --tiers small,medium --output benchmarks/reports/latest.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import describe_size, get_fixture
+
+# (category, fixture kind, target format)
+CASES = [
+    ("image", "png", "jpg"),
+    ("image", "png", "webp"),
+    ("image", "jpg", "png"),
+    ("image", "jpg", "pdf"),
+    ("code", "csv", "json"),
+    ("code", "json", "csv"),
+    ("code", "json", "yaml"),
+    ("code", "csv", "xml"),
+    ("database", "csv", "sql"),
+    ("document", "csv", "xlsx"),
+    ("document", "txt", "pdf"),
+    ("document", "pdf", "txt"),
+    ("document", "pdf", "docx"),
+    ("audio", "wav", "mp3"),
+    ("audio", "wav", "flac"),
+    ("video", "mp4", "avi"),
+    ("video", "mp4", "gif"),
+    ("archive", "zip", "tar"),
+    ("archive", "zip", "7z"),
+    ("ai", "png", "txt"),
+]
+
+def _max_rss_mb(who: int) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    maxrss = resource.getrusage(who).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+def _preload_dependencies(converter: type) -> float:
+    """Import a converter's lazily bound libraries up front. Returns seconds spent."""
+    from app.utils.lazy_import import LazyImporter, LazyModule
+    
+    module = sys.modules[converter.__module__]
+    names = [value._name for value in vars(module).values() if isinstance(value, LazyModule)]
+    return sum(LazyImporter.warmup(name for name in names if LazyImporter.is_available(name)).values())
+
+def _cpu_seconds(who: int) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+def _describe_error(error: Exception) -> str:
+    """First line of an exception message, prefixed with its type"""
+    lines = str(error).strip().splitlines()
+    return f"{type(error).__name__}: {lines[0] if lines else ''}"[:300]
+
+def _run_case(category: str, source_format: str, target_format: str, input_path: str, results) -> None:
+    """Child process body: convert once and report measurements through the queue"""
+    from app.services.registry import registry
+    
+    step = registry.direct(source_format, target_format)
+    if step is None or step.category != category:
+        results.put({"status": "skipped", "error": f"No {category} converter for {source_format} -> {target_format}"})
+        return
+    
+    # Import the converter's libraries before measuring, so the numbers are conversion cost only
+    import_seconds = _preload_dependencies(step.converter)
+    rss_before = _max_rss_mb(resource.RUSAGE_SELF)
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    output_path = os.path.join(work_dir, f"output.{target_format}")
+    
+    cpu_started = _cpu_seconds(resource.RUSAGE_SELF) + _cpu_seconds(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    try:
+        result_path = asyncio.run(step.converter.convert(
+            input_path=input_path,
+            output_path=output_path,
+            source_format=source_format,
+            target_format=target_format
+        ))
+        wall = time.perf_counter() - started
+        cpu = _cpu_seconds(resource.RUSAGE_SELF) + _cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_started
+        result_path = result_path if isinstance(result_path, str) else output_path
+        results.put({
+            "status": "ok",
+            "converter": step.converter.__name__,
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "peak_rss_mb": round(max(_max_rss_mb(resource.RUSAGE_SELF), _max_rss_mb(resource.RUSAGE_CHILDREN)), 1),
+            "baseline_rss_mb": round(rss_before, 1),
+            "import_seconds": round(import_seconds, 4),
+            "output_bytes": os.path.getsize(result_path) if os.path.isfile(result_path) else None,
+        })
+    except Exception as e:
+        results.put({
+            "status": "error",
+            "converter": step.converter.__name__,
+            "wall_seconds": round(time.perf_counter() - started, 4),
+            "error": _describe_error(e),
+        })
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def run_case(category: str, kind: str, target_format: str, tier: str, timeout: float) -> Dict[str, Any]:
+    """Run one case in a fresh process so peak RSS and imports are not shared between cases"""
+    input_path = get_fixture(kind, tier)
+    record = {
+        "case": f"{category}:{kind}->{target_format}:{tier}",
+        "category": category,
+        "source_format": kind,
+        "target_format": target_format,
+        "tier": tier,
+        "input_size": describe_size(kind, tier),
+        "input_bytes": os.path.getsize(input_path),
+    }
+    
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_case, args=(category, kind, target_format, input_path, results))
+    process.start()
+    process.join(timeout)
+    
+    if process.is_alive():
+        process.kill()
+        process.join()
+        record.update(status="timeout", error=f"Exceeded {timeout:.0f}s")
+    elif not results.empty():
+        record.update(results.get())
+    else:
+        record.update(status="crashed", error=f"Exit code {process.exitcode}")
+    return record
+
+def get_meta() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    
+    return {
+        "commit": commit,
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark service converters on synthetic inputs")
+    parser.add_argument("--tiers", default="small,medium", help="Comma-separated size tiers (small, medium, large)")
+    parser.add_argument("--categories", default="", help="Only run these categories (comma-separated)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the fastest is reported")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds before a case is killed")
+    parser.add_argument("--output", default="benchmarks/reports/latest.json", help="Where to write the JSON report")
+    args = parser.parse_args(argv)
+    
+    categories = set(filter(None, args.categories.split(",")))
+    results = []
+    
+    for tier in args.tiers.split(","):
+        for category, kind, target_format in CASES:
+            if categories and category not in categories:
+                continue
+            
+            runs = [run_case(category, kind, target_format, tier, args.timeout) for _ in range(max(1, args.repeat))]
+            ok_runs = [run for run in runs if run["status"] == "ok"]
+            record = min(ok_runs, key=lambda run: run["wall_seconds"]) if ok_runs else runs[-1]
+            results.append(record)
+            
+            if record["status"] == "ok":
+                print(f"{record['case']:40} {record['wall_seconds']:9.3f}s wall {record['cpu_seconds']:9.3f}s cpu "
+                      f"{record['peak_rss_mb']:8.1f} MB rss")
+            else:
+                print(f"{record['case']:40} {record['status']}: {record.get('error', '')}")
+    
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"meta": get_meta(), "results": results}, f, indent=2, sort_keys=True)
+    print(f"Report written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
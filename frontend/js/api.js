@@ -30,6 +30,77 @@ class FileConversionAPI {
         }
     }
 
+    /**
+     * Upload a large file in resumable chunks (tus protocol)
+     *
+     * Each chunk is sent with a SHA-256 checksum; after a failed chunk the
+     * upload resumes from the offset the server reports. Resolves to the
+     * same conversion record as uploadFile.
+     */
+    static async uploadFileResumable(file, targetFormat = null, { chunkSize = 5 * 1024 * 1024, onProgress = null, maxRetries = 5 } = {}) {
+        const tus = { 'Tus-Resumable': '1.0.0' };
+        const encode = (value) => btoa(unescape(encodeURIComponent(value)));
+        const metadata = [`filename ${encode(file.name)}`];
+        if (targetFormat) {
+            metadata.push(`target_format ${encode(targetFormat)}`);
+        }
+
+        const created = await fetch(`${API_BASE_URL}/uploads`, {
+            method: 'POST',
+            headers: { ...tus, 'Upload-Length': String(file.size), 'Upload-Metadata': metadata.join(',') }
+        });
+        if (!created.ok) {
+            const error = await created.json();
+            throw new Error(error.detail || 'Upload failed');
+        }
+        const uploadUrl = new URL(created.headers.get('Location'), API_BASE_URL).href;
+
+        let offset = 0;
+        let conversionId = created.headers.get('Upload-Conversion-Id');
+        let failures = 0;
+
+        while (conversionId === null) {
+            const chunk = await file.slice(offset, offset + chunkSize).arrayBuffer();
+            const digest = await crypto.subtle.digest('SHA-256', chunk);
+            const checksum = btoa(String.fromCharCode(...new Uint8Array(digest)));
+
+            try {
+                const response = await fetch(uploadUrl, {
+                    method: 'PATCH',
+                    headers: {
+                        ...tus,
+                        'Content-Type': 'application/offset+octet-stream',
+                        'Upload-Offset': String(offset),
+                        'Upload-Checksum': `sha256 ${checksum}`
+                    },
+                    body: chunk
+                });
+                if (!response.ok) {
+                    throw new Error(`Chunk rejected (${response.status})`);
+                }
+                offset = Number(response.headers.get('Upload-Offset'));
+                conversionId = response.headers.get('Upload-Conversion-Id');
+                failures = 0;
+            } catch (error) {
+                if (++failures > maxRetries) {
+                    console.error('Upload error:', error);
+                    throw error;
+                }
+                // Ask the server how far it got, then resume from there
+                await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                const status = await fetch(uploadUrl, { method: 'HEAD', headers: tus });
+                offset = Number(status.headers.get('Upload-Offset'));
+                conversionId = status.headers.get('Upload-Conversion-Id');
+            }
+
+            if (onProgress) {
+                onProgress(Math.round(offset * 100 / Math.max(1, file.size)));
+            }
+        }
+
+        return await this.getConversionStatus(conversionId);
+    }
+
     /**
      * Get conversion status
      */
@@ -113,6 +184,40 @@ class FileConversionAPI {
         }
     }
 
+    /**
+     * Subscribe to live progress for one or more conversions (Server-Sent Events).
+     * Calls onUpdate({id, status, progress, message, download_url}) for every update
+     * and returns a function that closes the stream. Returns null when the browser
+     * has no EventSource support, so callers can fall back to polling.
+     */
+    static watchProgress(conversionIds, onUpdate, onError = null) {
+        if (typeof EventSource === 'undefined') {
+            return null;
+        }
+
+        const params = new URLSearchParams();
+        [].concat(conversionIds).forEach(id => params.append('conversion_ids', id));
+        const source = new EventSource(`${API_BASE_URL}/progress?${params}`);
+
+        const handle = (event) => onUpdate(JSON.parse(event.data));
+        ['uploaded', 'queued', 'processing', 'completed', 'failed', 'not_found'].forEach(name => {
+            source.addEventListener(name, handle);
+        });
+
+        // The server ends the stream once every conversion has finished;
+        // close instead of letting EventSource reconnect
+        source.onerror = (event) => {
+            if (source.readyState !== EventSource.CLOSED) {
+                source.close();
+            }
+            if (onError) {
+                onError(event);
+            }
+        };
+
+        return () => source.close();
+    }
+
     /**
      * Download converted file
      */
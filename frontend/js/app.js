@@ -235,17 +235,29 @@ async function startConversion() {
     console.log(`Converting ${currentUploadData.source_format} to ${targetFormat}`);
 
     try {
-        // Show progress
-        const progressInterval = UIManager.simulateProgress(3000);
+        // Show live progress reported by the converter; simulate it if the browser can't stream
+        UIManager.showProgress(0);
+        const stopWatching = FileConversionAPI.watchProgress(currentUploadData.id, (update) => {
+            if (update.progress !== null && update.progress !== undefined) {
+                UIManager.showProgress(update.progress);
+            }
+        });
+        const progressInterval = stopWatching ? null : UIManager.simulateProgress(3000);
         
-        // Call conversion API (placeholder for now)
-        const result = await FileConversionAPI.convertFile(
-            currentUploadData.id,
-            currentUploadData.source_format,
-            targetFormat
-        );
+        let result;
+        try {
+            result = await FileConversionAPI.convertFile(
+                currentUploadData.id,
+                currentUploadData.source_format,
+                targetFormat
+            );
+        } finally {
+            if (stopWatching) {
+                stopWatching();
+            }
+            clearInterval(progressInterval);
+        }
         
-        clearInterval(progressInterval);
         UIManager.showProgress(100);
         
         // Wait a moment then show success
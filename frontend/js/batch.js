@@ -270,14 +270,66 @@ async function startBatchConversion() {
         // Start conversion
         await BatchAPI.convertBatch(batchState.conversionIds, targetFormat);
         
-        // Poll for status
-        await pollBatchStatus();
+        // Follow progress over a single event stream, polling if the browser can't stream
+        watchBatchStatus();
         
     } catch (error) {
         UI.showError('Batch conversion failed: ' + error.message);
     }
 }
 
+/**
+ * Update one file's badge in the batch list
+ */
+function updateBatchItem(result) {
+    const item = document.querySelector(`.batch-file-item[data-index="${result.id}"]`);
+    if (!item) return;
+    
+    const badge = item.querySelector('.status-badge');
+    if (result.status === 'completed') {
+        badge.textContent = 'Completed';
+        badge.className = 'status-badge success';
+    } else if (result.status === 'failed') {
+        badge.textContent = 'Failed';
+        badge.className = 'status-badge error';
+    } else if (result.status === 'processing') {
+        badge.textContent = result.progress ? `Processing... ${result.progress}%` : 'Processing...';
+        badge.className = 'status-badge processing';
+    }
+}
+
+/**
+ * Follow batch progress over Server-Sent Events
+ */
+function watchBatchStatus() {
+    const finished = new Set();
+    const total = batchState.conversionIds.length;
+    
+    const stopWatching = FileConversionAPI.watchProgress(batchState.conversionIds, (update) => {
+        updateBatchItem(update);
+        if (['completed', 'failed', 'not_found'].includes(update.status)) {
+            finished.add(update.id);
+        }
+        
+        document.getElementById('batchProgressFill').style.width = `${(finished.size / total) * 100}%`;
+        document.getElementById('batchProgressText').textContent = `${finished.size} / ${total} complete`;
+        
+        if (finished.size === total) {
+            stopWatching();
+            showBatchComplete();
+        }
+    }, () => {
+        // Stream dropped before everything finished: fall back to polling
+        if (finished.size < total) {
+            pollBatchStatus();
+        }
+    });
+    
+    if (!stopWatching) {
+        pollBatchStatus();
+    }
+}
+
 /**
  * Poll batch conversion status
  */
@@ -293,22 +345,7 @@ async function pollBatchStatus() {
                 `${status.completed} / ${status.total} complete`;
             
             // Update individual file statuses
-            status.results.forEach(result => {
-                const item = document.querySelector(`.batch-file-item[data-index="${result.id}"]`);
-                if (item) {
-                    const badge = item.querySelector('.status-badge');
-                    if (result.status === 'completed') {
-                        badge.textContent = 'Completed';
-                        badge.className = 'status-badge success';
-                    } else if (result.status === 'failed') {
-                        badge.textContent = 'Failed';
-                        badge.className = 'status-badge error';
-                    } else if (result.status === 'processing') {
-                        badge.textContent = 'Processing...';
-                        badge.className = 'status-badge processing';
-                    }
-                }
-            });
+            status.results.forEach(updateBatchItem);
             
             // Check if all complete
             if (status.all_complete) {
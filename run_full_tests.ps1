@@ -12,7 +12,7 @@ $results = @{
 }
 
 function Test-Conversion {
-    param($Name, $File, $Category, $Target)
+    param($Name, $File, $Category, $Target, $MaxDimension = $null)
     
     # Upload
     $upload = curl -s -X POST http://localhost:8000/api/upload -F "file=@$File" 2>&1 | Out-String
@@ -24,8 +24,12 @@ function Test-Conversion {
             $convert = curl -s -X POST "http://localhost:8000/api/$Category/convert/${id}?target_format=$Target" `
                 -H "Content-Type: application/json" -d '{}' 2>&1 | Out-String
         } else {
+            $form = @("-F", "target_format=$Target")
+            if ($MaxDimension) {
+                $form += @("-F", "max_dimension=$MaxDimension")
+            }
             $convert = curl -s -X POST "http://localhost:8000/api/$Category/convert/${id}" `
-                -F "target_format=$Target" 2>&1 | Out-String
+                @form 2>&1 | Out-String
         }
         
         if ($convert -match '"status":"completed"' -or $convert -match '"download_url"' -or $convert -match '"result"') {
@@ -103,6 +107,10 @@ Test-Conversion "PNG → BMP" "test_files/test.png" "images" "bmp"
 Test-Conversion "PNG → TIFF" "test_files/test.png" "images" "tiff"
 Test-Conversion "PNG → ICO" "test_files/test.png" "images" "ico"
 Test-Conversion "PNG → PDF" "test_files/test.png" "images" "pdf"
+# 16-bit greyscale, scaled down while decoding
+Test-Conversion "16-bit TIFF → PNG (max 32px)" "test_files/test_16bit.tiff" "images" "png" 32
+Test-Conversion "16-bit TIFF → JPG (max 32px)" "test_files/test_16bit.tiff" "images" "jpg" 32
+Test-Conversion "16-bit TIFF → PDF (max 32px)" "test_files/test_16bit.tiff" "images" "pdf" 32
 
 # ===== 5. ARCHIVES =====
 Write-Host "`n📦 ARCHIVES (8+ conversions)" -ForegroundColor Yellow
@@ -126,6 +134,119 @@ Write-Host "`n🤖 AI-POWERED (5+ conversions)" -ForegroundColor Yellow
 Test-Conversion "Image OCR" "test_files/test.png" "ai" "ocr"
 Test-Conversion "Text Analysis" "test_document.txt" "ai" "analyze"
 
+# ===== 9. PLATFORM =====
+# Service behaviour rather than formats. Run against a single backend worker:
+# cache and admission counters are per process. The rate limit case runs last
+# because it spends this client's whole allowance.
+Write-Host "`n🧰 PLATFORM (jobs, cache, uploads, limits)" -ForegroundColor Yellow
+$api = "http://localhost:8000"
+
+function Add-Result {
+    param($Name, $Ok, $Detail = "")
+    if ($Ok) {
+        Write-Host "✅ $Name" -ForegroundColor Green
+        $script:results.Pass += $Name
+    } else {
+        Write-Host "❌ $Name" -ForegroundColor Red
+        if ($Detail) {
+            Write-Host "   Error: $($Detail.Substring(0, [Math]::Min(120, $Detail.Length)))" -ForegroundColor DarkRed
+        }
+        $script:results.Fail += $Name
+    }
+}
+
+# Batch conversions run as background jobs; poll until every one has finished
+$batch = curl -s -X POST "$api/api/batch/upload" -F "files=@test_files/test.json" -F "files=@test_files/test.xml" 2>&1 | Out-String
+$ids = @([regex]::Matches($batch, '"id":(\d+)') | ForEach-Object { $_.Groups[1].Value })
+if ($ids.Count -eq 2) {
+    $queued = curl -s -X POST "$api/api/batch/convert?target_format=yaml" `
+        -H "Content-Type: application/json" -d "[$($ids -join ',')]" 2>&1 | Out-String
+    $query = ($ids | ForEach-Object { "conversion_ids=$_" }) -join "&"
+    $status = ""
+    for ($i = 0; $i -lt 30; $i++) {
+        Start-Sleep -Seconds 1
+        $status = curl -s "$api/api/batch/status?$query" 2>&1 | Out-String
+        if ($status -match '"completed":2') { break }
+    }
+    Add-Result "Batch job execution" ($queued -match '"queued":2' -and $status -match '"completed":2') "$queued $status"
+} else {
+    Add-Result "Batch job execution" $false $batch
+}
+
+# The same input converted twice is served from the result cache the second time
+$before = (curl -s "$api/api/cache/stats" | ConvertFrom-Json).hits
+foreach ($n in 1..2) {
+    $upload = curl -s -X POST "$api/api/upload" -F "file=@test_files/test.json" 2>&1 | Out-String
+    if ($upload -match '"id":(\d+)') {
+        curl -s -X POST "$api/api/code/convert/$($matches[1])" -F "target_format=xml" | Out-Null
+    }
+}
+$after = (curl -s "$api/api/cache/stats" | ConvertFrom-Json).hits
+Add-Result "Result cache hit on repeat conversion" ($after -gt $before) "hits $before -> $after"
+
+# tus: create, send the whole file in one PATCH, then HEAD for the offset
+$tusFile = "test_files/test.json"
+$length = (Get-Item $tusFile).Length
+$metadata = "filename " + [Convert]::ToBase64String([Text.Encoding]::UTF8.GetBytes("test.json"))
+$created = curl -s -i -X POST "$api/api/uploads" -H "Tus-Resumable: 1.0.0" `
+    -H "Upload-Length: $length" -H "Upload-Metadata: $metadata" 2>&1 | Out-String
+if ($created -match '(?m)^Location:\s*(\S+)') {
+    $location = $matches[1]
+    $patched = curl -s -i -X PATCH "$api$location" -H "Tus-Resumable: 1.0.0" -H "Upload-Offset: 0" `
+        -H "Content-Type: application/offset+octet-stream" --data-binary "@$tusFile" 2>&1 | Out-String
+    $head = curl -s -I "$api$location" -H "Tus-Resumable: 1.0.0" 2>&1 | Out-String
+    $ok = $patched -match '^HTTP/\S+ 204' -and $patched -match '(?m)^Upload-Conversion-Id:\s*\d+' `
+        -and $head -match "(?m)^Upload-Offset:\s*$length\s*$"
+    Add-Result "tus upload round trip" $ok "$patched $head"
+} else {
+    Add-Result "tus upload round trip" $false $created
+}
+
+# Text saved as .png is refused by content sniffing
+$junk = Join-Path ([IO.Path]::GetTempPath()) "smoke_junk.png"
+Set-Content -Path $junk -Value ("this is plain text, not an image`n" * 20) -NoNewline
+$rejected = curl -s -w "`n%{http_code}" -X POST "$api/api/upload" -F "file=@$junk" 2>&1 | Out-String
+Remove-Item $junk -ErrorAction SilentlyContinue
+Add-Result "Mislabelled upload rejected" ($rejected -match '(?m)^400\s*$' -and $rejected -match 'not png') $rejected
+
+# Admission: more identical conversions at once than the code category runs plus
+# queues. A fresh 2 MB JSON -> XML takes a few seconds, and every request holds
+# its slot while the first one converts, so the overflow gets 503 + Retry-After.
+$bigJson = Join-Path ([IO.Path]::GetTempPath()) "smoke_admission.json"
+$nonce = [guid]::NewGuid().ToString()
+$records = 1..40000 | ForEach-Object { "{`"id`":$_,`"name`":`"item$_`",`"nonce`":`"$nonce`"}" }
+Set-Content -Path $bigJson -Value ("[" + ($records -join ",") + "]") -NoNewline
+$upload = curl -s -X POST "$api/api/upload" -F "file=@$bigJson" 2>&1 | Out-String
+Remove-Item $bigJson -ErrorAction SilentlyContinue
+$stats = curl -s "$api/api/admission/stats" | ConvertFrom-Json
+$limit = if ($stats.categories.code) { $stats.categories.code.limit } else { 4 }
+$burst = $limit + $stats.max_queue + 4
+if ($upload -match '"id":(\d+)') {
+    $url = "$api/api/code/convert/$($matches[1])"
+    $responses = 1..$burst | ForEach-Object -Parallel {
+        curl -s -i -X POST $using:url -F "target_format=xml" 2>&1 | Out-String
+    } -ThrottleLimit $burst
+    $busy = @($responses | Where-Object { $_ -match '^HTTP/\S+ 503' -and $_ -match '(?m)^Retry-After:\s*\d+' })
+    Add-Result "Admission 503 with Retry-After ($($busy.Count) of $burst turned away)" ($busy.Count -gt 0) `
+        "no 503 among $burst concurrent conversions"
+} else {
+    Add-Result "Admission 503 with Retry-After" $false $upload
+}
+
+# Rate limit: spend the remaining allowance, then expect 429 + Retry-After
+$first = curl -s -i "$api/api/formats" 2>&1 | Out-String
+$remaining = if ($first -match '(?m)^X-RateLimit-Remaining:\s*(\d+)') { [int]$matches[1] } else { 0 }
+$limited = ""
+for ($i = 0; $i -le $remaining + 5; $i++) {
+    $response = curl -s -i "$api/api/formats" 2>&1 | Out-String
+    if ($response -match '^HTTP/\S+ 429') {
+        $limited = $response
+        break
+    }
+}
+Add-Result "Rate limit 429 with Retry-After" ($limited -match '(?m)^Retry-After:\s*\d+') `
+    "no 429 after $($remaining + 6) requests"
+
 # ===== RESULTS =====
 $total = $results.Pass.Count + $results.Fail.Count + $results.NotImpl.Count
 $passRate = if ($total -gt 0) { [math]::Round(($results.Pass.Count / $total) * 100, 1) } else { 0 }